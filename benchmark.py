@@ -0,0 +1,362 @@
+import os
+
+# без окна: SDL рисует только в память
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')  # stdout - только JSON
+
+import argparse
+import json
+import math
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pygame
+
+from drawapp import BACKGROUND_COLOR, SCREEN_HEIGHT, SCREEN_WIDTH, DrawingApp
+from imagesaver import IMAGE_SAVED
+from shapestore import TYPE_CODES
+
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+SHAPE_SPACING = 40  # мировых единиц на фигуру по стороне сцены: плотность не зависит от размера
+SELECTED_FRACTION = 0.1  # доля выбранных фигур для преобразований
+REPEAT = 50  # замеров на случай (не больше)
+MIN_REPEAT = 3
+MAX_TIME = 2.0  # секунд на случай (не больше, но не меньше MIN_REPEAT замеров)
+THRESHOLD = 1.25  # регрессия - медиана выросла больше чем во столько раз
+SEED = 1
+
+
+def synthetic_scene(count, seed=SEED):
+    """колонки случайной сцены из count прямоугольников и треугольников
+    (аргументы ShapeStore.load_arrays); одинаковы при одинаковом seed"""
+    rng = np.random.default_rng(seed)
+    side = max(SCREEN_WIDTH, math.sqrt(count) * SHAPE_SPACING)
+    rect = rng.random(count) < 0.5
+    x, y = rng.uniform(0, side, (2, count))
+    w, h = rng.uniform(4, 40, (2, count))
+    counts = np.where(rect, 4, 3)
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    vertices = np.empty((int(offsets[-1]), 2), dtype=np.float64)
+    corners = {
+        True: ((0, 0), (1, 0), (1, 1), (0, 1)),
+        False: ((0, 1), (1, 1), (0.5, 0)),  # основание снизу, вершина сверху
+    }
+    for kind, points in corners.items():
+        mask = rect == kind
+        first = offsets[:-1][mask]
+        for k, (fx, fy) in enumerate(points):
+            vertices[first + k, 0] = x[mask] + fx * w[mask]
+            vertices[first + k, 1] = y[mask] + fy * h[mask]
+    types = np.where(rect, TYPE_CODES['rectangle'], TYPE_CODES['triangle'])
+    colors = rng.integers(0, 256, (count, 3))
+    thickness = rng.integers(1, 5, count)
+    return vertices, offsets, types, colors, thickness, np.zeros(count, dtype=bool)
+
+
+class BenchmarkApp(DrawingApp):
+    """DrawingApp без автосохранения; изображения пишутся во временную папку"""
+
+    def __init__(self, saves_dir):
+        super().__init__(loop_mode='event', autosave_interval=0)
+        self._saves_dir = saves_dir
+
+    def saves_directory(self):
+        return self._saves_dir
+
+    def load_synthetic(self, count, seed=SEED):
+        self.selected_shape_indices.clear()
+        self.shapes.load_arrays(*synthetic_scene(count, seed))
+        self.spatial_index.rebuild(self.shapes.bounds())
+        self.history.clear()
+        self.reset_view()
+
+    def select_fraction(self, fraction=SELECTED_FRACTION):
+        self.selected_shape_indices.replace(range(0, len(self.shapes), max(1, round(1 / fraction))))
+
+    def fit_view(self):
+        """вид на всю сцену (мелкие фигуры рисуются через LOD)"""
+        x0, y0 = self.shapes.bounds()[:, 0:2].min(axis=0)
+        x1, y1 = self.shapes.bounds()[:, 2:4].max(axis=0)
+        zoom = min(SCREEN_WIDTH / (x1 - x0), SCREEN_HEIGHT / (y1 - y0))
+        self.set_view(self.multiply_matrices(self.translation_matrix(-x0 * zoom, -y0 * zoom),
+                                             self.scale_matrix(zoom)))
+
+
+def measure(step, repeat=REPEAT, max_time=MAX_TIME, setup=None):
+    """замер step(i) до repeat раз (не дольше max_time, но не меньше MIN_REPEAT);
+    setup(i), если задан, выполняется перед каждым замером и не учитывается"""
+    times = []
+    deadline = time.perf_counter() + max_time
+    for i in range(repeat):
+        if setup is not None:
+            setup(i)
+        start = time.perf_counter()
+        step(i)
+        times.append(time.perf_counter() - start)
+        if len(times) >= MIN_REPEAT and time.perf_counter() > deadline:
+            break
+    ms = np.array(times) * 1000
+    return {
+        'n': len(ms),
+        'mean_ms': float(ms.mean()),
+        'median_ms': float(np.median(ms)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'min_ms': float(ms.min()),
+        'max_ms': float(ms.max()),
+    }
+
+
+def screen_points(rng, count):
+    return rng.uniform((0, 60), (SCREEN_WIDTH, SCREEN_HEIGHT), (count, 2)).tolist()
+
+
+# --- случаи: case(app, rng, repeat, max_time) -> статистика ---
+
+def bench_find_shape_at_point(app, rng, repeat, max_time):
+    points = [app.screen_to_world(p) for p in screen_points(rng, repeat)]
+    return measure(lambda i: app.find_shape_at_point(points[i]), repeat, max_time)
+
+
+def bench_find_shapes_in_rect(app, rng, repeat, max_time):
+    corners = [app.screen_to_world(p) for p in screen_points(rng, repeat)]
+    return measure(lambda i: app.find_shapes_in_rect((*corners[i], 300, 200)), repeat, max_time)
+
+
+def _bench_wheel(app, repeat, max_time, scaling):
+    # то же, что обработчик MOUSEWHEEL (клавиша Shift в dummy-драйвере не нажимается)
+    app.select_fraction()
+    app.fixed_center = app.calculate_center()
+    app.gesture = app.history.new_gesture()
+    y = 1 if not scaling else 0.1
+    stats = measure(lambda i: app.apply_matrix_to_selection(app.wheel_matrix(y, scaling)),
+                    repeat, max_time)
+    app.fixed_center = None
+    app.gesture = None
+    return stats
+
+
+def bench_wheel_rotate(app, rng, repeat, max_time):
+    return _bench_wheel(app, repeat, max_time, scaling=False)
+
+
+def bench_wheel_scale(app, rng, repeat, max_time):
+    return _bench_wheel(app, repeat, max_time, scaling=True)
+
+
+def bench_drag_translate(app, rng, repeat, max_time):
+    """шаг перетаскивания выбранных фигур через handle_events"""
+    app.select_fraction()
+    app.dragging_selected = True
+    app.gesture = app.history.new_gesture()
+    app.last_mouse_pos = (500, 300)
+    positions = [(500 + (i % 2) * 7, 300 + (i % 2) * 5) for i in range(repeat)]
+    stats = measure(lambda i: app.handle_events([pygame.event.Event(
+        pygame.MOUSEMOTION, pos=positions[i], rel=(0, 0), buttons=(1, 0, 0))]), repeat, max_time)
+    app.handle_events([pygame.event.Event(pygame.MOUSEBUTTONUP, button=1, pos=app.last_mouse_pos)])
+    return stats
+
+
+def bench_drag_release(app, rng, repeat, max_time):
+    """конец жеста: перенос накопленного преобразования в вершины"""
+    app.select_fraction()
+
+    def setup(i):
+        app.apply_matrix_to_selection(app.translation_matrix(3, 2))
+
+    return measure(lambda i: app.handle_events([pygame.event.Event(
+        pygame.MOUSEBUTTONUP, button=1, pos=(500, 300))]), repeat, max_time, setup)
+
+
+def bench_calculate_center(app, rng, repeat, max_time):
+    app.select_fraction()
+    return measure(lambda i: app.calculate_center(), repeat, max_time)
+
+
+def bench_draw_shapes(app, rng, repeat, max_time):
+    app.selected_shape_indices.clear()
+
+    def step(i):
+        app.screen.fill(BACKGROUND_COLOR)
+        app.draw_shapes()
+
+    return measure(step, repeat, max_time)
+
+
+def bench_draw_shapes_fit(app, rng, repeat, max_time):
+    app.selected_shape_indices.clear()
+    app.fit_view()
+    stats = bench_draw_shapes(app, rng, repeat, max_time)
+    app.reset_view()
+    return stats
+
+
+def bench_draw_ui(app, rng, repeat, max_time):
+    return measure(lambda i: app.draw_ui(), repeat, max_time)
+
+
+def _wait_saved(app):
+    # события разбираются напрямую: уведомления приложения в замерах не нужны
+    while app.image_saver.pending:
+        for event in pygame.event.get(IMAGE_SAVED):
+            if event.error:
+                raise RuntimeError(f"ошибка при сохранении: {event.error}")
+            app.image_saver.finished(event)
+        time.sleep(0.001)
+
+
+def bench_save_image(app, rng, repeat, max_time):
+    """задержка кадра при сохранении (кодирование и запись - в фоне)"""
+    app.screen.fill(BACKGROUND_COLOR)
+    app.draw_shapes()
+    return measure(lambda i: app.save_image(), repeat, max_time, setup=lambda i: _wait_saved(app))
+
+
+def bench_save_image_complete(app, rng, repeat, max_time):
+    """полное время сохранения, включая фоновую запись PNG"""
+    app.screen.fill(BACKGROUND_COLOR)
+    app.draw_shapes()
+
+    def step(i):
+        app.save_image()
+        _wait_saved(app)
+
+    return measure(step, repeat, max_time)
+
+
+CASES = {
+    'find_shape_at_point': bench_find_shape_at_point,
+    'find_shapes_in_rect': bench_find_shapes_in_rect,
+    'wheel_rotate': bench_wheel_rotate,
+    'wheel_scale': bench_wheel_scale,
+    'drag_translate': bench_drag_translate,
+    'drag_release': bench_drag_release,
+    'calculate_center': bench_calculate_center,
+    'draw_shapes': bench_draw_shapes,
+    'draw_shapes_fit': bench_draw_shapes_fit,
+    'draw_ui': bench_draw_ui,
+    'save_image': bench_save_image,
+    'save_image_complete': bench_save_image_complete,
+}
+
+
+def environment():
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pygame': pygame.version.ver,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_benchmarks(sizes=SIZES, cases=None, repeat=REPEAT, max_time=MAX_TIME, seed=SEED, log=None):
+    """прогон случаев для каждого размера сцены; результат - словарь для JSON"""
+    cases = list(cases or CASES)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='drawapp-bench-') as saves_dir:
+        app = BenchmarkApp(saves_dir)
+        try:
+            for size in sizes:
+                start = time.perf_counter()
+                app.load_synthetic(size, seed)
+                if log:
+                    log(f"{size} фигур: сцена за {time.perf_counter() - start:.2f} с")
+                results[str(size)] = {}
+                for name in cases:
+                    # у каждого случая свой генератор - случаи не влияют друг на друга
+                    rng = np.random.default_rng([seed, size, list(CASES).index(name)])
+                    stats = CASES[name](app, rng, repeat, max_time)
+                    results[str(size)][name] = stats
+                    if log:
+                        log(f"  {name:<22} медиана {stats['median_ms']:9.3f} мс  "
+                            f"p95 {stats['p95_ms']:9.3f} мс  n={stats['n']}")
+        finally:
+            _wait_saved(app)
+            app.image_saver.shutdown()
+    return {
+        'environment': environment(),
+        'config': {'sizes': list(sizes), 'cases': cases, 'repeat': repeat,
+                   'max_time': max_time, 'seed': seed},
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=THRESHOLD):
+    """сравнение медиан с эталоном: строки (размер, случай, эталон, сейчас, отношение, статус)"""
+    rows = []
+    for size, cases in current['results'].items():
+        for name, stats in cases.items():
+            base = baseline.get('results', {}).get(size, {}).get(name)
+            if base is None:
+                rows.append((size, name, None, stats['median_ms'], None, 'new'))
+                continue
+            ratio = stats['median_ms'] / base['median_ms'] if base['median_ms'] > 0 else math.inf
+            if ratio > threshold:
+                status = 'slower'
+            elif ratio < 1 / threshold:
+                status = 'faster'
+            else:
+                status = 'same'
+            rows.append((size, name, base['median_ms'], stats['median_ms'], ratio, status))
+    return rows
+
+
+def format_comparison(rows):
+    lines = [f"{'фигур':>8}  {'случай':<22} {'эталон, мс':>11} {'сейчас, мс':>11} {'отношение':>10}  статус"]
+    for size, name, base, current, ratio, status in rows:
+        base_text = f"{base:11.3f}" if base is not None else f"{'-':>11}"
+        ratio_text = f"{ratio:10.2f}" if ratio is not None else f"{'-':>10}"
+        lines.append(f"{size:>8}  {name:<22} {base_text} {current:11.3f} {ratio_text}  {status}")
+    return '\n'.join(lines)
+
+
+def bench_cli(argv=None):
+    """замеры горячих путей из командной строки; JSON - в файл или stdout"""
+    parser = argparse.ArgumentParser(description="замеры горячих путей DrawingApp без окна")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES),
+                        help="размеры сцен (по умолчанию: %(default)s)")
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=None,
+                        help="случаи (по умолчанию - все)")
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="замеров на случай, не больше")
+    parser.add_argument('--max-time', type=float, default=MAX_TIME,
+                        help="секунд на случай, не больше")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('-o', '--output', help="файл для JSON (по умолчанию - stdout)")
+    parser.add_argument('--compare', metavar='BASELINE', help="JSON эталона для сравнения")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help="во сколько раз медиана может вырасти без регрессии")
+    args = parser.parse_args(argv)
+
+    def log(text):
+        print(text, file=sys.stderr)
+
+    report = run_benchmarks(args.sizes, args.cases, args.repeat, args.max_time, args.seed, log)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.threshold)
+        log(format_comparison(rows))
+        slower = sum(1 for row in rows if row[-1] == 'slower')
+        if slower:
+            log(f"регрессий: {slower} (порог {args.threshold:.2f})")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(bench_cli())
@@ -2,8 +2,29 @@ import pygame
 import sys
 import os
 import math
+import time
 from datetime import datetime
 
+import numpy as np
+
+from geometry import (HIT_TOLERANCE, as_points, hit_test, points_in_boxes, points_in_triangles,
+                      points_near_polylines, polygon_bounds, transform_boxes, transform_points)
+from shapestore import OPEN_TYPES, Selection, ShapeStore, ShapeView, TYPE_CODES, index_array
+from renderer import LayeredRenderer, ScratchSurface
+from history import AddCommand, DeleteCommand, History
+from journal import JOURNAL_DIRECTORY, JournalError, JournalLockedError, SceneJournal
+from imagesaver import IMAGE_SAVED, ImageSaver
+from drawlist import MARKER_RADIUS, DrawList, draw_outline_runs, marker_sprite
+from lod import DensityMipmap, lod_masks
+from profiler import FrameProfiler
+from recorder import EVENTS_EXTENSION, RECORD_KEY, EventRecorder, app_state, scene_path
+from exchange import JSONL_EXTENSION, SVG_EXTENSION, export_steps, import_steps
+from scenefile import SCENE_EXTENSION, read_scene, write_scene
+from session import SESSION_HOST, SESSION_PORT, SessionClient
+from spatial import SpatialGrid
+from stroke import STROKE_TOLERANCE, Stroke
+from textcache import TextCache
+
 pygame.init()
 
 SCREEN_WIDTH = 1000
@@ -15,6 +36,25 @@ SELECTION_COLOR = (0, 120, 255)
 SELECTION_THICKNESS = 2
 MULTI_SELECTION_COLOR = (255, 165, 0)
 CENTER_COLOR = (255, 0, 0)
+FPS = 60
+MIN_ZOOM = 0.01
+MAX_ZOOM = 50.0
+ZOOM_STEP = 1.2  # во сколько раз меняется масштаб вида за щелчок колеса
+TASK_BUDGET = 0.008  # секунд на шаги фоновых задач за кадр
+# режим основного цикла: 'fixed' - опрос событий с постоянной частотой,
+# 'event' - ожидание событий без нагрузки на процессор в простое
+LOOP_MODE = os.environ.get('DRAWAPP_LOOP_MODE', 'fixed')
+# интервал автосохранения изображения в секундах (0 - выключено)
+AUTOSAVE_INTERVAL = float(os.environ.get('DRAWAPP_AUTOSAVE', '0'))
+AUTOSAVE_FILENAME = 'autosave.png'
+# журнал правок сцены в saves/journal: при запуске сцена восстанавливается из него (0 - выключен)
+JOURNAL_ENABLED = os.environ.get('DRAWAPP_JOURNAL', '1') != '0'
+TOAST_DURATION = 1500  # мс, сколько висит всплывающее уведомление
+HUD_MARGIN = 6  # отступ панели профилировщика от края и панели инструментов
+
+AUTOSAVE_EVENT = pygame.event.custom_type()
+TOAST_EXPIRED = pygame.event.custom_type()
+SESSION_UPDATE = pygame.event.custom_type()  # пришли правки общей сессии (будит цикл 'event')
 
 COLORS = {
     'BLACK': (0, 0, 0),
@@ -27,34 +67,73 @@ COLORS = {
 }
 
 class DrawingApp:
-    def __init__(self):
+    def __init__(self, loop_mode=LOOP_MODE, autosave_interval=AUTOSAVE_INTERVAL):
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("трофим (в8) - мультивыделение + матричные трансформации")
 
-        self.shapes = []
-        self.selected_shape_indices = set()  # множество индексов выбранных фигур
+        self.init_scene_state()
         self.current_tool = 'rectangle'
         self.current_color = COLORS['BLACK']
         self.thickness = DEFAULT_THICKNESS
         self.drawing = False
         self.start_pos = None
         self.last_pos = None
-        self.preview_surface = None
+        self.stroke = None  # рисуемая ломаная инструмента 'freehand'
+        self.preview_layer = None
+        self.marquee_layer = None
         self.dragging_selected = False  # флаг перетаскивания выбранных фигур
-        self.drag_offsets = {}  # словарь смещений для каждой фигуры
+        self.ctrl_pressed = False  # флаг нажатия Ctrl
+        self.last_mouse_pos = None  # для матричных трансформаций
+        self.panning = False  # сдвиг вида правой кнопкой
+        self.pan_anchor = None
+        self.loop_mode = loop_mode
+        self.tasks = []  # пошаговые задачи (импорт/экспорт), выполняются между кадрами
+        self.image_saver = ImageSaver()  # запись PNG в фоновых потоках
+        self.autosave_interval = autosave_interval
+        self.autosaved_version = None  # версия сцены на момент последнего автосохранения
+        if autosave_interval > 0:
+            pygame.time.set_timer(AUTOSAVE_EVENT, int(autosave_interval * 1000))
+
+        self.profiler = FrameProfiler()  # время фаз кадра, HUD по F3, трасса по F4
+        self._hud_surface = None  # (текст, поверхность) панели профилировщика
+        self.recorder = None  # запись событий ввода для воспроизведения (F5)
+        self.recording_path = None
+
+        # прозрачные поверхности размером с рисуемое, а не со весь экран
+        self.preview_layer = ScratchSurface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.marquee_layer = ScratchSurface((SCREEN_WIDTH, SCREEN_HEIGHT))
+
+        self.ui_elements = self.create_ui()
+        self.ui_version = 0  # растёт при каждом изменении состояния панели
+
+        self.renderer = LayeredRenderer(self, BACKGROUND_COLOR)
+
+    def init_scene_state(self):
+        """сцена, выделение, история и камера - всё, что не зависит от окна
+        и панели инструментов (общее с HeadlessApp)"""
+        self.shapes = ShapeStore()  # колоночное хранилище фигур
+        self.spatial_index = SpatialGrid()  # сетка для поиска фигур по координатам
+        self.lod = DensityMipmap(self.shapes, self.spatial_index)  # плотность мелких фигур при отдалении
+        self.draw_list = DrawList(self.shapes)  # контуры и цвета, подготовленные к отрисовке
+        self.markers = {}  # цвет -> спрайт маркера вершины выбранной фигуры
+        self.selected_shape_indices = Selection(self.shapes)  # множество индексов выбранных фигур
+        # отложенные преобразования выделения переносятся в вершины - обновляем сетку
+        self.selected_shape_indices.on_flush = self.selection_baked
+        self._selection_box = None  # кэш общих границ выделения
         self.selection_rect = None  # прямоугольник выделения
         self.selecting = False  # режим выделения прямоугольником
-        self.ctrl_pressed = False  # флаг нажатия Ctrl
         self.show_center = True  # флаг отображения центра
-        self.last_mouse_pos = None  # для матричных трансформаций
         self.fixed_center = None  # фиксированный центр для текущей трансформации
-
+        self.history = History(self.multiply_matrices)  # отмена и повтор команд
+        self.gesture = None  # текущий жест (перетаскивание, серия щелчков колеса)
+        # камера: экранные координаты = view * мировые (масштаб и целочисленный сдвиг)
+        self.view = self.translation_matrix(0, 0)
+        self.toast = None  # (текст, цвет) всплывающего уведомления
+        self.session = None  # участие в общей сессии (python drawapp.py join)
+        self.journal = None  # журнал правок для восстановления после сбоя (open_journal)
         self.font = pygame.font.Font(None, 24)
         self.small_font = pygame.font.Font(None, 18)
-
-        self.preview_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-
-        self.ui_elements = self.create_ui()
+        self.text_cache = TextCache()  # кэш отрисованных надписей
 
     def multiply_matrices(self, A, B):
         """умножение двух матриц 3x3"""
@@ -67,25 +146,206 @@ class DrawingApp:
 
     def multiply_matrix_vector(self, matrix, point):
         """умножение матрицы 3x3 на точку (x, y)"""
-        x, y = point
-        new_x = matrix[0][0]*x + matrix[0][1]*y + matrix[0][2]
-        new_y = matrix[1][0]*x + matrix[1][1]*y + matrix[1][2]
+        new_x, new_y = transform_points(point, matrix)[0].tolist()
         return (new_x, new_y)
 
     def apply_matrix_to_shape(self, shape, matrix):
         """применение матрицы трансформации к фигуре"""
-        if 'points' in shape:
-            # новая структура с points
-            shape['points'] = [
-                self.multiply_matrix_vector(matrix, p)
-                for p in shape['points']
-            ]
+        if isinstance(shape, ShapeView):
+            # фигура из хранилища - трансформируем вершины на месте
+            selected = shape.index in self.selected_shape_indices
+            if selected:
+                self.selected_shape_indices.discard(shape.index)
+            shape.apply_matrix(matrix)
+            self.reindex_shapes([shape.index])
+            self.publish('transformed', [shape.index], matrix)
+            if selected:
+                self.selected_shape_indices.add(shape.index)
+        elif 'points' in shape:
+            # новая структура с points - все вершины одной операцией
+            shape['points'] = [tuple(p) for p in transform_points(shape['points'], matrix).tolist()]
         else:
             # старая структура с start/end (для обратной совместимости)
-            start = shape['start']
-            end = shape['end']
-            shape['start'] = self.multiply_matrix_vector(matrix, start)
-            shape['end'] = self.multiply_matrix_vector(matrix, end)
+            start, end = transform_points([shape['start'], shape['end']], matrix).tolist()
+            shape['start'] = tuple(start)
+            shape['end'] = tuple(end)
+
+    def apply_matrix_to_selection(self, matrix):
+        """преобразование выбранных фигур: матрица только домножается к отложенной
+        (O(1)), в вершины она переносится в конце жеста - bake_transform"""
+        self.selected_shape_indices.defer(matrix)
+        self.history.record_transform(self.selected_shape_indices, matrix, self.gesture)
+
+    def bake_transform(self):
+        """перенос отложенного преобразования выделения в вершины фигур"""
+        self.selected_shape_indices.flush()
+
+    def selection_baked(self, selection, matrix):
+        """отложенная матрица перенесена в вершины выбранных фигур"""
+        self.reindex_shapes(selection)
+        self.publish('transformed', selection, matrix)
+
+    def selection_box(self):
+        """общие границы выбранных фигур (без отложенной матрицы) и их наибольшая
+        толщина; пересчитываются только после изменения фигур или выделения"""
+        selection = self.selected_shape_indices
+        key = (self.shapes.version, selection.version)
+        if self._selection_box is None or self._selection_box[0] != key:
+            idx = selection.indices()
+            b = self.shapes.bounds(idx)
+            box = np.concatenate((b[:, 0:2].min(axis=0), b[:, 2:4].max(axis=0)))
+            self._selection_box = (key, box, int(self.shapes.thickness[idx].max()))
+        return self._selection_box[1:]
+
+    def transform_shapes(self, indices, matrix):
+        """применение матрицы к фигурам indices (отмена и повтор преобразований)"""
+        self.bake_transform()
+        self.shapes.apply_matrix(indices, matrix)
+        self.reindex_shapes(indices)
+        self.selected_shape_indices.refresh()
+        self.fixed_center = None
+        self.publish('transformed', indices, matrix)
+
+    def remove_shapes(self, indices):
+        """удаление фигур indices одним сжатием хранилища"""
+        self.bake_transform()
+        self.publish('removed', self.shapes.ids[index_array(indices)])
+        keep = self.shapes.delete(indices)
+        # выделение сжимается той же маской - оставшиеся фигуры остаются выбранными
+        self.selected_shape_indices.compact(keep)
+        self.fixed_center = None
+        # индексы сдвинулись - перестраиваем сетку целиком
+        self.spatial_index.rebuild(self.shapes.bounds())
+
+    def restore_shapes(self, indices, batch):
+        """возврат ранее удалённых фигур на их позиции; они становятся выбранными"""
+        self.bake_transform()
+        self.shapes.insert(indices, batch)
+        self.spatial_index.rebuild(self.shapes.bounds())
+        self.fixed_center = None
+        self.selected_shape_indices.replace(indices)
+        self.publish('added', indices)
+
+    def publish(self, change, *args):
+        """правка сцены - тем, кто за ними следит: общей сессии (свои правки
+        она отправляет остальным) и журналу (записывает все)"""
+        for listener in (self.session, self.journal):
+            if listener is not None:
+                getattr(listener, change)(*args)
+
+    # --- правки по идентификаторам (общая сессия) ---
+    # фигуры другого участника: выделение сохраняется; если индексы своих
+    # фигур сдвинулись, команды истории с ними больше не верны - история сбрасывается
+
+    def merge_shapes(self, batch):
+        """вставка фигур batch (формат ShapeStore.take) на места по идентификаторам"""
+        self.bake_transform()
+        count = len(self.shapes)
+        indices = self.shapes.merge(batch)
+        if not len(indices):
+            return indices
+        self.publish('added', indices)
+        if indices[0] >= count:
+            # новые фигуры оказались в конце - остальные индексы не сдвинулись
+            self.spatial_index.extend(count, self.shapes.bounds(indices))
+        else:
+            new = np.zeros(len(self.shapes), dtype=bool)
+            new[indices] = True
+            self.selected_shape_indices.inserted(new)
+            self.spatial_index.rebuild(self.shapes.bounds())
+            self.history.clear()
+            self.fixed_center = None
+        return indices
+
+    def remove_ids(self, ids):
+        """удаление фигур с идентификаторами ids (отсутствующие пропускаются)"""
+        indices = self.shapes.index_of(ids)
+        indices = indices[indices >= 0]
+        if len(indices):
+            self.remove_shapes(indices)
+            self.history.clear()
+
+    def transform_ids(self, groups):
+        """применение матриц к непересекающимся группам фигур [(ids, matrix), ...];
+        сетка и выделение обновляются один раз на все группы"""
+        pairs = [(indices[indices >= 0], matrix)
+                 for indices, matrix in ((self.shapes.index_of(ids), m) for ids, m in groups)]
+        pairs = [(indices, matrix) for indices, matrix in pairs if len(indices)]
+        if not pairs:
+            return
+        self.bake_transform()
+        self.shapes.apply_matrices(pairs)
+        for indices, matrix in pairs:
+            self.publish('transformed', indices, matrix)
+        indices = np.concatenate([indices for indices, _ in pairs])
+        self.reindex_shapes(indices)
+        if self.selected_shape_indices.contains(indices).any():
+            self.selected_shape_indices.refresh()
+            self.fixed_center = None
+
+    def replace_shapes(self, batch):
+        """замена сцены фигурами batch (снимок сцены сессии); выбранные
+        фигуры, оставшиеся в сцене, остаются выбранными"""
+        self.bake_transform()
+        selected = self.shapes.ids[self.selected_shape_indices.indices()].copy()
+        self.selected_shape_indices.clear()
+        self.fixed_center = None
+        self.history.clear()
+        offsets = np.zeros(len(batch['counts']) + 1, dtype=np.int64)
+        np.cumsum(batch['counts'], out=offsets[1:])
+        # колонки копируются: пришедшие из сети массивы только для чтения
+        columns = [np.array(batch[name]) for name in ('types', 'colors', 'thickness', 'legacy')]
+        self.shapes.load_arrays(np.array(batch['vertices']), offsets, *columns,
+                                ids=np.array(batch['ids']))
+        self.spatial_index.rebuild(self.shapes.bounds())
+        self.publish('cleared')
+        self.publish('added', range(len(self.shapes)))
+        indices = self.shapes.index_of(selected)
+        self.selected_shape_indices.replace(indices[indices >= 0])
+
+    def undo(self):
+        """отмена последней команды"""
+        self.bake_transform()
+        self.gesture = None
+        return self.history.undo(self)
+
+    def redo(self):
+        """повтор отменённой команды"""
+        self.bake_transform()
+        self.gesture = None
+        return self.history.redo(self)
+
+    def reindex_shapes(self, indices):
+        """обновление пространственного индекса после изменения фигур"""
+        idx = index_array(indices)
+        self.spatial_index.update(idx, self.shapes.bounds(idx))
+
+    def clear_shapes(self):
+        """удаление всех фигур"""
+        self.bake_transform()
+        count = len(self.shapes)
+        if count:
+            # сцену, которая не влезает в бюджет истории, отменить нельзя
+            everything = range(count)
+            command = DeleteCommand(everything, self.shapes.take(everything))
+            if command.nbytes <= self.history.budget:
+                self.history.record(command)
+            else:
+                self.history.clear()
+        self.shapes.clear()
+        self.spatial_index.clear()
+        self.selected_shape_indices.clear()
+        self.publish('cleared')
+
+    def delete_selected_shapes(self):
+        """удаление выбранных фигур"""
+        if not self.selected_shape_indices:
+            return
+        self.bake_transform()
+        indices_to_delete = self.selected_shape_indices.indices()
+        batch = self.shapes.take(indices_to_delete)
+        self.remove_shapes(indices_to_delete)
+        self.history.record(DeleteCommand(indices_to_delete, batch))
 
     def translation_matrix(self, dx, dy):
         """матрица переноса"""
@@ -113,6 +373,71 @@ class DrawingApp:
             [0, 0, 1]
         ]
 
+    # камера
+    @property
+    def zoom(self):
+        return self.view[0][0]
+
+    @property
+    def pan(self):
+        return self.view[0][2], self.view[1][2]
+
+    def set_view(self, matrix):
+        """установка матрицы камеры; сдвиг округляется до пикселя,
+        чтобы закэшированные тайлы совпадали при панорамировании"""
+        zoom = max(MIN_ZOOM, min(MAX_ZOOM, matrix[0][0]))
+        self.view = [
+            [zoom, 0, round(matrix[0][2])],
+            [0, zoom, round(matrix[1][2])],
+            [0, 0, 1]
+        ]
+
+    def pan_view(self, dx, dy):
+        """сдвиг вида на (dx, dy) экранных пикселей"""
+        self.set_view(self.multiply_matrices(self.translation_matrix(dx, dy), self.view))
+
+    def zoom_view(self, factor, anchor):
+        """масштабирование вида вокруг экранной точки anchor"""
+        factor = max(MIN_ZOOM, min(MAX_ZOOM, self.zoom * factor)) / self.zoom
+        ax, ay = anchor
+        T1 = self.translation_matrix(-ax, -ay)
+        T2 = self.translation_matrix(ax, ay)
+        S = self.scale_matrix(factor)
+        self.set_view(self.multiply_matrices(T2, self.multiply_matrices(S, self.multiply_matrices(T1, self.view))))
+
+    def reset_view(self):
+        self.set_view(self.translation_matrix(0, 0))
+
+    def screen_to_world(self, pos):
+        """экранная точка в мировых координатах"""
+        zoom = self.zoom
+        px, py = self.pan
+        return ((pos[0] - px) / zoom, (pos[1] - py) / zoom)
+
+    def world_to_screen(self, point):
+        """мировая точка в экранных координатах"""
+        return self.multiply_matrix_vector(self.view, point)
+
+    def screen_thickness(self, thickness):
+        """толщина линии на экране при текущем масштабе (0 у pygame - заливка)"""
+        return max(1, round(thickness * self.zoom))
+
+    def visible_shape_indices(self, rect=None, candidates=None):
+        """индексы фигур по возрастанию, чьи границы попадают в экранную
+        область rect (по умолчанию весь экран); если заданы candidates -
+        пара (индексы, их границы), отбор идёт только среди них без запроса к сетке"""
+        if rect is None:
+            rect = self.screen.get_rect()
+        x0, y0 = self.screen_to_world(rect.topleft)
+        x1, y1 = self.screen_to_world(rect.bottomright)
+        # запас на толщину линий, выходящих за границы фигуры
+        margin = 6 + 2 / self.zoom
+        x0, y0, x1, y1 = x0 - margin, y0 - margin, x1 + margin, y1 + margin
+        if candidates is None:
+            return self.spatial_index.intersecting(x0, y0, x1, y1)
+        idx, b = candidates
+        return idx[(b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)]
+
     def create_ui(self):
         """создание элементов интерфейса"""
         ui = {
@@ -124,19 +449,26 @@ class DrawingApp:
         tool_y = 10
 
         ui['tools'].append({
-            'rect': pygame.Rect(0, tool_y, 70, 30),
+            'rect': pygame.Rect(0, tool_y, 60, 30),
             'type': 'rectangle',
             'text': 'прям',
             'active': True
         })
 
         ui['tools'].append({
-            'rect': pygame.Rect(70, tool_y, 70, 30),
+            'rect': pygame.Rect(60, tool_y, 60, 30),
             'type': 'triangle',
             'text': 'треу',
             'active': False
         })
 
+        ui['tools'].append({
+            'rect': pygame.Rect(120, tool_y, 60, 30),
+            'type': 'freehand',
+            'text': 'рука',
+            'active': False
+        })
+
         color_x = 180
         for i, (color_name, color_value) in enumerate(COLORS.items()):
             ui['colors'].append({
@@ -158,6 +490,16 @@ class DrawingApp:
             'value': self.thickness
         }
 
+        ui['save_scene_button'] = {
+            'rect': pygame.Rect(SCREEN_WIDTH - 420, tool_y, 60, 30),
+            'text': 'сцена'
+        }
+
+        ui['load_scene_button'] = {
+            'rect': pygame.Rect(SCREEN_WIDTH - 360, tool_y, 60, 30),
+            'text': 'откр'
+        }
+
         ui['save_button'] = {
             'rect': pygame.Rect(SCREEN_WIDTH - 120, tool_y, 60, 30),
             'text': 'сейв'
@@ -186,8 +528,18 @@ class DrawingApp:
 
         return ui
 
+    def ui_state(self):
+        """снимок состояния элементов панели, влияющего на её отрисовку"""
+        ui = self.ui_elements
+        return (tuple(tool['active'] for tool in ui['tools']),
+                tuple(color_btn['active'] for color_btn in ui['colors']),
+                ui['thickness_slider']['value'], ui['thickness_slider']['handle_rect'].x,
+                ui['center_button']['active'])
+
     def update_ui_active_states(self):
         """обновление активных состояний элементов интерфейса"""
+        before = self.ui_state()
+
         for tool in self.ui_elements['tools']:
             tool['active'] = (tool['type'] == self.current_tool)
 
@@ -200,84 +552,115 @@ class DrawingApp:
         
         self.ui_elements['center_button']['active'] = self.show_center
 
+        if self.ui_state() != before:
+            # панель перерисовывается в кэш только после реальных изменений
+            self.ui_version += 1
+
     def draw_ui(self):
         """отрисовка интерфейса"""
-        pygame.draw.rect(self.screen, (240, 240, 240), (0, 0, SCREEN_WIDTH, 50))
-        pygame.draw.line(self.screen, (200, 200, 200), (0, 50), (SCREEN_WIDTH, 50), 2)
+        self.draw_toolbar(self.screen)
+        self.draw_status(self.screen)
+
+    def draw_toolbar(self, surface):
+        """отрисовка верхней панели инструментов"""
+        pygame.draw.rect(surface, (240, 240, 240), (0, 0, SCREEN_WIDTH, 50))
+        pygame.draw.line(surface, (200, 200, 200), (0, 50), (SCREEN_WIDTH, 50), 2)
 
         for tool in self.ui_elements['tools']:
             color = (200, 230, 200) if tool['active'] else (220, 220, 220)
-            pygame.draw.rect(self.screen, color, tool['rect'])
-            pygame.draw.rect(self.screen, (100, 100, 100), tool['rect'], 1)
+            pygame.draw.rect(surface, color, tool['rect'])
+            pygame.draw.rect(surface, (100, 100, 100), tool['rect'], 1)
 
-            text = self.font.render(tool['text'], True, (0, 0, 0))
+            text = self.text_cache.render(self.font, tool['text'], (0, 0, 0))
             text_rect = text.get_rect(center=tool['rect'].center)
-            self.screen.blit(text, text_rect)
+            surface.blit(text, text_rect)
 
         for color_btn in self.ui_elements['colors']:
-            pygame.draw.rect(self.screen, color_btn['color'], color_btn['rect'])
+            pygame.draw.rect(surface, color_btn['color'], color_btn['rect'])
             if color_btn['active']:
-                pygame.draw.rect(self.screen, (255, 255, 255), color_btn['rect'], 3)
+                pygame.draw.rect(surface, (255, 255, 255), color_btn['rect'], 3)
             else:
-                pygame.draw.rect(self.screen, (100, 100, 100), color_btn['rect'], 1)
+                pygame.draw.rect(surface, (100, 100, 100), color_btn['rect'], 1)
 
         slider = self.ui_elements['thickness_slider']
-        pygame.draw.rect(self.screen, (200, 200, 200), slider['rect'])
-        pygame.draw.rect(self.screen, (100, 100, 100), slider['rect'], 1)
-        pygame.draw.rect(self.screen, (100, 100, 200), slider['handle_rect'])
+        pygame.draw.rect(surface, (200, 200, 200), slider['rect'])
+        pygame.draw.rect(surface, (100, 100, 100), slider['rect'], 1)
+        pygame.draw.rect(surface, (100, 100, 200), slider['handle_rect'])
+
+        thickness_text = self.text_cache.render(self.small_font, f"толщина: {self.thickness}", (0, 0, 0))
+        surface.blit(thickness_text, (slider['rect'].x, slider['rect'].y - 15))
 
-        thickness_text = self.small_font.render(f"толщина: {self.thickness}", True, (0, 0, 0))
-        self.screen.blit(thickness_text, (slider['rect'].x, slider['rect'].y - 15))
+        for scene_btn in (self.ui_elements['save_scene_button'],
+                          self.ui_elements['load_scene_button']):
+            pygame.draw.rect(surface, (220, 230, 245), scene_btn['rect'])
+            pygame.draw.rect(surface, (100, 100, 100), scene_btn['rect'], 1)
+            scene_text = self.text_cache.render(self.font, scene_btn['text'], (0, 0, 0))
+            scene_text_rect = scene_text.get_rect(center=scene_btn['rect'].center)
+            surface.blit(scene_text, scene_text_rect)
 
         save_btn = self.ui_elements['save_button']
-        pygame.draw.rect(self.screen, (200, 230, 200), save_btn['rect'])
-        pygame.draw.rect(self.screen, (100, 100, 100), save_btn['rect'], 1)
-        save_text = self.font.render(save_btn['text'], True, (0, 0, 0))
+        pygame.draw.rect(surface, (200, 230, 200), save_btn['rect'])
+        pygame.draw.rect(surface, (100, 100, 100), save_btn['rect'], 1)
+        save_text = self.text_cache.render(self.font, save_btn['text'], (0, 0, 0))
         save_text_rect = save_text.get_rect(center=save_btn['rect'].center)
-        self.screen.blit(save_text, save_text_rect)
+        surface.blit(save_text, save_text_rect)
 
         clear_btn = self.ui_elements['clear_button']
-        pygame.draw.rect(self.screen, (255, 200, 200), clear_btn['rect'])
-        pygame.draw.rect(self.screen, (100, 100, 100), clear_btn['rect'], 1)
-        clear_text = self.font.render(clear_btn['text'], True, (0, 0, 0))
+        pygame.draw.rect(surface, (255, 200, 200), clear_btn['rect'])
+        pygame.draw.rect(surface, (100, 100, 100), clear_btn['rect'], 1)
+        clear_text = self.text_cache.render(self.font, clear_btn['text'], (0, 0, 0))
         clear_text_rect = clear_text.get_rect(center=clear_btn['rect'].center)
-        self.screen.blit(clear_text, clear_text_rect)
+        surface.blit(clear_text, clear_text_rect)
 
         deselect_btn = self.ui_elements['deselect_button']
         btn_color = (200, 200, 255) if self.selected_shape_indices else (220, 220, 220)
-        pygame.draw.rect(self.screen, btn_color, deselect_btn['rect'])
-        pygame.draw.rect(self.screen, (100, 100, 100), deselect_btn['rect'], 1)
-        deselect_text = self.font.render(deselect_btn['text'], True, (0, 0, 0))
+        pygame.draw.rect(surface, btn_color, deselect_btn['rect'])
+        pygame.draw.rect(surface, (100, 100, 100), deselect_btn['rect'], 1)
+        deselect_text = self.text_cache.render(self.font, deselect_btn['text'], (0, 0, 0))
         deselect_text_rect = deselect_text.get_rect(center=deselect_btn['rect'].center)
-        self.screen.blit(deselect_text, deselect_text_rect)
+        surface.blit(deselect_text, deselect_text_rect)
 
         select_all_btn = self.ui_elements['select_all_button']
-        pygame.draw.rect(self.screen, (200, 255, 200), select_all_btn['rect'])
-        pygame.draw.rect(self.screen, (100, 100, 100), select_all_btn['rect'], 1)
-        select_all_text = self.font.render(select_all_btn['text'], True, (0, 0, 0))
+        pygame.draw.rect(surface, (200, 255, 200), select_all_btn['rect'])
+        pygame.draw.rect(surface, (100, 100, 100), select_all_btn['rect'], 1)
+        select_all_text = self.text_cache.render(self.font, select_all_btn['text'], (0, 0, 0))
         select_all_text_rect = select_all_text.get_rect(center=select_all_btn['rect'].center)
-        self.screen.blit(select_all_text, select_all_text_rect)
+        surface.blit(select_all_text, select_all_text_rect)
         
         center_btn = self.ui_elements['center_button']
         btn_color = (200, 200, 200) if center_btn['active'] else (220, 220, 220)
-        pygame.draw.rect(self.screen, btn_color, center_btn['rect'])
-        pygame.draw.rect(self.screen, (100, 100, 100), center_btn['rect'], 1)
-        center_text = self.font.render(center_btn['text'], True, (0, 0, 0))
+        pygame.draw.rect(surface, btn_color, center_btn['rect'])
+        pygame.draw.rect(surface, (100, 100, 100), center_btn['rect'], 1)
+        center_text = self.text_cache.render(self.font, center_btn['text'], (0, 0, 0))
         center_text_rect = center_text.get_rect(center=center_btn['rect'].center)
-        self.screen.blit(center_text, center_text_rect)
+        surface.blit(center_text, center_text_rect)
 
-        help_text = self.small_font.render(
-            "r - прямоугольник | t - треугольник | c - очистить | s - сохранить | "
+    def draw_status(self, surface):
+        """отрисовка подсказки и числа выбранных фигур внизу экрана"""
+        help_text = self.text_cache.render(
+            self.small_font,
+            "r - прямоугольник | t - треугольник | c - очистить | ctrl+z/ctrl+y - отмена/повтор | s - сохранить | w/l - сцена | e/i - обмен | "
             "del - удалить выбранные | ctrl+клик - добавить | a - все | центр - пробел | "
-            "колесико: поворот | shift+колесико: масштаб",
-            True, (80, 80, 80))
-        self.screen.blit(help_text, (10, SCREEN_HEIGHT - 25))
+            "колесико: поворот | shift+колесико: масштаб | пкм - сдвиг вида | ctrl+колесико: зум | home - сброс вида | "
+            "f3/f4 - профиль/трасса | f5 - запись событий",
+            (80, 80, 80))
+        surface.blit(help_text, (10, SCREEN_HEIGHT - 25))
 
         if self.selected_shape_indices:
             count = len(self.selected_shape_indices)
-            selected_info = self.small_font.render(
-                f"Выбрано фигур: {count}", True, SELECTION_COLOR)
-            self.screen.blit(selected_info, (10, SCREEN_HEIGHT - 45))
+            selected_info = self.text_cache.render(
+                self.small_font, f"Выбрано фигур: {count}", SELECTION_COLOR)
+            surface.blit(selected_info, (10, SCREEN_HEIGHT - 45))
+
+        task_text = self.task_status()
+        if task_text:
+            task_info = self.text_cache.render(self.small_font, task_text, (0, 128, 0))
+            surface.blit(task_info, (300, SCREEN_HEIGHT - 45))
+
+        session_text = self.session_status()
+        if session_text:
+            session_info = self.text_cache.render(self.small_font, session_text, (80, 80, 80))
+            surface.blit(session_info, (600, SCREEN_HEIGHT - 45))
 
     def create_rectangle_points(self, start, end):
         """создание точек прямоугольника"""
@@ -304,91 +687,108 @@ class DrawingApp:
         ]
 
     def add_shape(self, start_pos, end_pos):
-        """добавление новой фигуры"""
-        start_pos = (max(0, min(SCREEN_WIDTH, start_pos[0])),
-                     max(50, min(SCREEN_HEIGHT, start_pos[1])))
-        end_pos = (max(0, min(SCREEN_WIDTH, end_pos[0])),
-                   max(50, min(SCREEN_HEIGHT, end_pos[1])))
+        """добавление новой фигуры (координаты мировые, холст не ограничен)"""
 
         if self.current_tool == 'rectangle':
             points = self.create_rectangle_points(start_pos, end_pos)
-        else:
+        elif self.current_tool == 'triangle':
             points = self.create_triangle_points(start_pos, end_pos)
-
-        shape = {
-            'type': self.current_tool,
-            'points': points,  # новая структура с points
-            'color': self.current_color,
-            'thickness': self.thickness
-        }
-        self.shapes.append(shape)
+        else:
+            points = [start_pos, end_pos]  # ломаная из одного отрезка
+        self.add_outline(self.current_tool, points)
+
+    def add_stroke(self, points):
+        """добавление ломаной от руки по уже упрощённым вершинам (n, 2)"""
+        self.add_outline('freehand', points)
+
+    def add_outline(self, shape_type, points):
+        """добавление фигуры по вершинам контура (новая структура с points)
+        текущими цветом и толщиной; выделение - как после рисования"""
+        index = self.shapes.add(shape_type, points, self.current_color, self.thickness)
+        self.spatial_index.insert(index, self.shapes.bounds([index])[0])
+        self.history.record(AddCommand([index]))
+        self.publish('added', [index])
         
         if not self.ctrl_pressed:
             # если не зажат Ctrl, выделяем только новую фигуру
-            self.selected_shape_indices = {len(self.shapes) - 1}
+            self.selected_shape_indices.replace([index])
         else:
             # если зажат Ctrl, добавляем новую фигуру к выделению
-            self.selected_shape_indices.add(len(self.shapes) - 1)
+            self.selected_shape_indices.add(index)
+
+    def add_shapes(self, shapes):
+        """добавление пачки фигур-словарей без изменения выделения"""
+        indices = self.shapes.extend(shapes)
+        if len(indices):
+            self.spatial_index.extend(int(indices[0]), self.shapes.bounds(indices))
+            self.history.record(AddCommand(indices))
+            self.publish('added', indices)
+        return indices
 
     def point_in_rect(self, point, rect_start, rect_end):
         """проверка, находится ли точка внутри прямоугольника"""
-        x, y = point
-        x1, y1 = rect_start
-        x2, y2 = rect_end
-        
-        min_x = min(x1, x2)
-        max_x = max(x1, x2)
-        min_y = min(y1, y2)
-        max_y = max(y1, y2)
-        
-        tolerance = 5
-        return (min_x - tolerance <= x <= max_x + tolerance and 
-                min_y - tolerance <= y <= max_y + tolerance)
+        bounds = polygon_bounds(as_points([rect_start, rect_end]), [0])
+        return bool(points_in_boxes(point, bounds[0], HIT_TOLERANCE))
 
     def point_in_triangle(self, point, p1, p2, p3):
         """проверка, находится ли точка внутри треугольника"""
-        def sign(p1, p2, p3):
-            return (p1[0] - p3[0]) * (p2[1] - p3[1]) - (p2[0] - p3[0]) * (p1[1] - p3[1])
-        
-        d1 = sign(point, p1, p2)
-        d2 = sign(point, p2, p3)
-        d3 = sign(point, p3, p1)
-        
-        has_neg = (d1 < 0) or (d2 < 0) or (d3 < 0)
-        has_pos = (d1 > 0) or (d2 > 0) or (d3 > 0)
-        
-        return not (has_neg and has_pos)
+        return bool(points_in_triangles(point, p1, p2, p3))
 
     def point_in_shape(self, point, shape):
         """проверка, находится ли точка внутри фигуры"""
         if shape['type'] == 'rectangle':
-            # для прямоугольника используем точки
-            xs = [p[0] for p in shape['points']]
-            ys = [p[1] for p in shape['points']]
-            min_x = min(xs)
-            max_x = max(xs)
-            min_y = min(ys)
-            max_y = max(ys)
-            tolerance = 5
-            return (min_x - tolerance <= point[0] <= max_x + tolerance and 
-                    min_y - tolerance <= point[1] <= max_y + tolerance)
+            # для прямоугольника используем границы фигуры
+            min_x, min_y, width, height = self.get_shape_bounds(shape)
+            bounds = (min_x, min_y, min_x + width, min_y + height)
+            return bool(points_in_boxes(point, bounds, HIT_TOLERANCE))
+        elif shape['type'] == 'freehand':
+            # ломаная - по расстоянию до ближайшего отрезка
+            return bool(points_near_polylines(point, self.outline_points(shape), [0])[0])
         else:  # triangle
-            return self.point_in_triangle(point, shape['points'][0], 
-                                        shape['points'][1], shape['points'][2])
+            points = self.outline_points(shape)
+            return self.point_in_triangle(point, points[0], points[1], points[2])
+
+    def outline_points(self, shape):
+        """вершины контура фигуры (для старой структуры start/end строятся по типу)"""
+        if 'points' in shape:
+            return shape['points']
+        if shape['type'] == 'triangle':
+            return self.create_triangle_points(shape['start'], shape['end'])
+        return self.create_rectangle_points(shape['start'], shape['end'])
 
     def find_shape_at_point(self, point):
-        """поиск фигуры по координатам точки"""
-        for i in range(len(self.shapes) - 1, -1, -1):  # ищем с конца (сверху)
-            shape = self.shapes[i]
-            if self.point_in_shape(point, shape):
-                return i
-        return -1
+        """поиск фигуры по координатам точки (верхней из попавших)"""
+        x, y = point
+        idx = self.spatial_index.query_point(x, y, HIT_TOLERANCE)
+        idx = idx[points_in_boxes(point, self.spatial_index.bounds[idx], HIT_TOLERANCE)]
+        if not len(idx):
+            return -1
+        store = self.shapes
+
+        def hits(start, stop):
+            # кандидаты куска проверяются одной операцией, для прямоугольника достаточно границ
+            sub = idx[start:stop]
+            types = store.types[sub]
+            hit = hit_test(point, store.bounds(sub), store.triangles(sub),
+                           types == TYPE_CODES['rectangle'])[0]
+            lines = OPEN_TYPES[types]
+            if lines.any():
+                # ломаные от руки - по расстоянию до их отрезков
+                vertex_idx, starts = store.gather(sub[lines])
+                hit[lines] = points_near_polylines(point, store.vertices[vertex_idx], starts)
+            return sub[hit]
+
+        found = store.engine.concatenate(hits, len(idx))
+        return int(found[-1]) if len(found) else -1
 
     def get_shape_bounds(self, shape):
         """получение границ фигуры для прямоугольника выделения"""
-        xs = [p[0] for p in shape['points']]
-        ys = [p[1] for p in shape['points']]
-        return (min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+        if isinstance(shape, ShapeView):
+            # границы фигур из хранилища берутся из кэша
+            min_x, min_y, max_x, max_y = self.shapes.bounds()[shape.index].tolist()
+            return (min_x, min_y, max_x - min_x, max_y - min_y)
+        min_x, min_y, max_x, max_y = polygon_bounds(as_points(self.outline_points(shape)), [0])[0].tolist()
+        return (min_x, min_y, max_x - min_x, max_y - min_y)
 
     def rect_collides_with_shape(self, rect, shape):
         """проверка пересечения прямоугольника выделения с фигурой"""
@@ -398,40 +798,58 @@ class DrawingApp:
 
     def find_shapes_in_rect(self, rect):
         """поиск всех фигур внутри прямоугольника выделения"""
-        found_indices = []
         selection_rect = pygame.Rect(rect)
-        
-        for i, shape in enumerate(self.shapes):
-            if self.rect_collides_with_shape(selection_rect, shape):
-                found_indices.append(i)
-        
-        return found_indices
+        if not selection_rect.width or not selection_rect.height:
+            return np.zeros(0, dtype=np.int64)
+        left, top, right, bottom = (selection_rect.left, selection_rect.top,
+                                    selection_rect.right, selection_rect.bottom)
+        # кандидаты с запасом на округление, крупная рамка - перебором границ
+        idx = self.spatial_index.intersecting(left - 1, top - 1, right + 1, bottom + 1)
+        bounds = self.spatial_index.bounds
+
+        def hits(start, stop):
+            # те же правила, что у pygame.Rect(get_shape_bounds(...)).colliderect
+            sub = idx[start:stop]
+            b = bounds[sub]
+            x = np.trunc(b[:, 0])
+            y = np.trunc(b[:, 1])
+            w = np.trunc(b[:, 2] - b[:, 0])
+            h = np.trunc(b[:, 3] - b[:, 1])
+            return sub[(w != 0) & (h != 0) & (x < right) & (left < x + w) &
+                       (y < bottom) & (top < y + h)]
+
+        return self.shapes.engine.concatenate(hits, len(idx))
     # выделение
-    def draw_selection_highlight(self, shape, is_multi=False):
+    def draw_selection_highlight(self, shape, is_multi=False, points=None):
         """отрисовка выделения вокруг фигуры"""
         color = MULTI_SELECTION_COLOR if is_multi and len(self.selected_shape_indices) > 1 else SELECTION_COLOR
-        pygame.draw.polygon(self.screen, color, shape['points'], SELECTION_THICKNESS)
+        if points is None:
+            points = [self.world_to_screen(p) for p in self.outline_points(shape)]
+        points = np.asarray(points, dtype=np.float64)
+        draw_outline_runs(self.screen, points, [len(points)], [shape['type'] != 'freehand'],
+                          [(0, 1, color, SELECTION_THICKNESS)])
         
         # рисуем маркеры в вершинах
-        for point in shape['points']:
-            pygame.draw.circle(self.screen, color, (int(point[0]), int(point[1])), 4)
+        self.draw_markers(color, points)
+
+    def draw_markers(self, color, points):
+        """маркеры в вершинах points (n, 2) одним вызовом blits
+        из заранее отрисованного спрайта"""
+        sprite = self.markers.get(color)
+        if sprite is None:
+            sprite = self.markers[color] = marker_sprite(color)
+        # как у pygame.draw.circle(..., (int(x), int(y)), радиус)
+        corners = (np.trunc(points) - MARKER_RADIUS).astype(np.int64).tolist()
+        self.screen.blits([(sprite, corner) for corner in corners], doreturn=False)
 
     def calculate_center(self):
         """вычисление центра выделенных фигур"""
         if len(self.selected_shape_indices) == 0:
             return None
         
-        total_x = 0
-        total_y = 0
-        point_count = 0
-        
-        for idx in self.selected_shape_indices:
-            if idx < len(self.shapes):
-                shape = self.shapes[idx]
-                for point in shape['points']:
-                    total_x += point[0]
-                    total_y += point[1]
-                    point_count += 1
+        # сумма вершин выделения поддерживается при каждом изменении
+        total, point_count = self.selected_shape_indices.vertex_sum()
+        total_x, total_y = total.tolist()
         
         if point_count > 0:
             center_x = total_x // point_count
@@ -445,7 +863,8 @@ class DrawingApp:
         if not center_pos or not self.show_center:
             return
         
-        x, y = int(center_pos[0]), int(center_pos[1])
+        world_x, world_y = int(center_pos[0]), int(center_pos[1])
+        x, y = (int(c) for c in self.world_to_screen(center_pos))
         
         # перекрестие
         cross_size = 10
@@ -458,8 +877,8 @@ class DrawingApp:
         pygame.draw.circle(self.screen, CENTER_COLOR, (x, y), 15, 2)
         
         # координаты центра
-        coord_text = self.small_font.render(
-            f"({x}, {y})", True, CENTER_COLOR)
+        coord_text = self.text_cache.render(
+            self.small_font, f"({world_x}, {world_y})", CENTER_COLOR)
         text_rect = coord_text.get_rect(center=(x, y - 25))
         
         # фон для текста
@@ -469,6 +888,24 @@ class DrawingApp:
                         text_rect.inflate(10, 5), 1)
         self.screen.blit(coord_text, text_rect)
 
+    def current_center(self):
+        """центр, который сейчас показывается на экране"""
+        if not self.selected_shape_indices:
+            return None
+        if self.fixed_center is not None:
+            return self.fixed_center
+        return self.calculate_center()
+
+    def center_overlay_rect(self, center_pos):
+        """область экрана, занятая отрисовкой центра"""
+        if not center_pos or not self.show_center:
+            return None
+        world_x, world_y = int(center_pos[0]), int(center_pos[1])
+        x, y = (int(c) for c in self.world_to_screen(center_pos))
+        coord_text = self.text_cache.render(self.small_font, f"({world_x}, {world_y})", CENTER_COLOR)
+        text_rect = coord_text.get_rect(center=(x, y - 25))
+        return pygame.Rect(x - 16, y - 16, 33, 33).union(text_rect.inflate(12, 7))
+
     def handle_ui_click(self, pos):
         """обработка кликов по интерфейсу"""
         for tool in self.ui_elements['tools']:
@@ -498,9 +935,16 @@ class DrawingApp:
             self.save_image()
             return True
 
+        if self.ui_elements['save_scene_button']['rect'].collidepoint(pos):
+            self.save_scene()
+            return True
+
+        if self.ui_elements['load_scene_button']['rect'].collidepoint(pos):
+            self.load_scene()
+            return True
+
         if self.ui_elements['clear_button']['rect'].collidepoint(pos):
-            self.shapes.clear()
-            self.selected_shape_indices.clear()
+            self.clear_shapes()
             return True
 
         if self.ui_elements['deselect_button']['rect'].collidepoint(pos):
@@ -508,7 +952,7 @@ class DrawingApp:
             return True
 
         if self.ui_elements['select_all_button']['rect'].collidepoint(pos):
-            self.selected_shape_indices = set(range(len(self.shapes)))
+            self.selected_shape_indices.select_all()
             return True
             
         if self.ui_elements['center_button']['rect'].collidepoint(pos):
@@ -518,12 +962,75 @@ class DrawingApp:
 
         return False
 
-    def handle_events(self):
+    def coalesce_events(self, events):
+        """склейка серий MOUSEMOTION и MOUSEWHEEL в одно событие на кадр"""
+        result = []
+        for event in events:
+            prev = result[-1] if result else None
+            if prev is not None and event.type == prev.type == pygame.MOUSEMOTION:
+                # перетаскивание считает смещение от last_mouse_pos,
+                # поэтому достаточно последней позиции серии; промежуточные
+                # нужны только ломаной от руки - они копятся в trail
+                trail = getattr(prev, 'trail', None) or [prev.pos]
+                trail.append(event.pos)
+                event.trail = trail
+                result[-1] = event
+            elif prev is not None and event.type == prev.type == pygame.MOUSEWHEEL:
+                steps = prev.steps + [event.y]
+                result[-1] = pygame.event.Event(pygame.MOUSEWHEEL, x=prev.x + event.x,
+                                                y=prev.y + event.y, steps=steps,
+                                                **self.wheel_state(event))
+            elif event.type == pygame.MOUSEWHEEL:
+                result.append(pygame.event.Event(pygame.MOUSEWHEEL, x=event.x,
+                                                 y=event.y, steps=[event.y],
+                                                 **self.wheel_state(event)))
+            else:
+                result.append(event)
+        return result
+
+    def wheel_state(self, event):
+        """модификаторы и позиция курсора, записанные в событии колеса
+        (так их передаёт воспроизведение журнала); в живых событиях их нет"""
+        return {name: getattr(event, name) for name in ('mod', 'pos') if hasattr(event, name)}
+
+    def wheel_matrix(self, y, scaling):
+        """матрица поворота или масштабирования вокруг фиксированного центра
+        для одного щелчка колеса"""
+        cx, cy = self.fixed_center
+
+        T1 = self.translation_matrix(-cx, -cy)
+        T2 = self.translation_matrix(cx, cy)
+
+        if scaling:
+            # масштабирование
+            scale_factor = 1 + y * 0.1
+            S = self.scale_matrix(scale_factor)
+            # Правильный порядок: сначала T1, потом S, потом T2
+            return self.multiply_matrices(T2, self.multiply_matrices(S, T1))
+        # поворот
+        angle = y * 0.1
+        R = self.rotation_matrix(angle)
+        # Правильный порядок: сначала T1, потом R, потом T2
+        return self.multiply_matrices(T2, self.multiply_matrices(R, T1))
+
+    def handle_events(self, events=None):
         """обработка всех событий"""
-        for event in pygame.event.get():
+        if events is None:
+            events = pygame.event.get()
+        if self.recorder is not None:
+            self.recorder.record(events)
+        for event in self.coalesce_events(events):
             if event.type == pygame.QUIT:
                 return False
 
+            if event.type == IMAGE_SAVED:
+                self.image_saved(event)
+            elif event.type == TOAST_EXPIRED:
+                self.toast = None
+            elif event.type == AUTOSAVE_EVENT:
+                self.autosave()
+            # SESSION_UPDATE только будит цикл: правки применяет sync_session
+
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_r:
                     self.current_tool = 'rectangle'
@@ -531,41 +1038,70 @@ class DrawingApp:
                 elif event.key == pygame.K_t:
                     self.current_tool = 'triangle'
                     self.update_ui_active_states()
+                elif event.key == pygame.K_f:
+                    self.current_tool = 'freehand'
+                    self.update_ui_active_states()
+                elif event.key == pygame.K_z and self.ctrl_pressed:
+                    if getattr(event, 'mod', 0) & pygame.KMOD_SHIFT:
+                        self.redo()
+                    else:
+                        self.undo()
+                elif event.key == pygame.K_y and self.ctrl_pressed:
+                    self.redo()
                 elif event.key == pygame.K_c:
-                    self.shapes.clear()
-                    self.selected_shape_indices.clear()
+                    self.clear_shapes()
                 elif event.key == pygame.K_s:
                     self.save_image()
+                elif event.key == pygame.K_w:
+                    self.save_scene()
+                elif event.key == pygame.K_l:
+                    self.load_scene()
+                elif event.key == pygame.K_e:
+                    self.export_scene_file()
+                elif event.key == pygame.K_i and self.ctrl_pressed:
+                    self.selected_shape_indices.invert()
+                elif event.key == pygame.K_i:
+                    self.import_scene_file()
                 elif event.key == pygame.K_ESCAPE:
                     self.drawing = False
+                    self.stroke = None
                     self.start_pos = None
                     self.dragging_selected = False
                     self.selecting = False
                     self.selection_rect = None
                 elif event.key == pygame.K_DELETE:
-                    if self.selected_shape_indices:
-                        indices_to_delete = sorted(self.selected_shape_indices, reverse=True)
-                        for idx in indices_to_delete:
-                            if idx < len(self.shapes):
-                                del self.shapes[idx]
-                        self.selected_shape_indices.clear()
+                    self.delete_selected_shapes()
                 elif event.key == pygame.K_a:
-                    self.selected_shape_indices = set(range(len(self.shapes)))
+                    self.selected_shape_indices.select_all()
                 elif event.key == pygame.K_LCTRL or event.key == pygame.K_RCTRL:
                     self.ctrl_pressed = True
                 elif event.key == pygame.K_SPACE:
                     self.show_center = not self.show_center
                     self.update_ui_active_states()
+                elif event.key == pygame.K_F3:
+                    self.profiler.toggle_hud()
+                elif event.key == pygame.K_F4:
+                    self.dump_trace()
+                elif event.key == RECORD_KEY:
+                    self.toggle_recording()
+                    self.update_ui_active_states()
+                elif event.key == pygame.K_HOME:
+                    self.reset_view()
 
             elif event.type == pygame.KEYUP:
                 if event.key == pygame.K_LCTRL or event.key == pygame.K_RCTRL:
                     self.ctrl_pressed = False
                     # выделение фигуры
+            if event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+                # жест закончился или начинается новый - отложенное
+                # преобразование переносится в вершины (нужно и для поиска фигур)
+                self.bake_transform()
+
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:  # левая кнопка мыши
                     if not self.handle_ui_click(event.pos):
                         if event.pos[1] > 50:
-                            clicked_shape_index = self.find_shape_at_point(event.pos)
+                            clicked_shape_index = self.find_shape_at_point(self.screen_to_world(event.pos))
                             
                             if clicked_shape_index != -1:
                                 # кликнули на фигуру
@@ -580,25 +1116,11 @@ class DrawingApp:
                                     if clicked_shape_index in self.selected_shape_indices:
                                         # начинаем перетаскивание всех выбранных фигур
                                         self.dragging_selected = True
+                                        self.gesture = self.history.new_gesture()
                                         self.last_mouse_pos = event.pos
-                                        self.drag_offsets.clear()
-                                        for idx in self.selected_shape_indices:
-                                            shape = self.shapes[idx]
-                                            # для новой структуры с points
-                                            if 'points' in shape:
-                                                self.drag_offsets[idx] = (
-                                                    shape['points'][0][0] - event.pos[0],
-                                                    shape['points'][0][1] - event.pos[1]
-                                                )
-                                            else:
-                                                # для обратной совместимости
-                                                self.drag_offsets[idx] = (
-                                                    shape['start'][0] - event.pos[0],
-                                                    shape['start'][1] - event.pos[1]
-                                                )
                                     else:
                                         # кликнули на другую фигуру
-                                        self.selected_shape_indices = {clicked_shape_index}
+                                        self.selected_shape_indices.replace([clicked_shape_index])
                                         self.dragging_selected = False
                             else:
                                 # кликнули в пустое место
@@ -610,12 +1132,16 @@ class DrawingApp:
                                     self.selecting = True
                                 else:
                                     self.drawing = True
+                                    if self.current_tool == 'freehand':
+                                        # допуск упрощения - доля экранного пикселя при текущем масштабе
+                                        self.stroke = Stroke(self.screen_to_world(event.pos),
+                                                             STROKE_TOLERANCE / self.zoom)
                                 
                                 self.last_pos = event.pos
 
-                elif event.button == 3:  # правая кнопка мыши
-                    # можно использовать для контекстного меню, пока ничего не делаем
-                    pass
+                elif event.button == 3:  # правая кнопка мыши - сдвиг вида
+                    self.panning = True
+                    self.pan_anchor = event.pos
 
             elif event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1:
@@ -625,42 +1151,65 @@ class DrawingApp:
                                abs(self.start_pos[0] - event.pos[0]),
                                abs(self.start_pos[1] - event.pos[1]))
                         
-                        found_indices = self.find_shapes_in_rect(rect)
+                        x, y = self.screen_to_world(rect[:2])
+                        zoom = self.zoom
+                        found_indices = self.find_shapes_in_rect(
+                            (x, y, rect[2] / zoom, rect[3] / zoom))
                         if self.ctrl_pressed:
                             self.selected_shape_indices.update(found_indices)
                         else:
-                            self.selected_shape_indices = set(found_indices)
+                            self.selected_shape_indices.replace(found_indices)
                     
+                    elif self.drawing and self.stroke is not None:
+                        # ломаная может закончиться там же, где началась
+                        self.stroke.add(self.screen_to_world(event.pos))
+                        points = self.stroke.finish()
+                        if points is not None:
+                            self.add_stroke(points)
+
                     elif self.drawing and self.start_pos and self.start_pos != event.pos:
                         end_pos = event.pos
                         if end_pos[1] > 50:
-                            self.add_shape(self.start_pos, end_pos)
+                            self.add_shape(self.screen_to_world(self.start_pos),
+                                           self.screen_to_world(end_pos))
                     
                     self.drawing = False
+                    self.stroke = None
                     self.selecting = False
                     self.dragging_selected = False
                     self.start_pos = None
                     self.selection_rect = None
-                    self.drag_offsets.clear()
-                    self.preview_surface.fill((0, 0, 0, 0))
+                    self.preview_layer.clear()
+                    self.marquee_layer.clear()
                     self.fixed_center = None  # сбрасываем фиксированный центр
+                    self.gesture = None
+                elif event.button == 3:
+                    self.panning = False
+                    self.pan_anchor = None
 
             elif event.type == pygame.MOUSEMOTION:
-                if self.dragging_selected and self.selected_shape_indices and self.last_mouse_pos:
+                if self.panning and self.pan_anchor:
+                    self.pan_view(event.pos[0] - self.pan_anchor[0],
+                                  event.pos[1] - self.pan_anchor[1])
+                    self.pan_anchor = event.pos
+
+                elif self.dragging_selected and self.selected_shape_indices and self.last_mouse_pos:
                     # перетаскивание с использованием матрицы переноса
                     dx = event.pos[0] - self.last_mouse_pos[0]
                     dy = event.pos[1] - self.last_mouse_pos[1]
                     
-                    matrix = self.translation_matrix(dx, dy)
-                    
-                    for idx in self.selected_shape_indices:
-                        if idx < len(self.shapes):
-                            self.apply_matrix_to_shape(self.shapes[idx], matrix)
+                    # смещение мыши в экранных пикселях переводится в мировые единицы
+                    matrix = self.translation_matrix(dx / self.zoom, dy / self.zoom)
+                    self.apply_matrix_to_selection(matrix)
                     
                     self.last_mouse_pos = event.pos
                     
                 elif self.drawing or self.selecting:
                     self.last_pos = event.pos
+                    if self.stroke is not None:
+                        # все отсчёты серии, склеенной в одно событие
+                        self.stroke.extend(self.screen_to_world(pos)
+                                           for pos in getattr(event, 'trail', (event.pos,)))
                     if self.drawing:
                         self.update_preview()
                     elif self.selecting:
@@ -670,95 +1219,396 @@ class DrawingApp:
                             abs(self.start_pos[0] - self.last_pos[0]),
                             abs(self.start_pos[1] - self.last_pos[1])
                         )
+                        self.update_marquee()
 
             elif event.type == pygame.MOUSEWHEEL:
-                if self.selected_shape_indices:
+                if self.ctrl_pressed:
+                    # ctrl + колесо - масштаб вида вокруг курсора
+                    anchor = getattr(event, 'pos', None) or pygame.mouse.get_pos()
+                    for y in event.steps:
+                        self.zoom_view(ZOOM_STEP ** y, anchor)
+                elif self.selected_shape_indices:
                     # Вычисляем центр один раз и фиксируем его для всей серии трансформаций
                     if self.fixed_center is None:
                         self.fixed_center = self.calculate_center()
+                        self.gesture = self.history.new_gesture()
                         print(f"Центр зафиксирован: {self.fixed_center}")  # для отладки
                     
                     if self.fixed_center:
-                        cx, cy = self.fixed_center
-                        
-                        T1 = self.translation_matrix(-cx, -cy)
-                        T2 = self.translation_matrix(cx, cy)
+                        mods = getattr(event, 'mod', None)
+                        if mods is None:
+                            mods = pygame.key.get_mods()
+                        scaling = bool(mods & pygame.KMOD_SHIFT)
                         
-                        keys = pygame.key.get_pressed()
+                        # склеенные щелчки колеса дают одну общую матрицу
+                        matrix = None
+                        for y in event.steps:
+                            step = self.wheel_matrix(y, scaling)
+                            matrix = step if matrix is None else self.multiply_matrices(step, matrix)
                         
-                        if keys[pygame.K_LSHIFT] or keys[pygame.K_RSHIFT]:
-                            # масштабирование
-                            scale_factor = 1 + event.y * 0.1
-                            S = self.scale_matrix(scale_factor)
-                            # Правильный порядок: сначала T1, потом S, потом T2
-                            matrix = self.multiply_matrices(T2,
-                                     self.multiply_matrices(S, T1))
-                        else:
-                            # поворот
-                            angle = event.y * 0.1
-                            R = self.rotation_matrix(angle)
-                            # Правильный порядок: сначала T1, потом R, потом T2
-                            matrix = self.multiply_matrices(T2,
-                                     self.multiply_matrices(R, T1))
-                        
-                        for idx in self.selected_shape_indices:
-                            self.apply_matrix_to_shape(self.shapes[idx], matrix)
+                        self.apply_matrix_to_selection(matrix)
                 else:
                     # если ничего не выделено, меняем толщину
-                    self.thickness += event.y
-                    self.thickness = max(1, min(10, self.thickness))
+                    for y in event.steps:
+                        self.thickness += y
+                        self.thickness = max(1, min(10, self.thickness))
                     self.update_ui_active_states()
 
         return True
 
+    def stroke_screen_points(self):
+        """вершины рисуемой ломаной в экранных координатах (n, 2)"""
+        return self.stroke.points() * self.zoom + self.pan
+
+    def preview_rect(self):
+        """область экрана, занятая предпросмотром новой фигуры"""
+        margin = self.screen_thickness(self.thickness) + 2
+        if self.drawing and self.stroke is not None:
+            pts = self.stroke_screen_points()
+            x0, y0 = np.floor(pts.min(axis=0)).tolist()
+            x1, y1 = np.ceil(pts.max(axis=0)).tolist()
+            return pygame.Rect(x0, y0, x1 - x0 + 1, y1 - y0 + 1).inflate(2 * margin, 2 * margin)
+        if not (self.drawing and self.start_pos and self.last_pos) or self.last_pos[1] <= 50:
+            return None
+        xs = (self.start_pos[0], self.last_pos[0])
+        ys = (self.start_pos[1], self.last_pos[1])
+        return pygame.Rect(min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)).inflate(
+            2 * margin, 2 * margin)
+
     def update_preview(self):
         """обновление предпросмотра фигуры"""
-        self.preview_surface.fill((0, 0, 0, 0))
-        if self.start_pos and self.last_pos and self.drawing:
-            if self.last_pos[1] > 50:
-                # создаем временные точки для предпросмотра
-                if self.current_tool == 'rectangle':
-                    points = self.create_rectangle_points(self.start_pos, self.last_pos)
-                else:
-                    points = self.create_triangle_points(self.start_pos, self.last_pos)
-                
-                preview_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-                pygame.draw.polygon(preview_surface, (*self.current_color, 128), points, self.thickness)
-                self.preview_surface.blit(preview_surface, (0, 0))
+        rect = self.preview_rect()
+        if rect is None:
+            self.preview_layer.clear()
+            return
+        if self.stroke is not None:
+            # ломаная уже упрощена - рисуется целиком одним вызовом
+            surface = self.preview_layer.begin(rect)
+            local_points = (self.stroke_screen_points() - rect.topleft).tolist()
+            if len(local_points) > 1:
+                pygame.draw.lines(surface, (*self.current_color, 128), False, local_points,
+                                  self.screen_thickness(self.thickness))
+            return
+        # создаем временные точки для предпросмотра
+        if self.current_tool == 'rectangle':
+            points = self.create_rectangle_points(self.start_pos, self.last_pos)
+        elif self.current_tool == 'triangle':
+            points = self.create_triangle_points(self.start_pos, self.last_pos)
+        else:
+            points = [self.start_pos, self.last_pos]
+        
+        # рисуем в локальных координатах поверхности размером с фигуру
+        surface = self.preview_layer.begin(rect)
+        local_points = [(x - rect.x, y - rect.y) for x, y in points]
+        pygame.draw.polygon(surface, (*self.current_color, 128), local_points,
+                            self.screen_thickness(self.thickness))
+
+    def update_marquee(self):
+        """обновление полупрозрачного прямоугольника выделения"""
+        if not self.selection_rect:
+            self.marquee_layer.clear()
+            return
+        rect = pygame.Rect(self.selection_rect)
+        surface = self.marquee_layer.begin(rect)
+        local_rect = pygame.Rect(0, 0, rect.width, rect.height)
+        pygame.draw.rect(surface, (*SELECTION_COLOR, 64), local_rect, 2)
+        pygame.draw.rect(surface, (*SELECTION_COLOR, 32), local_rect, 0)
 
     def draw_shapes(self):
-        """отрисовка всех фигур"""
-        for i, shape in enumerate(self.shapes):
-            pygame.draw.polygon(self.screen,
-                                shape['color'],
-                                shape['points'],
-                                shape['thickness'])
-            
-            # рисуем обводку выделения для выбранных фигур
-            if i in self.selected_shape_indices:
-                is_multi = len(self.selected_shape_indices) > 1
-                self.draw_selection_highlight(shape, is_multi)
+        """отрисовка фигур, попадающих на экран"""
+        full = self.draw_lod(self.screen, self.screen.get_rect(), self.visible_shape_indices(),
+                             self.selected_shape_indices)
+        self.draw_shape_indices(self.screen, full)
+
+        # выбранные фигуры - поверх остальных, с обводкой и отложенной матрицей
+        self.draw_selected_shapes()
+
+        self.draw_overlays()
+
+    def screen_transform(self, origin=(0, 0), matrix=None):
+        """(offset, матрица) для DrawList: экранные координаты на поверхности
+        с левым верхним углом в экранной точке origin - вершины * zoom + offset,
+        а если задана матрица matrix - вершины через view * matrix"""
+        px, py = self.pan
+        if matrix is None:
+            return (px - origin[0], py - origin[1]), None
+        m = np.asarray(self.view, dtype=np.float64) @ matrix
+        m[0, 2] -= origin[0]
+        m[1, 2] -= origin[1]
+        return None, m
+
+    def draw_lod(self, surface, rect, indices, exclude=None):
+        """упрощённая отрисовка мелких фигур из indices в экранной области rect
+        (левый верхний угол surface - rect.topleft): фигуры меньше пикселя -
+        точками плотности, чуть крупнее - залитыми прямоугольниками;
+        возвращает индексы фигур, которые нужно нарисовать полностью"""
+        idx = np.asarray(indices, dtype=np.int64)
+        if exclude:
+            idx = idx[~exclude.contains(idx)]
+        points, boxes = lod_masks(self.shapes.bounds(idx), self.zoom)
+        if points.any():
+            self.lod.draw(surface, rect, self.zoom, self.pan, exclude)
+        if boxes.any():
+            self.draw_boxes(surface, idx[boxes], rect.topleft)
+        return idx[~(points | boxes)]
+
+    def draw_boxes(self, surface, indices, origin=(0, 0)):
+        """фигуры indices залитыми ограничивающими прямоугольниками"""
+        b = self.shapes.bounds(indices)
+        zoom = self.zoom
+        px, py = self.pan
+        shift = (px - origin[0], py - origin[1], px - origin[0], py - origin[1])
+        screen = b * zoom + shift
+        x0 = np.floor(screen[:, 0])
+        y0 = np.floor(screen[:, 1])
+        w = np.maximum(1, np.ceil(screen[:, 2]) - x0)
+        h = np.maximum(1, np.ceil(screen[:, 3]) - y0)
+        rects = np.stack((x0, y0, w, h), axis=1).astype(np.int64).tolist()
+        for color, rect in zip(self.shapes.colors[indices].tolist(), rects):
+            surface.fill(color, rect)
+
+    def draw_shape_indices(self, surface, indices, origin=(0, 0)):
+        """отрисовка фигур indices на поверхность surface"""
+        self.draw_list.draw(surface, indices, self.zoom, *self.screen_transform(origin))
+
+    def selected_visible_indices(self):
+        """выбранные фигуры, попадающие на экран, по возрастанию"""
+        idx = self.selected_shape_indices.indices()
+        b = self.shapes.bounds(idx)
+        if self.selected_shape_indices.pending is not None:
+            b = transform_boxes(b, self.selected_shape_indices.pending)
+        x0, y0 = self.screen_to_world((0, 0))
+        x1, y1 = self.screen_to_world(self.screen.get_size())
+        margin = 6 + 2 / self.zoom
+        return idx[(b[:, 0] <= x1 + margin) & (b[:, 2] >= x0 - margin) &
+                   (b[:, 1] <= y1 + margin) & (b[:, 3] >= y0 - margin)]
+
+    def draw_selected_shapes(self):
+        """отрисовка выбранных фигур вместе с обводкой поверх остальных"""
+        is_multi = len(self.selected_shape_indices) > 1
+        offset, matrix = self.screen_transform(matrix=self.selected_shape_indices.pending)
+        vertices, counts, closed = self.draw_list.draw(self.screen, self.selected_visible_indices(),
+                                                       self.zoom, offset, matrix)
+        # у всех обводок один цвет - они рисуются одной серией, порядок неважен
+        color = MULTI_SELECTION_COLOR if is_multi else SELECTION_COLOR
+        draw_outline_runs(self.screen, vertices, counts, closed,
+                          [(0, len(counts), color, SELECTION_THICKNESS)])
+        self.draw_markers(color, vertices)
+
+    def selection_overlay_rect(self):
+        """область экрана, занятая выбранными фигурами и их маркерами"""
+        if not self.selected_shape_indices:
+            return None
+        box, thickness = self.selection_box()
+        if self.selected_shape_indices.pending is not None:
+            box = transform_boxes(box[None], self.selected_shape_indices.pending)[0]
+        margin = self.screen_thickness(thickness) + 6  # толщина + маркеры вершин
+        x0, y0 = np.floor(self.world_to_screen(box[0:2])).tolist()
+        x1, y1 = np.ceil(self.world_to_screen(box[2:4])).tolist()
+        # выделение может уходить далеко за экран - обрезаем до его окрестности
+        width, height = self.screen.get_size()
+        x0, x1 = max(x0, -margin), min(x1, width + margin)
+        y0, y1 = max(y0, -margin), min(y1, height + margin)
+        if x1 < x0 or y1 < y0:
+            return None
+        return pygame.Rect(x0, y0, x1 - x0, y1 - y0).inflate(2 * margin, 2 * margin)
 
+    def draw_overlays(self):
+        """отрисовка прямоугольника выделения и центра"""
         # прямоугольник выделения
         if self.selecting and self.selection_rect:
-            rect_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-            rect_surface.fill((0, 0, 0, 0))
-            pygame.draw.rect(rect_surface, (*SELECTION_COLOR, 64), 
-                           self.selection_rect, 2)
-            pygame.draw.rect(rect_surface, (*SELECTION_COLOR, 32), 
-                           self.selection_rect, 0)
-            self.screen.blit(rect_surface, (0, 0))
+            self.marquee_layer.blit_to(self.screen)
         
         # рисуем центр выделенных фигур (используем фиксированный центр, если он есть)
         if self.selected_shape_indices:
-            if self.fixed_center is not None:
-                self.draw_center(self.fixed_center)
-            else:
-                center = self.calculate_center()
-                self.draw_center(center)
+            self.draw_center(self.current_center())
 
-    def save_image(self):
-        """сохранение изображения"""
+        self.draw_toast(self.screen)
+
+    def show_toast(self, text, color=(0, 128, 0)):
+        """всплывающее уведомление, которое само скрывается через TOAST_DURATION"""
+        self.toast = (text, color)
+        # повторный вызов перезапускает таймер
+        pygame.time.set_timer(TOAST_EXPIRED, TOAST_DURATION, loops=1)
+
+    def toast_rect(self):
+        """область экрана, занятая уведомлением"""
+        if self.toast is None:
+            return None
+        text = self.text_cache.render(self.font, *self.toast)
+        return text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)).inflate(20, 10)
+
+    def draw_toast(self, surface):
+        """отрисовка уведомления по центру экрана"""
+        if self.toast is None:
+            return
+        text = self.text_cache.render(self.font, *self.toast)
+        rect = self.toast_rect()
+        pygame.draw.rect(surface, (250, 250, 250), rect)
+        pygame.draw.rect(surface, self.toast[1], rect, 1)
+        surface.blit(text, text.get_rect(center=rect.center))
+
+    def hud_surface(self):
+        """панель профилировщика; перерисовывается только при смене текста"""
+        text = self.profiler.hud_text
+        if text is None:
+            return None
+        if self._hud_surface is None or self._hud_surface[0] != text:
+            lines = [self.small_font.render(line, True, (255, 255, 255)) for line in text]
+            width = max(line.get_width() for line in lines) + 2 * HUD_MARGIN
+            height = sum(line.get_height() for line in lines) + 2 * HUD_MARGIN
+            surface = pygame.Surface((width, height))
+            surface.fill((40, 40, 40))
+            y = HUD_MARGIN
+            for line in lines:
+                surface.blit(line, (HUD_MARGIN, y))
+                y += line.get_height()
+            self._hud_surface = (text, surface)
+        return self._hud_surface[1]
+
+    def hud_rect(self):
+        """область экрана, занятая панелью профилировщика"""
+        surface = self.hud_surface()
+        if surface is None:
+            return None
+        return surface.get_rect(topright=(SCREEN_WIDTH - HUD_MARGIN, 50 + HUD_MARGIN))
+
+    def draw_hud(self, surface):
+        """отрисовка панели профилировщика в правом верхнем углу"""
+        hud = self.hud_surface()
+        if hud is not None:
+            surface.blit(hud, self.hud_rect())
+
+    def dump_trace(self, filename=None):
+        """запись трассы кадров из буфера профилировщика (открывается
+        в chrome://tracing или Perfetto)"""
+        if filename is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = os.path.join(self.saves_directory(), f"trace_{timestamp}.json")
+        try:
+            self.profiler.dump_trace(filename)
+            print(f"трасса сохранена: {filename} ({len(self.profiler)} кадров)")
+            self.show_toast("трасса сохранена")
+        except Exception as e:
+            print(f"ошибка при сохранении трассы: {e}")
+        return filename
+
+    def toggle_recording(self):
+        """начало или конец записи событий ввода в saves/events_*.drwe;
+        рядом сохраняется снимок сцены, с которой запись началась"""
+        if self.recorder is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self.recording_path = os.path.join(self.saves_directory(),
+                                               f"events_{timestamp}{EVENTS_EXTENSION}")
+            self.bake_transform()
+            try:
+                write_scene(scene_path(self.recording_path), self.shapes)
+            except Exception as e:
+                print(f"ошибка при сохранении сцены для записи: {e}")
+                return None
+            self.recorder = EventRecorder(app_state(self))
+            print(f"запись событий: {self.recording_path}")
+            self.show_toast("запись событий...", CENTER_COLOR)
+            return None
+        recorder, self.recorder = self.recorder, None
+        try:
+            recorder.save(self.recording_path)
+            print(f"записано событий: {len(recorder)} ({recorder.frame} кадров): {self.recording_path}")
+            self.show_toast("запись сохранена")
+        except Exception as e:
+            print(f"ошибка при сохранении записи: {e}")
+        return self.recording_path
+
+    def join_session(self, host=SESSION_HOST, port=SESSION_PORT):
+        """подключение к общей сессии: сцена заменяется общей, дальше свои
+        правки уходят остальным участникам, а их правки применяются здесь"""
+        self.bake_transform()
+        session = SessionClient(self, host, port, notify=lambda: pygame.event.post(
+            pygame.event.Event(SESSION_UPDATE)))
+        try:
+            session.connect()
+        except OSError as e:
+            print(f"не удалось подключиться к сессии {host}:{port}: {e}")
+            return False
+        self.session = session
+        print(f"сессия {host}:{port}: участник {session.number}, фигур: {len(self.shapes)}")
+        return True
+
+    def sync_session(self):
+        """обмен правками с общей сессией (раз в кадр)"""
+        if self.session is None or self.session.sync():
+            return
+        print(f"сессия завершена: {self.session.error}")
+        self.show_toast("сессия завершена", CENTER_COLOR)
+        self.session.close()
+        self.session = None
+
+    def session_status(self):
+        """строка состояния общей сессии"""
+        return self.session.status() if self.session is not None else None
+
+    def open_journal(self, directory=None, **options):
+        """восстановление сцены из журнала правок (контрольная точка и правки
+        после неё) и запись в него всех дальнейших правок; options - интервалы
+        SceneJournal"""
+        if directory is None:
+            directory = os.path.join(self.saves_directory(), JOURNAL_DIRECTORY)
+        journal = SceneJournal(directory, **options)
+        try:
+            replica = journal.recover()
+        except JournalLockedError as e:
+            # журнал ведёт другое окно - это работает без журнала, а не пишет в чужой
+            print(f"{e}: правки этого окна в журнал не записываются")
+            return False
+        except (OSError, JournalError) as e:
+            # нечитаемый журнал не перезаписываем - его можно разобрать вручную
+            print(f"ошибка при чтении журнала: {e}")
+            journal.close()
+            return False
+        if replica is not None and len(replica.shapes):
+            self.bake_transform()
+            self.selected_shape_indices.clear()
+            self.fixed_center = None
+            self.history.clear()
+            store = replica.shapes
+            self.shapes.load_arrays(store.vertices, store.offsets, store.types, store.colors,
+                                    store.thickness, store.legacy, store.bounds(), store.sums,
+                                    store.ids)
+            self.spatial_index.rebuild(self.shapes.bounds())
+            print(f"сцена восстановлена из журнала: {len(self.shapes)} фигур "
+                  f"({journal.replayed} записей)")
+        journal.start(self.shapes)
+        self.journal = journal
+        return True
+
+    def idle_timeout(self):
+        """сколько мс циклу 'event' можно ждать событий (0 - сколько угодно):
+        незаконченный жест должен попасть в журнал, даже если мышь замерла"""
+        if self.journal is not None and self.selected_shape_indices.pending is not None:
+            return max(1, int(self.journal.sync_interval * 1000))
+        return 0
+
+    def sync_journal(self):
+        """правки кадра - в журнал (раз в кадр); незаконченный жест переносится
+        в вершины не реже интервала записи, чтобы и он пережил сбой"""
+        journal = self.journal
+        if journal is None:
+            return
+        if self.selected_shape_indices.pending is not None and journal.stale():
+            self.bake_transform()
+        if journal.sync():
+            return
+        print(f"журнал остановлен: {journal.error}")
+        self.show_toast("ошибка журнала", CENTER_COLOR)
+        journal.close()
+        self.journal = None
+
+    def end_frame(self, events):
+        """закрытие кадра профилировщика с размером сцены"""
+        self.profiler.end_frame(len(events), len(self.shapes), self.shapes.vertex_count)
+
+    def saves_directory(self):
+        """папка saves рядом с программой (создаётся при необходимости)"""
         program_dir = os.path.dirname(os.path.abspath(__file__))
         saves_dir = os.path.join(program_dir, 'saves')
 
@@ -766,51 +1616,291 @@ class DrawingApp:
             os.makedirs(saves_dir)
             print(f"создана папка: {saves_dir}")
 
+        return saves_dir
+
+    def save_scene(self, filename=None):
+        """сохранение векторной сцены в бинарный файл"""
+        if filename is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = os.path.join(self.saves_directory(), f"scene_{timestamp}{SCENE_EXTENSION}")
+
+        self.bake_transform()
+        try:
+            write_scene(filename, self.shapes)
+            print(f"сцена сохранена: {filename}")
+        except Exception as e:
+            print(f"ошибка при сохранении сцены: {e}")
+        return filename
+
+    def latest_scene_file(self):
+        """самый свежий файл сцены в папке saves"""
+        saves_dir = self.saves_directory()
+        scenes = [os.path.join(saves_dir, name) for name in os.listdir(saves_dir)
+                  if name.endswith(SCENE_EXTENSION)]
+        return max(scenes, key=os.path.getmtime) if scenes else None
+
+    def load_scene(self, filename=None):
+        """загрузка сцены; массивы отображаются из файла через mmap"""
+        if filename is None:
+            filename = self.latest_scene_file()
+            if filename is None:
+                print("нет сохранённых сцен")
+                return False
+
+        try:
+            arrays = read_scene(filename)
+        except Exception as e:
+            print(f"ошибка при загрузке сцены: {e}")
+            return False
+
+        self.selected_shape_indices.clear()
+        self.fixed_center = None
+        self.history.clear()
+        self.shapes.load_arrays(*arrays)
+        self.spatial_index.rebuild(self.shapes.bounds())
+        # для остальных участников и журнала загрузка - очистка и добавление всех фигур
+        self.publish('cleared')
+        self.publish('added', range(len(self.shapes)))
+        print(f"сцена загружена: {filename} ({len(self.shapes)} фигур)")
+        return True
+
+    def start_task(self, name, steps):
+        """запуск пошаговой задачи; steps - генератор доли выполненной работы"""
+        self.tasks.append({'name': name, 'steps': steps, 'progress': 0.0})
+
+    def step_tasks(self, budget=TASK_BUDGET):
+        """выполнение шагов задач, пока не исчерпан бюджет кадра"""
+        deadline = time.perf_counter() + budget
+        while self.tasks and time.perf_counter() < deadline:
+            task = self.tasks[0]
+            try:
+                task['progress'] = next(task['steps'])
+            except StopIteration:
+                self.tasks.pop(0)
+                print(f"{task['name']}: готово")
+            except Exception as e:
+                self.tasks.pop(0)
+                print(f"ошибка ({task['name']}): {e}")
+
+    def task_status(self):
+        """строка прогресса текущей задачи для строки состояния"""
+        if not self.tasks:
+            return None
+        task = self.tasks[0]
+        return f"{task['name']}: {int(task['progress'] * 100)}%"
+
+    def export_scene_file(self, filename=None):
+        """потоковый экспорт сцены в JSONL или SVG (по расширению);
+        без имени файла - оба формата в папку saves"""
+        if filename is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            base = os.path.join(self.saves_directory(), f"scene_{timestamp}")
+            for extension in (JSONL_EXTENSION, SVG_EXTENSION):
+                self.export_scene_file(base + extension)
+            return
+        # снимок колонок: сцену можно менять, пока экспорт идёт по кадрам
+        self.bake_transform()
+        snapshot = self.shapes.copy()
+        steps = export_steps(snapshot, filename, SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.start_task(f"экспорт {os.path.basename(filename)}", steps)
+
+    def latest_exchange_file(self):
+        """самый свежий файл JSONL или SVG в папке saves"""
+        saves_dir = self.saves_directory()
+        files = [os.path.join(saves_dir, name) for name in os.listdir(saves_dir)
+                 if name.endswith((JSONL_EXTENSION, SVG_EXTENSION))]
+        return max(files, key=os.path.getmtime) if files else None
+
+    def import_scene_file(self, filename=None):
+        """потоковый импорт JSONL или SVG пачками между кадрами"""
+        if filename is None:
+            filename = self.latest_exchange_file()
+            if filename is None:
+                print("нет файлов для импорта")
+                return
+        steps = import_steps(filename, self.add_shapes)
+        self.start_task(f"импорт {os.path.basename(filename)}", steps)
+
+    def drawing_snapshot(self):
+        """копия области рисования; дальше с ней работает фоновый поток"""
+        return self.screen.subsurface(
+            (0, 50, SCREEN_WIDTH, SCREEN_HEIGHT - 50 - 30)
+        ).copy()
+
+    def save_image(self):
+        """сохранение изображения: кодирование и запись идут в фоне,
+        о завершении сообщает событие IMAGE_SAVED"""
+        saves_dir = self.saves_directory()
+
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = os.path.join(saves_dir, f"drawing_{timestamp}.png")
 
         try:
-            drawing_surface = self.screen.subsurface(
-                (0, 50, SCREEN_WIDTH, SCREEN_HEIGHT - 50 - 30)
-            )
-            pygame.image.save(drawing_surface, filename)
-            print(f"изображение сохранено: {filename}")
-        
-            notification_text = self.font.render("сохранено!", True, (0, 128, 0))
-            notification_rect = notification_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
-            self.screen.blit(notification_text, notification_rect)
-            pygame.display.flip()
-            pygame.time.wait(500)
+            self.image_saver.save(self.drawing_snapshot(), filename)
         except Exception as e:
             print(f"ошибка при сохранении: {e}")
+        return filename
+
+    def autosave(self):
+        """автосохранение в saves/autosave.png, если сцена изменилась;
+        не чаще autosave_interval и без очереди из нескольких записей"""
+        if self.shapes.version == self.autosaved_version:
+            return False
+        if not self.image_saver.autosave_due(self.autosave_interval):
+            return False
+        self.autosaved_version = self.shapes.version
+        filename = os.path.join(self.saves_directory(), AUTOSAVE_FILENAME)
+        self.image_saver.save(self.drawing_snapshot(), filename, autosave=True)
+        return True
+
+    def image_saved(self, event):
+        """обработка завершения фоновой записи изображения"""
+        self.image_saver.finished(event)
+        if event.error:
+            print(f"ошибка при сохранении: {event.error}")
+            self.show_toast("ошибка сохранения", CENTER_COLOR)
+        elif not event.autosave:
+            print(f"изображение сохранено: {event.filename}")
+            self.show_toast("сохранено!")
 
     def run(self):
         """основной цикл программы"""
+        if self.loop_mode == 'event':
+            self.run_event_driven()
+        else:
+            self.run_fixed_rate()
+
+        if self.recorder is not None:
+            self.toggle_recording()
+        if self.session is not None:
+            self.session.close()
+        if self.journal is not None:
+            self.bake_transform()
+            self.journal.close()
+
+        # дожидаемся незавершённых записей изображений
+        self.image_saver.shutdown()
+        pygame.quit()
+        sys.exit()
+
+    def run_fixed_rate(self):
+        """цикл с опросом событий и постоянной частотой кадров"""
         clock = pygame.time.Clock()
+        profiler = self.profiler
         running = True
 
         while running:
-            running = self.handle_events()
-
-            self.screen.fill(BACKGROUND_COLOR)
-
-            self.draw_shapes()
-
-            if self.drawing and self.start_pos and self.last_pos:
-                self.screen.blit(self.preview_surface, (0, 0))
-
-            self.draw_ui()
-
-            pygame.display.flip()
-            clock.tick(60)
+            t = profiler.clock()
+            events = pygame.event.get()
+            running = self.handle_events(events)
+            t = profiler.lap('events', t)
+            self.step_tasks()
+            self.sync_session()
+            self.sync_journal()
+            profiler.lap('tasks', t)
+
+            # перерисовываются только изменившиеся области экрана
+            self.renderer.render()
+
+            t = profiler.clock()
+            clock.tick(FPS)
+            profiler.lap('wait', t)
+            self.end_frame(events)
+
+    def run_event_driven(self):
+        """цикл, который спит в pygame.event.wait, пока нет событий"""
+        clock = pygame.time.Clock()
+        profiler = self.profiler
+        running = True
 
-        pygame.quit()
-        sys.exit()
+        self.renderer.render()
+        while running:
+            # блокируемся до первого события, затем забираем всё накопившееся;
+            # пока идут фоновые задачи, не спим
+            t = profiler.clock()
+            events = [] if self.tasks else [pygame.event.wait(self.idle_timeout())]
+            t = profiler.lap('wait', t)
+            events.extend(pygame.event.get())
+            running = self.handle_events(events)
+            t = profiler.lap('events', t)
+            self.step_tasks()
+            self.sync_session()
+            self.sync_journal()
+            profiler.lap('tasks', t)
+
+            # кадр рисуется только если состояние изменилось
+            self.renderer.render()
+
+            # ограничение частоты: пока идёт поток событий, они копятся
+            # и склеиваются в следующую пачку
+            t = profiler.clock()
+            clock.tick(FPS)
+            profiler.lap('wait', t)
+            self.end_frame(events)
 
 
 def main():
     app = DrawingApp()
+    if JOURNAL_ENABLED:
+        app.open_journal()
     app.run() 
 
+def headless_display():
+    """подкоманды без окна: видеодрайвер переключается на dummy
+    (pygame.init уже выполнен при импорте модуля)"""
+    if pygame.display.get_driver() != 'dummy':
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        pygame.display.quit()
+        pygame.display.init()
+
+def render_main(argv=None):
+    """пакетная отрисовка сцен без окна: python drawapp.py render <папка>"""
+    from headless import render_cli
+    return render_cli(argv)
+
+def bench_main(argv=None):
+    """замеры горячих путей без окна: python drawapp.py bench [--compare base.json]"""
+    from benchmark import bench_cli
+    headless_display()
+    return bench_cli(argv)
+
+def replay_main(argv=None):
+    """воспроизведение записанных событий без окна: python drawapp.py replay журнал.drwe"""
+    from recorder import replay_cli
+    headless_display()
+    return replay_cli(argv)
+
+def serve_main(argv=None):
+    """сервер общей сессии: python drawapp.py serve [--port 8765] [--scene сцена.drws]"""
+    from session import serve_cli
+    return serve_cli(argv)
+
+def join_main(argv=None):
+    """окно - участник общей сессии: python drawapp.py join [адрес[:порт]]"""
+    address = (argv or [''])[0]
+    host, _, port = address.partition(':')
+    app = DrawingApp()
+    if not app.join_session(host or SESSION_HOST, int(port or SESSION_PORT)):
+        return 1
+    app.run()
+
+def stress_main(argv=None):
+    """синтетическая нагрузка без окна: python drawapp.py stress --shapes 1000000 --gestures 1000000"""
+    from recorder import stress_cli
+    headless_display()
+    return stress_cli(argv)
+
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['render']:
+        sys.exit(render_main(sys.argv[2:]))
+    if sys.argv[1:2] == ['bench']:
+        sys.exit(bench_main(sys.argv[2:]))
+    if sys.argv[1:2] == ['replay']:
+        sys.exit(replay_main(sys.argv[2:]))
+    if sys.argv[1:2] == ['stress']:
+        sys.exit(stress_main(sys.argv[2:]))
+    if sys.argv[1:2] == ['serve']:
+        sys.exit(serve_main(sys.argv[2:]))
+    if sys.argv[1:2] == ['join']:
+        sys.exit(join_main(sys.argv[2:]))
     main()
\ No newline at end of file
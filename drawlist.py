@@ -0,0 +1,304 @@
+import numpy as np
+import pygame
+
+from geometry import rectangle_outlines, triangle_outlines
+from shapestore import OPEN_TYPES, TYPE_CODES, index_array
+
+MARKER_RADIUS = 4  # радиус маркера вершины выбранной фигуры
+
+
+def marker_sprite(color, radius=MARKER_RADIUS):
+    """маркер вершины, заранее отрисованный на прозрачной поверхности;
+    блит в (x - radius, y - radius) даёт те же пиксели, что
+    pygame.draw.circle(surface, color, (x, y), radius)"""
+    sprite = pygame.Surface((2 * radius, 2 * radius), pygame.SRCALPHA)
+    pygame.draw.circle(sprite, color, (radius, radius), radius)
+    return sprite
+
+
+RASTER_MAX_PIXELS = 256  # контуры длиннее быстрее рисует сам pygame
+RASTER_MIN_RUN = 4  # в сериях короче запись массивом дороже вызовов pygame
+PIXEL_TYPES = {1: np.uint8, 2: np.uint16, 4: np.uint32}  # байт на пиксель -> тип буфера
+
+
+def _segment_pixels(starts, deltas, width, pitch):
+    """номера пикселей отрезков starts -> starts + deltas (целые экранные
+    координаты) толщиной width в буфере с pitch пикселей в строке, по
+    порядку отрезков - те же пиксели, что рисует pygame
+
+    это его Брезенхэм в замкнутой форме: шаг k по большей оси и
+    (k * minor + (major - 1) // 2) // major по меньшей (частное - в
+    плавающей точке с запасом 1e-9: дробные частные отстоят от целых
+    не меньше чем на 1 / major, так что на экранных координатах округление
+    точное); при толщине больше 1 каждый пиксель тянется на width поперёк -
+    по x, если отрезок не положе диагонали, иначе по y"""
+    dx, dy = np.abs(deltas).T
+    along_x = dx > dy
+    major = np.maximum(dx, dy)
+    minor = np.minimum(dx, dy)
+    step_x = np.where(deltas[:, 0] < 0, -1, 1)
+    step_y = np.where(deltas[:, 1] < 0, -pitch, pitch)
+    along = np.where(along_x, step_x, step_y).astype(np.int32)
+    across = np.where(along_x, step_y, step_x).astype(np.int32)
+    base = (starts[:, 1] * pitch + starts[:, 0]).astype(np.int32)
+    n = major + 1
+    div = np.maximum(major, 1)
+    slope = minor / div
+    shift = np.maximum(major - 1, 0) // 2 / div + 1e-9
+    k = np.arange(int(n.sum()), dtype=np.int32) - np.repeat((np.cumsum(n) - n).astype(np.int32), n)
+    t = (k * np.repeat(slope, n) + np.repeat(shift, n)).astype(np.int32)
+    pixels = np.repeat(base, n) + np.repeat(along, n) * k + np.repeat(across, n) * t
+    if width > 1:
+        spread = np.repeat(np.where(along_x, pitch, 1).astype(np.int32), n)
+        offsets = np.arange(1 - width % 2 - width // 2, width // 2 + 1, dtype=np.int32)
+        pixels = (pixels[:, None] + spread[:, None] * offsets).ravel()
+    return pixels
+
+
+def draw_outline_runs(surface, vertices, counts, closed, runs):
+    """контуры сериями: vertices - экранные вершины подряд, counts - вершин
+    на контур, closed - флаги замкнутости, runs - [(начало, конец, цвет,
+    толщина), ...] по контурам; серии рисуются по порядку
+
+    небольшие контуры длинных серий, целиком лежащие внутри области
+    отсечения, растеризуются все вместе массивами (по проходу на каждую
+    толщину), и каждая серия записывается в пиксели поверхности одним
+    присваиванием; остальные рисуются как раньше, вызовом pygame на контур:
+    длинные контуры и короткие серии pygame рисует быстрее, а выходящие
+    за область отсечения отрезки он отсекает со своими округлениями"""
+    if not len(counts):
+        return
+    counts = np.asarray(counts, dtype=np.int64)
+    closed = np.asarray(closed, dtype=bool)
+    lengths = [stop - start for start, stop, _, _ in runs]
+    widths = np.repeat([width for _, _, _, width in runs], lengths)
+    long_runs = np.repeat(np.array(lengths) >= RASTER_MIN_RUN, lengths)
+    first = np.cumsum(counts) - counts
+    # как (int) в pygame: отбрасывание дробной части
+    points = np.trunc(vertices).astype(np.int64)
+
+    raster = np.zeros(len(counts), dtype=bool)
+    pixel_type = PIXEL_TYPES.get(surface.get_bytesize())
+    if pixel_type is not None and long_runs.any():
+        # отрезки контуров; замыкающий у незамкнутых отбрасывается
+        last = first + counts - 1
+        ends = np.arange(1, len(points) + 1)
+        ends[last] = first
+        keep = np.ones(len(points), dtype=bool)
+        keep[last[~closed]] = False
+        owner = np.repeat(np.arange(len(counts)), counts)[keep]
+        starts = points[keep]
+        deltas = points[ends[keep]] - starts
+        sizes = (np.abs(deltas).max(axis=1) + 1) * widths[owner]
+        sizes = np.bincount(owner, sizes, minlength=len(counts)).astype(np.int64)
+        clip = surface.get_clip()
+        half = widths // 2
+        low = np.minimum.reduceat(points, first) - half[:, None]
+        high = np.maximum.reduceat(points, first) + half[:, None]
+        raster = (long_runs & (sizes <= RASTER_MAX_PIXELS) &
+                  (low[:, 0] >= clip.left) & (low[:, 1] >= clip.top) &
+                  (high[:, 0] < clip.right) & (high[:, 1] < clip.bottom))
+
+    # по серии: пиксели растеризованных контуров (срез общего массива их
+    # толщины) и номера контуров, которые рисует pygame
+    run_starts = np.array([start for start, _, _, _ in runs], dtype=np.int64)
+    run_stops = np.array([stop for _, stop, _, _ in runs], dtype=np.int64)
+    slices = [None] * len(runs)
+    if raster.any():
+        pitch = surface.get_pitch() // surface.get_bytesize()
+        run_widths = widths[run_starts]
+        for width in np.unique(widths[raster]).tolist():
+            chosen = raster & (widths == width)
+            segments = chosen[owner]
+            pixels = _segment_pixels(starts[segments], deltas[segments], width, pitch)
+            done = np.concatenate(([0], np.cumsum(np.where(chosen, sizes, 0))))
+            here = np.flatnonzero(run_widths == width)
+            for r, low, high in zip(here.tolist(), done[run_starts[here]].tolist(),
+                                    done[run_stops[here]].tolist()):
+                if high > low:
+                    slices[r] = pixels[low:high]
+        target = np.frombuffer(surface.get_buffer(), dtype=pixel_type)
+        mask = (1 << 8 * surface.get_bytesize()) - 1
+        mapped = {}
+    rest = np.flatnonzero(~raster)
+    cuts = np.searchsorted(rest, run_starts).tolist() + [len(rest)]
+    rest = rest.tolist()
+    polygon = pygame.draw.polygon
+    lines = pygame.draw.lines
+    for (_, _, color, width), pixels, a, b in zip(runs, slices, cuts, cuts[1:]):
+        if pixels is not None:
+            value = mapped.get(color)
+            if value is None:
+                value = mapped[color] = surface.map_rgb(color) & mask
+            target[pixels] = value
+        for i in rest[a:b]:
+            shape_points = vertices[first[i]:first[i] + counts[i]].tolist()
+            if closed[i]:
+                polygon(surface, color, shape_points, width)
+            else:
+                lines(surface, color, False, shape_points, width)
+    if raster.any():
+        del target  # снимает блокировку поверхности
+
+
+class DrawList:
+    """контуры фигур хранилища, подготовленные к отрисовке
+
+    pygame рисует один многоугольник за вызов, и на десятках тысяч мелких
+    фигур время уходит на вызовы и работу Python вокруг них; здесь она
+    делается заранее и массивами:
+
+    - мировые вершины контуров всех фигур лежат подряд в одном массиве
+      (у старых фигур - углы start/end, дополненные до длины контура:
+      сам контур по ним строится уже на экране, как раньше); на кадр они
+      переводятся на экран одной операцией на группу фигур с одинаковым
+      числом вершин контура
+    - фигуры собраны в группы по (цвет, толщина); подряд идущие в порядке
+      фигур фигуры одной группы - серия, которая растеризуется целиком
+      (draw_outline_runs); серии не переставляются, так что порядок
+      перекрытий не меняется
+
+    кэш обновляется только для фигур, изменившихся после прошлой
+    синхронизации (changed_since); целиком - при сдвиге индексов или
+    изменении числа вершин фигуры"""
+
+    def __init__(self, store):
+        self.store = store
+        self._structure = None  # structure_version, при которой собран кэш
+        self._version = None  # версия хранилища, до которой учтены изменения
+        self._counts = np.zeros(0, dtype=np.int64)  # вершин в контуре (старые фигуры - 3 или 4)
+        self._first = np.zeros(1, dtype=np.int64)  # начало контура фигуры в _outlines
+        self._outlines = np.zeros((0, 2))  # мировые вершины контуров подряд
+        self._groups = np.zeros(0, dtype=np.int64)  # номер группы фигуры
+        self._keys = {}  # (цвет, толщина) -> номер группы
+        self._colors = []  # цвет группы кортежем
+        self._thickness = np.zeros(0, dtype=np.int64)  # толщина группы
+
+    def _outline_counts(self, idx):
+        store = self.store
+        counts = store.vertex_counts[idx]
+        legacy = store.legacy[idx]
+        rect = store.types[idx] == TYPE_CODES['rectangle']
+        return np.where(legacy, np.where(rect, 4, 3), counts)
+
+    def _sources(self, idx, counts):
+        """мировые вершины контуров фигур idx подряд; у старых фигур -
+        углы start/end, последний повторяется до длины контура"""
+        store = self.store
+        stored = np.where(store.legacy[idx], 2, counts)
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        k = np.arange(int(counts.sum())) - starts
+        rows = np.repeat(store.offsets[idx], counts) + np.minimum(k, np.repeat(stored, counts) - 1)
+        return store.vertices[rows]
+
+    def _group(self, idx):
+        """номера групп фигур idx; новые сочетания получают новые номера"""
+        store = self.store
+        groups = []
+        added = []
+        for color, thickness in zip(store.colors[idx].tolist(), store.thickness[idx].tolist()):
+            key = (tuple(color), thickness)
+            group = self._keys.get(key)
+            if group is None:
+                group = self._keys[key] = len(self._keys)
+                added.append(key)
+            groups.append(group)
+        if added:
+            self._colors.extend(key[0] for key in added)
+            self._thickness = np.concatenate((self._thickness, [key[1] for key in added]))
+        return np.array(groups, dtype=np.int64)
+
+    def _rebuild(self):
+        store = self.store
+        idx = np.arange(len(store))
+        self._counts = self._outline_counts(idx)
+        self._first = np.zeros(len(idx) + 1, dtype=np.int64)
+        np.cumsum(self._counts, out=self._first[1:])
+        self._outlines = self._sources(idx, self._counts)
+        # группы заново: сочетания удалённых фигур не копятся
+        rows = np.column_stack((store.colors, store.thickness)).astype(np.int64)
+        unique, groups = np.unique(rows, axis=0, return_inverse=True)
+        self._groups = groups.reshape(-1)
+        self._colors = [tuple(row[:3]) for row in unique.tolist()]
+        self._thickness = unique[:, 3].copy()
+        self._keys = {key: i for i, key in enumerate(zip(self._colors, self._thickness.tolist()))}
+
+    def sync(self):
+        """учёт изменений хранилища с прошлой синхронизации"""
+        store = self.store
+        if self._structure != store.structure_version or len(store) < len(self._counts):
+            self._rebuild()
+        elif self._version != store.version:
+            changed = store.changed_since(self._version)
+            counts = self._outline_counts(changed)
+            known = len(self._counts)
+            old = changed < known  # changed по возрастанию: новые фигуры - в конце
+            if (counts[old] != self._counts[changed[old]]).any():
+                self._rebuild()  # у фигуры стало другое число вершин - сдвигаются все следующие
+            else:
+                fresh = changed[~old]
+                if len(fresh):
+                    # добавленные в конец фигуры дописываются
+                    self._counts = np.concatenate((self._counts, counts[~old]))
+                    self._first = np.concatenate((self._first, self._first[-1] + np.cumsum(counts[~old])))
+                    self._outlines = np.concatenate((self._outlines, self._sources(fresh, counts[~old])))
+                    self._groups = np.concatenate((self._groups, np.zeros(len(fresh), dtype=np.int64)))
+                if len(changed):
+                    rows = np.repeat(self._first[changed], counts) + \
+                        np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+                    self._outlines[rows] = self._sources(changed, counts)
+                    self._groups[changed] = self._group(changed)
+        self._structure = store.structure_version
+        self._version = store.version
+
+    def outlines(self, indices, zoom, offset, matrix=None):
+        """экранные контуры фигур indices в их порядке: вершины подряд (n, 2),
+        число вершин и замкнутость каждого контура и серии отрисовки
+        [(начало, конец, цвет, толщина), ...] по подряд идущим фигурам одной
+        группы; экранные координаты - вершины * zoom + offset или, если
+        задана матрица 3x3, вершины через matrix (камера уже включена в неё)"""
+        self.sync()
+        store = self.store
+        idx = index_array(indices)
+        counts = self._counts[idx]
+        if not len(idx):
+            return np.zeros((0, 2)), counts, np.zeros(0, dtype=bool), []
+        legacy = store.legacy[idx]
+        first = self._first[idx]
+        outlines = self._outlines
+        if matrix is not None:
+            m = np.asarray(matrix, dtype=np.float64)
+            rot, shift = m[:2, :2].T, m[:2, 2]
+
+        starts = np.cumsum(counts) - counts
+        vertices = np.empty((int(counts.sum()), 2))
+        for count in np.unique(counts).tolist():
+            sel = np.flatnonzero(counts == count)
+            pts = outlines[first[sel][:, None] + np.arange(count)]
+            if matrix is None:
+                pts = pts * zoom + offset
+            else:
+                pts = (pts.reshape(-1, 2) @ rot + shift).reshape(pts.shape)
+            # старые фигуры: контур строится по экранным углам start/end
+            old = np.flatnonzero(legacy[sel])
+            if len(old):
+                build = rectangle_outlines if count == 4 else triangle_outlines
+                pts[old] = build(pts[old, 0], pts[old, 1])
+            vertices[starts[sel][:, None] + np.arange(count)] = pts
+
+        groups = self._groups[idx]
+        begin = np.flatnonzero(np.concatenate(([True], groups[1:] != groups[:-1])))
+        run_groups = groups[begin]
+        widths = np.maximum(1, np.rint(self._thickness[run_groups] * zoom)).astype(np.int64)
+        colors = self._colors
+        runs = list(zip(begin.tolist(), begin[1:].tolist() + [len(idx)],
+                        [colors[g] for g in run_groups.tolist()], widths.tolist()))
+        return vertices, counts, ~OPEN_TYPES[store.types[idx]], runs
+
+    def draw(self, surface, indices, zoom, offset, matrix=None):
+        """отрисовка контуров фигур indices сериями по группам (draw_outline_runs);
+        возвращает их экранные вершины подряд, число вершин и замкнутость
+        каждого контура"""
+        vertices, counts, closed, runs = self.outlines(indices, zoom, offset, matrix)
+        draw_outline_runs(surface, vertices, counts, closed, runs)
+        return vertices, counts, closed
@@ -0,0 +1,227 @@
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+
+from shapestore import SHAPE_TYPES
+
+JSONL_EXTENSION = '.jsonl'
+SVG_EXTENSION = '.svg'
+JSONL_FORMAT = 'drawapp-scene'
+JSONL_VERSION = 1
+
+CHUNK_SHAPES = 10000  # фигур в одной пачке записи/чтения
+SVG_NS = 'http://www.w3.org/2000/svg'
+
+_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+# --- экспорт ---
+
+def iter_records(store, chunk_size=CHUNK_SHAPES):
+    """фигуры хранилища как словари; колонки читаются пачками через tolist"""
+    offsets = store.offsets
+    for start in range(0, len(store), chunk_size):
+        stop = min(start + chunk_size, len(store))
+        base = int(offsets[start])
+        verts = store.vertices[base:int(offsets[stop])].tolist()
+        bounds = (offsets[start:stop + 1] - base).tolist()
+        types = store.types[start:stop].tolist()
+        colors = store.colors[start:stop].tolist()
+        thickness = store.thickness[start:stop].tolist()
+        legacy = store.legacy[start:stop].tolist()
+        for k in range(stop - start):
+            points = verts[bounds[k]:bounds[k + 1]]
+            record = {'type': SHAPE_TYPES[types[k]]}
+            if legacy[k]:
+                # старая структура с start/end сохраняется как есть
+                record['start'], record['end'] = points[0], points[1]
+            else:
+                record['points'] = points
+            record['color'] = colors[k]
+            record['thickness'] = thickness[k]
+            yield record
+
+
+def iter_jsonl_lines(records, total=None):
+    """строки построчного JSON; первая строка - заголовок формата"""
+    yield json.dumps({'format': JSONL_FORMAT, 'version': JSONL_VERSION, 'shapes': total}) + '\n'
+    for record in records:
+        yield json.dumps(record, separators=(',', ':')) + '\n'
+
+
+def _svg_color(color):
+    return 'rgb({},{},{})'.format(*color)
+
+
+def svg_view_box(store, width, height):
+    """область SVG (x, y, ширина, высота) по границам фигур с запасом на
+    половину толщины линии; пустая сцена - экран width x height"""
+    if not len(store):
+        return 0, 0, width, height
+    bounds = store.bounds()
+    pad = int(store.thickness.max()) / 2
+    min_x, min_y = bounds[:, 0].min() - pad, bounds[:, 1].min() - pad
+    max_x, max_y = bounds[:, 2].max() + pad, bounds[:, 3].max() + pad
+    return float(min_x), float(min_y), float(max_x - min_x), float(max_y - min_y)
+
+
+def iter_svg_lines(records, view_box):
+    """строки SVG-документа: многоугольники, ломаные от руки - polyline,
+    а для старой структуры - линии"""
+    x, y, width, height = view_box
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield (f'<svg xmlns="{SVG_NS}" width="{width!r}" height="{height!r}" '
+           f'viewBox="{x!r} {y!r} {width!r} {height!r}">\n<g fill="none">\n')
+    for record in records:
+        common = (f'stroke="{_svg_color(record["color"])}" '
+                  f'stroke-width="{record["thickness"]}" data-type="{record["type"]}"')
+        if 'points' in record:
+            points = ' '.join(f'{x!r},{y!r}' for x, y in record['points'])
+            tag = 'polyline' if record['type'] == 'freehand' else 'polygon'
+            yield f'<{tag} points="{points}" {common}/>\n'
+        else:
+            (x1, y1), (x2, y2) = record['start'], record['end']
+            yield f'<line x1="{x1!r}" y1="{y1!r}" x2="{x2!r}" y2="{y2!r}" {common}/>\n'
+    yield '</g>\n</svg>\n'
+
+
+def write_chunked(path, lines, total_lines, chunk_lines=CHUNK_SHAPES):
+    """запись строк пачками; генератор выдаёт долю записанного после каждой пачки"""
+    tmp_path = path + '.tmp'
+    written = 0
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= chunk_lines:
+                f.write(''.join(chunk))
+                written += len(chunk)
+                chunk.clear()
+                yield min(1.0, written / max(total_lines, 1))
+        f.write(''.join(chunk))
+    os.replace(tmp_path, path)
+    yield 1.0
+
+
+def export_steps(store, path, width, height, chunk_size=CHUNK_SHAPES):
+    """экспорт в формат по расширению файла; генератор прогресса 0..1;
+    width и height - размер SVG для пустой сцены"""
+    records = iter_records(store, chunk_size)
+    if path.endswith(SVG_EXTENSION):
+        lines = iter_svg_lines(records, svg_view_box(store, width, height))
+    else:
+        lines = iter_jsonl_lines(records, len(store))
+    return write_chunked(path, lines, len(store) + 3, chunk_size)
+
+
+def export_scene(store, path, width, height, chunk_size=CHUNK_SHAPES):
+    """экспорт целиком (без пошагового выполнения)"""
+    for _ in export_steps(store, path, width, height, chunk_size):
+        pass
+
+
+# --- импорт ---
+
+def iter_jsonl_records(f):
+    """словари фигур из построчного JSON; выдаёт (фигура, позиция в файле)"""
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if 'format' in record:
+            # заголовок файла
+            continue
+        yield record, f.tell()
+
+
+def _parse_color(value):
+    if not value or value == 'none':
+        return (0, 0, 0)
+    if value.startswith('#'):
+        value = value[1:]
+        if len(value) == 3:
+            value = ''.join(c * 2 for c in value)
+        return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+    numbers = _NUMBER.findall(value)
+    if len(numbers) >= 3:
+        return tuple(int(float(n)) for n in numbers[:3])
+    return (0, 0, 0)
+
+
+def _svg_record(element, default_thickness):
+    tag = element.tag.rsplit('}', 1)[-1]
+    attrib = element.attrib
+    record = {
+        'color': _parse_color(attrib.get('stroke')),
+        'thickness': max(1, round(float(attrib.get('stroke-width', default_thickness)))),
+    }
+    if tag in ('polygon', 'polyline'):
+        numbers = [float(n) for n in _NUMBER.findall(attrib.get('points', ''))]
+        record['points'] = list(zip(numbers[0::2], numbers[1::2]))
+        if len(record['points']) < 2:
+            return None
+    elif tag == 'line':
+        record['start'] = (float(attrib.get('x1', 0)), float(attrib.get('y1', 0)))
+        record['end'] = (float(attrib.get('x2', 0)), float(attrib.get('y2', 0)))
+    elif tag == 'rect':
+        x, y = float(attrib.get('x', 0)), float(attrib.get('y', 0))
+        w, h = float(attrib.get('width', 0)), float(attrib.get('height', 0))
+        record['points'] = [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+    else:
+        return None
+    shape_type = attrib.get('data-type')
+    if shape_type is None and tag == 'polyline':
+        shape_type = 'freehand'  # незамкнутая ломаная
+    elif shape_type is None:
+        shape_type = 'triangle' if len(record.get('points', ())) == 3 else 'rectangle'
+    record['type'] = shape_type
+    return record
+
+
+def iter_svg_records(f, default_thickness=2):
+    """словари фигур из SVG, разбор по мере чтения (iterparse) с очисткой
+    уже обработанных элементов; выдаёт (фигура, позиция в файле)"""
+    parents = []
+    for event, element in ET.iterparse(f, events=('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            continue
+        parents.pop()
+        record = _svg_record(element, default_thickness)
+        if record is not None:
+            yield record, f.tell()
+        if parents:
+            # разобранный элемент больше не нужен - дерево не растёт
+            parents[-1].remove(element)
+
+
+def iter_batches(records, batch_size=CHUNK_SHAPES, shape_types=SHAPE_TYPES):
+    """пачки (фигуры, позиция в файле); фигуры неизвестных типов пропускаются"""
+    batch = []
+    position = 0
+    for record, position in records:
+        if record.get('type') not in shape_types:
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch, position
+            batch = []
+    if batch:
+        yield batch, position
+
+
+def import_steps(path, add_batch, batch_size=CHUNK_SHAPES):
+    """импорт по расширению файла: add_batch получает пачки фигур;
+    генератор выдаёт долю прочитанного файла"""
+    total = os.path.getsize(path) or 1
+    with open(path, 'rb') as f:
+        if path.endswith(SVG_EXTENSION):
+            records = iter_svg_records(f)
+        else:
+            records = iter_jsonl_records(f)
+        for batch, position in iter_batches(records, batch_size):
+            add_batch(batch)
+            yield min(1.0, position / total)
+    yield 1.0
@@ -0,0 +1,150 @@
+import numpy as np
+
+HIT_TOLERANCE = 5  # допуск попадания в прямоугольник (мировые единицы)
+
+
+def as_points(points):
+    """точки массивом (n, 2) float64; одна точка (x, y) - массив (1, 2)"""
+    return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+
+def transform_points(points, matrix):
+    """аффинное преобразование точек (n, 2) матрицей 3x3 одной операцией"""
+    m = np.asarray(matrix, dtype=np.float64)
+    return as_points(points) @ m[:2, :2].T + m[:2, 2]
+
+
+def transform_boxes(bounds, matrix):
+    """ограничивающие прямоугольники (k, 4) после аффинного преобразования
+    (по четырём углам каждого)"""
+    m = np.asarray(matrix, dtype=np.float64)
+    xs = bounds[:, [0, 2, 2, 0]]
+    ys = bounds[:, [1, 1, 3, 3]]
+    tx = m[0, 0] * xs + m[0, 1] * ys + m[0, 2]
+    ty = m[1, 0] * xs + m[1, 1] * ys + m[1, 2]
+    return np.stack((tx.min(axis=1), ty.min(axis=1), tx.max(axis=1), ty.max(axis=1)), axis=1)
+
+
+def polygon_bounds(vertices, starts):
+    """границы (k, 4) min_x, min_y, max_x, max_y для фигур, чьи вершины
+    лежат в vertices подряд с позиций starts (как у ShapeStore.offsets[:-1])"""
+    bounds = np.empty((len(starts), 4), dtype=np.float64)
+    if len(starts):
+        bounds[:, 0:2] = np.minimum.reduceat(vertices, starts, axis=0)
+        bounds[:, 2:4] = np.maximum.reduceat(vertices, starts, axis=0)
+    return bounds
+
+
+def points_in_boxes(points, bounds, tolerance=0.0):
+    """попадание точек в прямоугольники min_x, min_y, max_x, max_y (края включены);
+    формы points (..., 2) и bounds (..., 4) согласуются по правилам numpy,
+    например points[:, None] и bounds[None] дают матрицу точка x фигура"""
+    p = np.asarray(points, dtype=np.float64)
+    b = np.asarray(bounds, dtype=np.float64)
+    x, y = p[..., 0], p[..., 1]
+    return ((b[..., 0] - tolerance <= x) & (x <= b[..., 2] + tolerance) &
+            (b[..., 1] - tolerance <= y) & (y <= b[..., 3] + tolerance))
+
+
+def _sign(p1, p2, p3):
+    return ((p1[..., 0] - p3[..., 0]) * (p2[..., 1] - p3[..., 1]) -
+            (p2[..., 0] - p3[..., 0]) * (p1[..., 1] - p3[..., 1]))
+
+
+def points_in_triangles(points, p1, p2, p3):
+    """попадание точек в треугольники p1 p2 p3 (стороны включены, обход любой);
+    формы (..., 2) согласуются по правилам numpy, как в points_in_boxes"""
+    p = np.asarray(points, dtype=np.float64)
+    p1, p2, p3 = (np.asarray(v, dtype=np.float64) for v in (p1, p2, p3))
+    d1 = _sign(p, p1, p2)
+    d2 = _sign(p, p2, p3)
+    d3 = _sign(p, p3, p1)
+    has_neg = (d1 < 0) | (d2 < 0) | (d3 < 0)
+    has_pos = (d1 > 0) | (d2 > 0) | (d3 > 0)
+    return ~(has_neg & has_pos)
+
+
+def rectangle_outlines(starts, ends):
+    """вершины прямоугольников (n, 4, 2) по противоположным углам"""
+    s, e = as_points(starts), as_points(ends)
+    return np.stack((s, np.stack((e[:, 0], s[:, 1]), axis=1),
+                     e, np.stack((s[:, 0], e[:, 1]), axis=1)), axis=1)
+
+
+def triangle_outlines(starts, ends):
+    """вершины треугольников (n, 3, 2) по прямоугольнику start/end:
+    основание снизу, вершина посередине сверху (как create_triangle_points)"""
+    s, e = as_points(starts), as_points(ends)
+    base_y = np.maximum(s[:, 1], e[:, 1])
+    top_y = np.minimum(s[:, 1], e[:, 1])
+    mid_x = np.floor_divide(s[:, 0] + e[:, 0], 2)
+    return np.stack((np.stack((s[:, 0], base_y), axis=1),
+                     np.stack((e[:, 0], base_y), axis=1),
+                     np.stack((mid_x, top_y), axis=1)), axis=1)
+
+
+def hit_test(points, bounds, triangles, is_rect, tolerance=HIT_TOLERANCE):
+    """матрица попаданий (n точек, k фигур): прямоугольники проверяются
+    по границам с допуском, остальные фигуры - по треугольникам (k, 3, 2)"""
+    p = as_points(points)[:, None]
+    in_box = points_in_boxes(p, bounds[None], tolerance)
+    tri = np.asarray(triangles, dtype=np.float64)[None]
+    in_tri = points_in_triangles(p, tri[..., 0, :], tri[..., 1, :], tri[..., 2, :])
+    return np.where(is_rect[None], in_box, in_tri)
+
+
+def segment_distances_sq(points, a, b):
+    """квадраты расстояний от точек до отрезков a-b (вырожденный отрезок -
+    точка); формы (..., 2) согласуются по правилам numpy"""
+    p = np.asarray(points, dtype=np.float64)
+    a = np.asarray(a, dtype=np.float64)
+    ab = np.asarray(b, dtype=np.float64) - a
+    ap = p - a
+    length = (ab * ab).sum(axis=-1)
+    # у вырожденного отрезка числитель тоже ноль - ближайшая точка a
+    t = np.clip((ap * ab).sum(axis=-1) / np.where(length > 0, length, 1), 0, 1)
+    d = ap - t[..., None] * ab
+    return (d * d).sum(axis=-1)
+
+
+def points_near_polylines(point, vertices, starts, tolerance=HIT_TOLERANCE):
+    """попадание точки в незамкнутые ломаные: расстояние до ближайшего
+    отрезка не больше tolerance; вершины ломаных (не меньше двух у каждой)
+    лежат в vertices подряд с позиций starts, как у ShapeStore.gather"""
+    starts = np.asarray(starts, dtype=np.int64)
+    if not len(starts):
+        return np.zeros(0, dtype=bool)
+    v = as_points(vertices)
+    near = segment_distances_sq(as_points(point)[0], v[:-1], v[1:]) <= tolerance * tolerance
+    # отрезок от конца одной ломаной к началу следующей не считается
+    near[starts[1:] - 1] = False
+    return np.logical_or.reduceat(near, starts)
+
+
+def simplify_rdp(points, tolerance):
+    """упрощение ломаной Рамера-Дугласа-Пекера: индексы оставленных точек
+    по возрастанию (первая и последняя остаются всегда); выброшенные точки
+    отстоят от упрощённой ломаной не дальше tolerance
+
+    рекурсия заменена стеком, расстояния участка до его хорды считаются
+    одной операцией; хорда - отрезок, так что и замкнутый росчерк
+    (первая точка совпадает с последней) упрощается верно"""
+    pts = as_points(points)
+    keep = np.zeros(len(pts), dtype=bool)
+    if not len(pts):
+        return np.flatnonzero(keep)
+    keep[[0, -1]] = True
+    limit = tolerance * tolerance
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        d = segment_distances_sq(pts[first + 1:last], pts[first], pts[last])
+        k = int(np.argmax(d))
+        if d[k] > limit:
+            k += first + 1
+            keep[k] = True
+            stack.append((first, k))
+            stack.append((k, last))
+    return np.flatnonzero(keep)
@@ -0,0 +1,134 @@
+import os
+
+# без окна: SDL рисует только в память
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pygame
+
+from drawapp import BACKGROUND_COLOR, SCREEN_HEIGHT, SCREEN_WIDTH, DrawingApp
+from exchange import JSONL_EXTENSION, SVG_EXTENSION, import_steps
+from scenefile import SCENE_EXTENSION, read_scene
+
+SCENE_EXTENSIONS = (SCENE_EXTENSION, JSONL_EXTENSION, SVG_EXTENSION)
+
+
+class HeadlessApp(DrawingApp):
+    """DrawingApp без окна и цикла событий: та же отрисовка draw_shapes,
+    но на поверхность в памяти"""
+
+    def __init__(self, size=(SCREEN_WIDTH, SCREEN_HEIGHT)):
+        self.screen = pygame.Surface(size)
+        self.init_scene_state()
+
+    def load(self, path):
+        """загрузка сцены любого поддерживаемого формата; история и жест
+        прежней сцены сбрасываются - процесс отрисовки загружает сцену за
+        сценой, и отменять загрузку незачем"""
+        self.selected_shape_indices.clear()
+        self.fixed_center = None
+        self.gesture = None
+        self.history.clear()
+        if path.endswith(SCENE_EXTENSION):
+            self.shapes.load_arrays(*read_scene(path))
+            self.spatial_index.rebuild(self.shapes.bounds())
+        else:
+            self.shapes.clear()
+            self.spatial_index.clear()
+            for _ in import_steps(path, self.insert_shapes):
+                pass
+
+    def insert_shapes(self, shapes):
+        """пачка импортируемых фигур-словарей: в хранилище и сетку, без команды
+        истории и без рассылки правок"""
+        indices = self.shapes.extend(shapes)
+        if len(indices):
+            self.spatial_index.extend(int(indices[0]), self.shapes.bounds(indices))
+        return indices
+
+    def render(self):
+        """полная отрисовка сцены на поверхность в памяти"""
+        self.screen.fill(BACKGROUND_COLOR)
+        self.draw_shapes()
+        return self.screen
+
+    def render_to_file(self, filename):
+        """отрисовка и сохранение области рисования (как save_image)"""
+        self.render()
+        pygame.image.save(self.drawing_snapshot(), filename)
+
+
+_worker_app = None
+
+
+def _init_worker():
+    global _worker_app
+    pygame.init()
+    _worker_app = HeadlessApp()
+
+
+def render_file(path, output_dir):
+    """отрисовка одного файла сцены в PNG; возвращает
+    (путь, число фигур, время в секундах, ошибка)"""
+    app = _worker_app or HeadlessApp()
+    name = os.path.splitext(os.path.basename(path))[0] + '.png'
+    start = time.perf_counter()
+    try:
+        app.load(path)
+        app.render_to_file(os.path.join(output_dir, name))
+    except Exception as e:
+        return path, 0, time.perf_counter() - start, str(e)
+    return path, len(app.shapes), time.perf_counter() - start, None
+
+
+def scene_files(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.endswith(SCENE_EXTENSIONS))
+
+
+def render_directory(directory, output_dir, jobs=None):
+    """параллельная отрисовка всех сцен папки пулом процессов;
+    возвращает список результатов render_file"""
+    files = scene_files(directory)
+    os.makedirs(output_dir, exist_ok=True)
+    if not files:
+        return []
+    # spawn: дочерние процессы не наследуют состояние SDL родителя
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                             initializer=_init_worker) as pool:
+        futures = [pool.submit(render_file, path, output_dir) for path in files]
+        return [future.result() for future in futures]
+
+
+def render_cli(argv=None):
+    """пакетная отрисовка сцен из командной строки"""
+    parser = argparse.ArgumentParser(description="отрисовка папки сцен в PNG без окна")
+    parser.add_argument('scenes', help="папка со сценами (.drws, .jsonl, .svg)")
+    parser.add_argument('-o', '--output', help="папка для PNG (по умолчанию - папка сцен)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="число процессов (по умолчанию - число ядер)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = render_directory(args.scenes, args.output or args.scenes, args.jobs)
+    elapsed = time.perf_counter() - start
+
+    failed = [(path, error) for path, _, _, error in results if error]
+    for path, error in failed:
+        print(f"ошибка ({path}): {error}")
+    done = len(results) - len(failed)
+    shapes = sum(count for _, count, _, _ in results)
+    rate = done / elapsed if elapsed else 0.0
+    print(f"сцен: {done} из {len(results)}, фигур: {shapes}, время: {elapsed:.2f} с, "
+          f"{rate:.1f} сцен/с, {shapes / elapsed if elapsed else 0.0:.0f} фигур/с")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(render_cli())
@@ -0,0 +1,188 @@
+from collections import deque
+
+import numpy as np
+
+from shapestore import index_array
+
+HISTORY_BUDGET = 64 * 1024 * 1024  # байт на все команды истории
+MATRIX_BYTES = 9 * 8
+
+
+def pack_indices(indices):
+    """компактное хранение индексов: непрерывный диапазон - объект range,
+    иначе отсортированный массив int32/int64"""
+    idx = index_array(indices)
+    if len(idx) > 1 and not (idx[1:] > idx[:-1]).all():
+        idx = np.unique(idx)  # обычно индексы уже отсортированы (выделение, диапазоны)
+    if len(idx) and idx[-1] - idx[0] + 1 == len(idx):
+        return range(int(idx[0]), int(idx[-1]) + 1)
+    if len(idx) and idx[-1] < 2 ** 31:
+        return idx.astype(np.int32)
+    return idx
+
+
+def indices_nbytes(indices):
+    return 0 if isinstance(indices, range) else indices.nbytes
+
+
+def batch_nbytes(batch):
+    return sum(column.nbytes for column in batch.values()) if batch else 0
+
+
+def invert(matrix):
+    """обратная матрица 3x3 или None, если преобразование вырождено"""
+    try:
+        inverse = np.linalg.inv(np.asarray(matrix, dtype=np.float64))
+    except np.linalg.LinAlgError:
+        return None
+    return inverse if np.isfinite(inverse).all() else None
+
+
+class AddCommand:
+    """добавление фигур; данные фигур запоминаются только при отмене (для повтора)"""
+
+    def __init__(self, indices):
+        self.indices = pack_indices(indices)
+        self.batch = None
+
+    @property
+    def nbytes(self):
+        return indices_nbytes(self.indices) + batch_nbytes(self.batch)
+
+    def undo(self, app):
+        self.batch = app.shapes.take(self.indices)
+        app.remove_shapes(self.indices)
+
+    def redo(self, app):
+        app.restore_shapes(self.indices, self.batch)
+        self.batch = None
+
+
+class DeleteCommand:
+    """удаление фигур вместе с их данными для восстановления"""
+
+    def __init__(self, indices, batch):
+        self.indices = pack_indices(indices)
+        self.batch = batch
+
+    @property
+    def nbytes(self):
+        return indices_nbytes(self.indices) + batch_nbytes(self.batch)
+
+    def undo(self, app):
+        app.restore_shapes(self.indices, self.batch)
+
+    def redo(self, app):
+        app.remove_shapes(self.indices)
+
+
+class TransformCommand:
+    """аффинное преобразование фигур indices матрицей 3x3; вершины не хранятся,
+    обратная матрица для отмены считается при записи (inverse)"""
+
+    def __init__(self, indices, matrix, inverse, gesture=None):
+        self.indices = pack_indices(indices)
+        self.matrix = matrix
+        self.inverse = inverse
+        self.gesture = gesture  # команды одного жеста склеиваются
+
+    @property
+    def nbytes(self):
+        return indices_nbytes(self.indices) + 2 * MATRIX_BYTES
+
+    def undo(self, app):
+        app.transform_shapes(self.indices, self.inverse)
+
+    def redo(self, app):
+        app.transform_shapes(self.indices, self.matrix)
+
+
+class History:
+    """история команд для отмены и повтора с ограничением по памяти:
+    при превышении бюджета вытесняются самые старые команды"""
+
+    def __init__(self, compose, budget=HISTORY_BUDGET):
+        self.compose = compose  # умножение матриц 3x3: compose(A, B) = A * B
+        self.budget = budget
+        self._undo = deque()
+        self._redo = []
+        self.nbytes = 0  # память всех команд в обоих стеках
+        self._gestures = 0
+
+    def __len__(self):
+        return len(self._undo)
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def new_gesture(self):
+        """идентификатор для склейки преобразований одного жеста"""
+        self._gestures += 1
+        return self._gestures
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self.nbytes = 0
+
+    def record(self, command):
+        """запись выполненной команды; история повтора сбрасывается"""
+        self.nbytes -= sum(c.nbytes for c in self._redo)
+        self._redo.clear()
+        self._undo.append(command)
+        self.nbytes += command.nbytes
+        self._evict()
+
+    def record_transform(self, indices, matrix, gesture=None):
+        """запись преобразования; шаги одного жеста (серия щелчков колеса,
+        одно перетаскивание) склеиваются в одну команду произведением матриц
+        (обратная - произведением обратных шагов, а не обращением итога)
+
+        вырожденное преобразование отменить нельзя, а команды до него больше
+        не подходят к схлопнутым фигурам - история очищается, возвращается None"""
+        inverse = invert(matrix)
+        if inverse is None:
+            self.clear()
+            return None
+        top = self._undo[-1] if self._undo else None
+        if (gesture is not None and not self._redo and
+                isinstance(top, TransformCommand) and top.gesture == gesture):
+            top.matrix = self.compose(matrix, top.matrix)
+            top.inverse = self.compose(top.inverse, inverse)
+            return top
+        command = TransformCommand(indices, matrix, inverse, gesture)
+        self.record(command)
+        return command
+
+    def undo(self, app):
+        if not self._undo:
+            return None
+        command = self._undo.pop()
+        before = command.nbytes
+        command.undo(app)
+        self._redo.append(command)
+        self.nbytes += command.nbytes - before
+        self._evict()
+        return command
+
+    def redo(self, app):
+        if not self._redo:
+            return None
+        command = self._redo.pop()
+        before = command.nbytes
+        command.redo(app)
+        self._undo.append(command)
+        self.nbytes += command.nbytes - before
+        self._evict()
+        return command
+
+    def _evict(self):
+        while self.nbytes > self.budget and self._undo:
+            self.nbytes -= self._undo.popleft().nbytes
+        if self.nbytes > self.budget:
+            # данные для повтора тоже не помещаются
+            self._redo.clear()
+            self.nbytes = 0
@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+IMAGE_SAVED = pygame.event.custom_type()  # результат записи: filename, error, autosave
+SAVE_WORKERS = 2
+
+
+class ImageSaver:
+    """кодирование PNG и запись файлов в пуле фоновых потоков;
+    о завершении сообщает событием IMAGE_SAVED в очередь pygame"""
+
+    def __init__(self, workers=SAVE_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-save')
+        self.pending = 0  # записи, которые ещё не завершились
+        self._autosave_pending = False
+        self._last_autosave = None
+
+    def save(self, surface, filename, autosave=False):
+        """постановка записи в очередь; surface должна быть копией,
+        которую больше никто не меняет"""
+        self.pending += 1
+        if autosave:
+            self._autosave_pending = True
+        self._pool.submit(self._write, surface, filename, autosave)
+
+    def _write(self, surface, filename, autosave):
+        error = None
+        # у каждого потока свой временный файл: две записи в одно имя не мешают друг другу
+        tmp_path = f"{filename}.{threading.get_ident()}.tmp"
+        try:
+            # запись во временный файл: недописанный PNG никогда не заменит старый
+            with open(tmp_path, 'wb') as f:
+                pygame.image.save(surface, f, os.path.basename(filename))
+            os.replace(tmp_path, filename)
+        except Exception as e:
+            error = str(e)
+        pygame.event.post(pygame.event.Event(IMAGE_SAVED, filename=filename,
+                                             error=error, autosave=autosave))
+
+    def finished(self, event):
+        """учёт завершившейся записи (вызывается из обработчика IMAGE_SAVED)"""
+        self.pending = max(0, self.pending - 1)
+        if event.autosave:
+            self._autosave_pending = False
+
+    def autosave_due(self, interval, now=None):
+        """можно ли запускать автосохранение: не чаще раза в interval секунд
+        и не пока предыдущее ещё пишется"""
+        if self._autosave_pending:
+            return False
+        now = time.monotonic() if now is None else now
+        if self._last_autosave is not None and now - self._last_autosave < interval:
+            return False
+        self._last_autosave = now
+        return True
+
+    def shutdown(self):
+        """ожидание незавершённых записей"""
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,400 @@
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from geometry import transform_points
+from session import (ADD, CLEAR, DELETE, TRANSFORM, SceneReplica, SessionProtocolError,
+                     apply_op, decode_ops, encode_ops)
+from shapestore import index_array
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+JOURNAL_DIRECTORY = 'journal'  # папка журнала внутри saves
+SEGMENT_EXTENSION = '.drwj'
+CHECKPOINT_FILENAME = 'checkpoint.drwc'
+LOCK_FILENAME = 'journal.lock'
+SEGMENT_MAGIC = b'DRWJ'
+CHECKPOINT_MAGIC = b'DRWC'
+JOURNAL_VERSION = 1
+
+# заголовок файла: сигнатура, версия, поколение
+FILE_HEADER = struct.Struct('<4sHQ')
+# запись: длина пачки правок (формат session.encode_ops) и её crc32
+RECORD = struct.Struct('<II')
+
+SYNC_INTERVAL = 0.5  # секунд между fsync журнала (правки за это время пишутся одним сбросом)
+CHECKPOINT_BYTES = 16 << 20  # журнал сворачивается в контрольную точку после стольких байт
+CHECKPOINT_INTERVAL = 60.0  # ... или через столько секунд после прошлой
+
+
+class JournalError(ValueError):
+    """файл журнала не того формата или неизвестной версии"""
+
+
+class JournalLockedError(JournalError):
+    """папка журнала занята другим запущенным окном"""
+
+
+def read_records(path, magic):
+    """(поколение, пачки правок) файла журнала или контрольной точки;
+    чтение останавливается на первой неполной или испорченной записи -
+    это хвост, который не успел записаться до сбоя"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < FILE_HEADER.size:
+        # файл создан, но заголовок не дописан - правок в нём нет
+        return None, []
+    file_magic, version, generation = FILE_HEADER.unpack_from(data)
+    if file_magic != magic:
+        raise JournalError(f"это не файл журнала: {path}")
+    if version != JOURNAL_VERSION:
+        raise JournalError(f"неподдерживаемая версия журнала: {version}")
+    payloads = []
+    offset = FILE_HEADER.size
+    while offset + RECORD.size <= len(data):
+        length, crc = RECORD.unpack_from(data, offset)
+        start = offset + RECORD.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        payloads.append(payload)
+        offset = start + length
+    return generation, payloads
+
+
+class _ReplayScene(SceneReplica):
+    """сцена восстановления: перетаскивание крупного выделения оставляет
+    в журнале много записей подряд с одними и теми же фигурами, поэтому
+    их вершины выбираются один раз, преобразуются всеми матрицами серии
+    по очереди и возвращаются в хранилище, когда серия закончилась; кэш
+    границ и сумм пересчитывается один раз после всех записей"""
+
+    def __init__(self, store=None):
+        super().__init__(store)
+        self.stale = False  # есть преобразования без пересчёта кэшей
+        self._series = None  # (ids, индексы вершин, вершины) текущей серии
+
+    def transform_ids(self, groups):
+        store = self.shapes
+        for ids, matrix in groups:
+            series = self._series
+            if series is None or not np.array_equal(series[0], ids):
+                self.flush()
+                idx = store.index_of(ids)
+                idx = idx[idx >= 0]
+                if not len(idx):
+                    continue
+                vertex_idx, _ = store.gather(idx)
+                series = self._series = (ids, vertex_idx, store.vertices[vertex_idx])
+            # те же строки и те же операции, что у apply_matrices, - результат тот же до бита
+            self._series = (series[0], series[1], transform_points(series[2], matrix))
+
+    def merge_shapes(self, batch):
+        self.flush()
+        return super().merge_shapes(batch)
+
+    def remove_ids(self, ids):
+        self.flush()
+        super().remove_ids(ids)
+
+    def flush(self):
+        """вершины текущей серии - обратно в хранилище"""
+        if self._series is not None:
+            _, vertex_idx, pts = self._series
+            self.shapes.vertices[vertex_idx] = pts
+            self._series = None
+            self.stale = True
+
+    def finish(self):
+        self.flush()
+        if self.stale:
+            self.shapes.refresh()
+
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _fsync_directory(directory):
+    """переименование и удаление файлов надёжны только после fsync папки
+    (на Windows папку так не открыть - там это не нужно)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _lock_file(path):
+    """открытый файл path под исключительной блокировкой; её снимает система,
+    когда файл закрыт или процесс завершился - в том числе при сбое, так что
+    оставшийся после сбоя файл блокировки не мешает восстановлению"""
+    f = open(path, 'a+b')
+    try:
+        if os.name == 'nt':
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        raise JournalLockedError(f"журнал {os.path.dirname(path)} уже открыт другим окном")
+    return f
+
+
+class SceneJournal:
+    """журнал правок сцены для восстановления после сбоя
+
+    правки (добавление, удаление, преобразование, очистка) записываются по
+    постоянным идентификаторам фигур в двоичном формате общей сессии: за
+    кадр - одна запись с crc32 в конце файла текущего поколения; запись и
+    fsync делает фоновый поток, сбрасывая на диск всё накопившееся не чаще
+    раза в sync_interval
+
+    когда журнал вырос до checkpoint_bytes или прошло checkpoint_interval,
+    начинается новое поколение: снимок сцены на этот момент фоновый поток
+    записывает контрольной точкой (атомарно, через временный файл) и удаляет
+    файлы прежних поколений - восстановление читает контрольную точку и
+    не больше пары поколений после неё, а не всю историю правок
+
+    папка журнала принадлежит одному окну: recover блокирует её до close,
+    второе окно с той же папкой получает JournalLockedError"""
+
+    def __init__(self, directory, sync_interval=SYNC_INTERVAL,
+                 checkpoint_bytes=CHECKPOINT_BYTES, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.checkpoint_bytes = checkpoint_bytes
+        self.checkpoint_interval = checkpoint_interval
+        self.store = None
+        self.generation = 0  # поколение файла, в который идут правки
+        self.error = None  # ошибка фонового потока - журнал остановлен
+        self.replayed = 0  # записей прочитано при восстановлении
+        self.records = 0  # записей передано потоку записи
+        self.syncs = 0  # выполнено fsync
+        self.checkpoints = 0  # записано контрольных точек
+        self._ops = []  # правки текущего кадра
+        self._written = 0  # байт журнала после последней контрольной точки
+        self._checkpoint_time = 0.0
+        self._recorded = 0.0  # когда правки последний раз уходили в журнал
+        self._checkpointing = False
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = None  # файл блокировки папки журнала
+
+    def segment_path(self, generation):
+        return os.path.join(self.directory, f"journal_{generation:08d}{SEGMENT_EXTENSION}")
+
+    def checkpoint_path(self):
+        return os.path.join(self.directory, CHECKPOINT_FILENAME)
+
+    def segments(self):
+        """файлы поколений журнала по возрастанию: [(поколение, путь), ...]"""
+        found = []
+        for name in os.listdir(self.directory):
+            stem, extension = os.path.splitext(name)
+            if extension == SEGMENT_EXTENSION and stem.startswith('journal_'):
+                try:
+                    found.append((int(stem[len('journal_'):]), os.path.join(self.directory, name)))
+                except ValueError:
+                    continue
+        return sorted(found)
+
+    # --- восстановление ---
+
+    def recover(self):
+        """сцена из контрольной точки и поколений журнала после неё (SceneReplica)
+        или None, если журнал пуст; JournalLockedError, если папку журнала
+        уже занял другой процесс"""
+        os.makedirs(self.directory, exist_ok=True)
+        if self._lock is None:
+            self._lock = _lock_file(os.path.join(self.directory, LOCK_FILENAME))
+        replica = _ReplayScene()
+        base = 0
+        found = False
+        if os.path.exists(self.checkpoint_path()):
+            generation, payloads = read_records(self.checkpoint_path(), CHECKPOINT_MAGIC)
+            if generation is not None:
+                base = generation
+                found = self._replay(replica, payloads) or found
+        self.generation = base
+        for generation, path in self.segments():
+            if generation < base:
+                continue  # уже в контрольной точке: сбой случился до их удаления
+            _, payloads = read_records(path, SEGMENT_MAGIC)
+            found = self._replay(replica, payloads) or found
+            self.generation = max(self.generation, generation)
+        replica.finish()
+        return replica if found else None
+
+    def _replay(self, replica, payloads):
+        for payload in payloads:
+            try:
+                ops = decode_ops(payload)
+            except SessionProtocolError:
+                break  # запись цела, но не разбирается - дальше не читаем
+            for op in ops:
+                apply_op(replica, op)
+            self.replayed += 1
+        return bool(payloads)
+
+    # --- запись ---
+
+    def start(self, store):
+        """запись правок хранилища store (сцена уже восстановлена в нём)
+        в новое поколение журнала"""
+        self.store = store
+        self._thread = threading.Thread(target=self._run, name='scene-journal', daemon=True)
+        self._thread.start()
+        now = time.monotonic()
+        self._checkpoint_time = now
+        self._recorded = now
+        if self.replayed:
+            # прочитанные поколения сразу сворачиваются: следующему запуску читать меньше
+            self.checkpoint()
+        else:
+            self.generation += 1
+            self._queue.put(('segment', self.generation))
+
+    def added(self, indices):
+        """фигуры indices добавлены"""
+        self._ops.append((ADD, self.store.take(index_array(indices))))
+
+    def removed(self, ids):
+        """фигуры ids удаляются"""
+        self._ops.append((DELETE, np.array(ids, dtype=np.int64)))
+
+    def transformed(self, indices, matrix):
+        """к фигурам indices применена матрица"""
+        ids = self.store.ids[np.unique(index_array(indices))]
+        self._ops.append((TRANSFORM, ids, np.array(matrix, dtype=np.float64)))
+
+    def cleared(self):
+        """удалены все фигуры: предыдущие правки кадра больше не нужны"""
+        self._ops = [(CLEAR,)]
+
+    def stale(self):
+        """правки не уходили в журнал дольше sync_interval"""
+        return time.monotonic() - self._recorded >= self.sync_interval
+
+    def sync(self):
+        """правки кадра одной записью - потоку записи; при необходимости
+        начинается контрольная точка; False, если журнал остановлен ошибкой"""
+        if self.error is not None:
+            return False
+        if self._ops:
+            payload = encode_ops(self._ops)
+            self._ops = []
+            record = RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+            self._written += len(record)
+            self.records += 1
+            self._recorded = time.monotonic()
+            self._queue.put(('write', record))
+        if self._written and not self._checkpointing and (
+                self._written >= self.checkpoint_bytes or
+                time.monotonic() - self._checkpoint_time >= self.checkpoint_interval):
+            self.checkpoint()
+        return self.error is None
+
+    def checkpoint(self):
+        """новое поколение журнала и снимок сцены на его начало; снимок
+        кодируется и записывается в фоне"""
+        self._checkpointing = True
+        self._checkpoint_time = time.monotonic()
+        self._written = 0
+        self.generation += 1
+        snapshot = self.store.take(np.arange(len(self.store)))
+        self._queue.put(('segment', self.generation))
+        self._queue.put(('checkpoint', self.generation, snapshot))
+
+    def close(self):
+        """запись оставшихся правок и контрольной точки, остановка потока
+        и освобождение папки журнала"""
+        if self._thread is not None:
+            if self.sync() and self._written:
+                # при штатном выходе журнал сворачивается: запуск прочитает только снимок
+                self.checkpoint()
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._lock is not None:
+            self._lock.close()  # закрытие файла снимает блокировку
+            self._lock = None
+
+    # --- фоновый поток ---
+
+    def _run(self):
+        f = None
+        dirty = False
+        synced = time.monotonic()
+        try:
+            while True:
+                timeout = None
+                if dirty:
+                    timeout = max(0.0, synced + self.sync_interval - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = ('sync',)
+                if item is None:
+                    break
+                kind = item[0]
+                if kind == 'write':
+                    f.write(item[1])
+                    dirty = True
+                elif kind == 'segment':
+                    if f is not None:
+                        _fsync(f)
+                        f.close()
+                    f = open(self.segment_path(item[1]), 'wb')
+                    f.write(FILE_HEADER.pack(SEGMENT_MAGIC, JOURNAL_VERSION, item[1]))
+                    dirty = True
+                elif kind == 'checkpoint':
+                    # сначала новое поколение должно быть на диске - иначе после
+                    # удаления старых правки между ними и снимком потерялись бы
+                    _fsync(f)
+                    dirty = False
+                    self._write_checkpoint(*item[1:])
+                    self._checkpointing = False
+                    self.checkpoints += 1
+                if dirty and time.monotonic() - synced >= self.sync_interval:
+                    _fsync(f)
+                    dirty = False
+                    synced = time.monotonic()
+                    self.syncs += 1
+            if f is not None:
+                _fsync(f)
+        except OSError as e:
+            self.error = e
+        finally:
+            if f is not None:
+                f.close()
+
+    def _write_checkpoint(self, generation, snapshot):
+        path = self.checkpoint_path()
+        tmp_path = path + '.tmp'
+        payload = encode_ops([(ADD, snapshot)] if len(snapshot['ids']) else [])
+        with open(tmp_path, 'wb') as f:
+            f.write(FILE_HEADER.pack(CHECKPOINT_MAGIC, JOURNAL_VERSION, generation))
+            f.write(RECORD.pack(len(payload), zlib.crc32(payload)))
+            f.write(payload)
+            _fsync(f)
+        os.replace(tmp_path, path)
+        _fsync_directory(self.directory)
+        for old, old_path in self.segments():
+            if old < generation:
+                os.remove(old_path)
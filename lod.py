@@ -0,0 +1,162 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+
+POINT_SIZE = 1.0  # фигуры меньше пикселя рисуются точками плотности
+BOX_SIZE = 4.0  # фигуры меньше - залитыми ограничивающими прямоугольниками
+MIP_TILE = 256  # ячеек по стороне тайла мипмапа
+MAX_MIP_TILES = 256
+
+
+def mip_level(zoom):
+    """уровень мипмапа для масштаба zoom <= 1: ячейка 2**level мировых единиц
+    не крупнее экранного пикселя"""
+    return max(0, math.floor(math.log2(1 / zoom)))
+
+
+def lod_masks(bounds, zoom):
+    """маски (точки, прямоугольники) для фигур с границами bounds при масштабе zoom;
+    точками становятся только фигуры, которые попадают в мипмап плотности"""
+    size = np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1])
+    if zoom <= 1:
+        points = size < 2 ** mip_level(zoom)
+    else:
+        points = np.zeros(len(size), dtype=bool)
+    boxes = ~points & (size * zoom < BOX_SIZE)
+    return points, boxes
+
+
+class DensityMipmap:
+    """кэш плотности мелких фигур: для каждого уровня 2**level и тайла мира -
+    число фигур и сумма их цветов в каждой ячейке (фигура учитывается
+    в ячейке своего центра); тайлы строятся лениво и сбрасываются,
+    когда меняются их фигуры"""
+
+    def __init__(self, store, spatial_index, max_tiles=MAX_MIP_TILES):
+        self.store = store
+        self.spatial_index = spatial_index
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()  # (level, mx, my) -> словарь тайла
+        self._structure_version = None
+        self._version = None
+        self.builds = 0
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def clear(self):
+        self._tiles.clear()
+
+    def sync(self):
+        """сброс тайлов, чьи фигуры изменились с прошлой проверки"""
+        store = self.store
+        if store.structure_version != self._structure_version:
+            self._tiles.clear()
+        elif store.version != self._version and self._tiles:
+            changed = store.changed_since(self._version)
+            if len(changed):
+                b = store.bounds(changed)
+                for key, tile in list(self._tiles.items()):
+                    x0, y0, x1, y1 = tile['region']
+                    # фигура ушла из тайла или пришла в него
+                    if (np.isin(changed, tile['indices']).any() or
+                            ((b[:, 0] < x1) & (b[:, 2] >= x0) &
+                             (b[:, 1] < y1) & (b[:, 3] >= y0)).any()):
+                        del self._tiles[key]
+        self._structure_version = store.structure_version
+        self._version = store.version
+
+    def _cells(self, indices, level):
+        """ячейки уровня level (cx, cy) для центров фигур indices"""
+        b = self.store.bounds(indices)
+        centers = (b[:, 0:2] + b[:, 2:4]) / 2
+        return np.floor_divide(centers, 2 ** level).astype(np.int64)
+
+    def _build(self, level, mx, my):
+        cell = 2 ** level
+        span = MIP_TILE * cell
+        x0, y0 = mx * span, my * span
+        idx = self.spatial_index.intersecting(x0, y0, x0 + span, y0 + span)
+        points, _ = lod_masks(self.store.bounds(idx), 1 / cell)
+        idx = idx[points]
+        local = self._cells(idx, level) - (mx * MIP_TILE, my * MIP_TILE)
+        inside = ((local >= 0) & (local < MIP_TILE)).all(axis=1)
+        idx, local = idx[inside], local[inside]
+        flat = local[:, 1] * MIP_TILE + local[:, 0]
+        size = MIP_TILE * MIP_TILE
+        counts = np.bincount(flat, minlength=size)
+        colors = self.store.colors[idx].astype(np.float64)
+        sums = np.stack([np.bincount(flat, colors[:, c], minlength=size) for c in range(3)], axis=1)
+        nonzero = np.flatnonzero(counts)
+        self.builds += 1
+        return {
+            'region': (x0, y0, x0 + span, y0 + span),
+            'indices': idx,
+            # храним только занятые ячейки
+            'cells': np.stack((nonzero % MIP_TILE + mx * MIP_TILE,
+                               nonzero // MIP_TILE + my * MIP_TILE), axis=1),
+            'counts': counts[nonzero],
+            'sums': sums[nonzero],
+        }
+
+    def tile(self, level, mx, my):
+        key = (level, mx, my)
+        tile = self._tiles.get(key)
+        if tile is None:
+            tile = self._tiles[key] = self._build(level, mx, my)
+            if len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        else:
+            self._tiles.move_to_end(key)
+        return tile
+
+    def draw(self, surface, rect, zoom, pan, exclude=None):
+        """отрисовка плотности мелких фигур в экранной области rect на surface
+        (левый верхний угол surface - rect.topleft); фигуры exclude не учитываются"""
+        if zoom > 1:
+            return
+        self.sync()
+        level = mip_level(zoom)
+        cell = 2 ** level
+        span = MIP_TILE * cell
+        px, py = pan
+        wx0, wy0 = (rect.left - px) / zoom, (rect.top - py) / zoom
+        wx1, wy1 = (rect.right - px) / zoom, (rect.bottom - py) / zoom
+        parts = [self.tile(level, mx, my)
+                 for mx in range(math.floor(wx0 / span), math.floor(wx1 / span) + 1)
+                 for my in range(math.floor(wy0 / span), math.floor(wy1 / span) + 1)]
+        cells = [t['cells'] for t in parts]
+        counts = [t['counts'] for t in parts]
+        sums = [t['sums'] for t in parts]
+        if exclude:
+            # вычитаем вклад исключённых фигур (например, выбранных - они рисуются отдельно)
+            idx = np.asarray(exclude, dtype=np.int64)
+            points, _ = lod_masks(self.store.bounds(idx), 1 / cell)
+            idx = idx[points]
+            cells.append(self._cells(idx, level))
+            counts.append(-np.ones(len(idx), dtype=np.int64))
+            sums.append(-self.store.colors[idx].astype(np.float64))
+        cells = np.concatenate(cells)
+        if not len(cells):
+            return
+        counts = np.concatenate(counts)
+        sums = np.concatenate(sums)
+
+        # несколько ячеек могут попасть в один пиксель - суммируем
+        pixels = np.floor((cells + 0.5) * cell * zoom + (px - rect.left, py - rect.top)).astype(np.int64)
+        width, height = rect.size
+        inside = ((pixels[:, 0] >= 0) & (pixels[:, 0] < width) &
+                  (pixels[:, 1] >= 0) & (pixels[:, 1] < height))
+        flat = pixels[inside, 1] * width + pixels[inside, 0]
+        size = width * height
+        total = np.bincount(flat, counts[inside], minlength=size)
+        occupied = np.flatnonzero(total > 0.5)
+        if not len(occupied):
+            return
+        color = np.stack([np.bincount(flat, sums[inside, c], minlength=size)[occupied]
+                          for c in range(3)], axis=1) / total[occupied, None]
+        target = pygame.surfarray.pixels3d(surface)
+        target[occupied % width, occupied // width] = np.clip(np.rint(color), 0, 255).astype(np.uint8)
+        del target  # снимаем блокировку поверхности
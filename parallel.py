@@ -0,0 +1,70 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# число потоков (по умолчанию - по ядрам); 1 - всё в вызывающем потоке
+WORKERS = int(os.environ.get('DRAWAPP_WORKERS', '0')) or os.cpu_count() or 1
+# меньше стольких элементов (фигур, вершин) работа не делится - диспетчеризация дороже
+PARALLEL_THRESHOLD = 200_000
+MIN_CHUNK = 50_000  # кусок не меньше этого, даже если потоков больше
+
+
+class ParallelEngine:
+    """деление работы на куски по индексам и выполнение в пуле потоков
+
+    ядра numpy (арифметика, редукции, выборка по индексам) отпускают GIL,
+    поэтому куски считаются параллельно прямо над массивами хранилища -
+    память общая, ничего не копируется и не сериализуется; куски не
+    пересекаются, так что запись в общие массивы безопасна. ниже порога
+    всё выполняется в вызывающем потоке, пул даже не создаётся"""
+
+    def __init__(self, workers=WORKERS, threshold=PARALLEL_THRESHOLD, min_chunk=MIN_CHUNK):
+        self.workers = max(1, workers)
+        self.threshold = threshold
+        self.min_chunk = max(1, min_chunk)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def parallel(self, size):
+        """делится ли работа из size элементов"""
+        return self.workers > 1 and size >= self.threshold
+
+    def chunks(self, size):
+        """границы кусков [start, stop) для size элементов"""
+        if not self.parallel(size):
+            return [(0, size)]
+        count = min(self.workers, max(1, size // self.min_chunk))
+        edges = np.linspace(0, size, count + 1).astype(np.int64).tolist()
+        return list(zip(edges[:-1], edges[1:]))
+
+    def map(self, func, size):
+        """func(start, stop) для каждого куска; результаты - в порядке кусков"""
+        chunks = self.chunks(size)
+        if len(chunks) == 1:
+            return [func(*chunks[0])]
+        pool = self._executor()
+        futures = [pool.submit(func, start, stop) for start, stop in chunks[1:]]
+        first = func(*chunks[0])  # первый кусок - в вызывающем потоке
+        return [first] + [future.result() for future in futures]
+
+    def concatenate(self, func, size):
+        """map с объединением массивов-результатов по порядку кусков"""
+        parts = self.map(func, size)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers - 1, thread_name_prefix='drawapp-chunk')
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+ENGINE = ParallelEngine()  # общий для хранилищ, сетки и поиска фигур
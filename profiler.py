@@ -0,0 +1,146 @@
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+# фазы кадра основного цикла; wait - сон в clock.tick / pygame.event.wait
+PHASES = ('events', 'tasks', 'shapes', 'ui', 'flip', 'wait')
+PHASE_INDEX = {name: i for i, name in enumerate(PHASES)}
+WAIT = PHASE_INDEX['wait']
+HISTORY_FRAMES = 600  # кадров в кольцевом буфере (10 секунд при 60 fps)
+SPANS_PER_FRAME = 16  # запас под отрезки фаз одного кадра для трассы
+HUD_INTERVAL = 0.25  # секунд между обновлениями текста HUD
+
+
+class FrameProfiler:
+    """замеры фаз каждого кадра в кольцевом буфере
+
+    горячий путь - lap(): одно чтение часов и сложение, без выделения
+    массивов; проценты, средние и трасса считаются только по запросу"""
+
+    def __init__(self, frames=HISTORY_FRAMES, clock=time.perf_counter):
+        self.clock = clock
+        self.size = frames
+        self.frames = 0  # всего завершённых кадров
+        self.show_hud = False
+        self.hud_text = None  # строки HUD, обновляются раз в HUD_INTERVAL
+        self._hud_time = 0.0
+        self._starts = np.zeros(frames)  # начало кадра, секунды
+        self._totals = np.zeros(frames)  # длительность кадра вместе с ожиданием
+        self._phases = np.zeros((frames, len(PHASES)))
+        self._counts = np.zeros((frames, 3), dtype=np.int64)  # события, фигуры, вершины
+        self._current = [0.0] * len(PHASES)
+        self._spans = deque(maxlen=frames * SPANS_PER_FRAME)  # (фаза, начало, конец)
+        self._frame_start = clock()
+
+    def __len__(self):
+        """число кадров в буфере"""
+        return min(self.frames, self.size)
+
+    def lap(self, phase, since):
+        """добавление отрезка since..сейчас к фазе текущего кадра;
+        возвращает текущее время - начало следующего отрезка"""
+        now = self.clock()
+        i = PHASE_INDEX[phase]
+        self._current[i] += now - since
+        self._spans.append((i, since, now))
+        return now
+
+    def end_frame(self, events=0, shapes=0, vertices=0):
+        """закрытие кадра: запись в буфер и начало следующего"""
+        now = self.clock()
+        slot = self.frames % self.size
+        self._starts[slot] = self._frame_start
+        self._totals[slot] = now - self._frame_start
+        self._phases[slot] = self._current
+        self._counts[slot] = (events, shapes, vertices)
+        self._current = [0.0] * len(PHASES)
+        self._frame_start = now
+        self.frames += 1
+        if self.show_hud and now - self._hud_time >= HUD_INTERVAL:
+            self._hud_time = now
+            self.hud_text = self.hud_lines()
+
+    def toggle_hud(self):
+        self.show_hud = not self.show_hud
+        self.hud_text = self.hud_lines() if self.show_hud else None
+        self._hud_time = self.clock()
+
+    def _ordered(self, array):
+        """содержимое кольцевого буфера от старых кадров к новым"""
+        count = len(self)
+        if self.frames <= self.size:
+            return array[:count]
+        slot = self.frames % self.size
+        return np.concatenate((array[slot:], array[:slot]))
+
+    def stats(self):
+        """сводка по буферу: время работы кадра (без ожидания) в мс -
+        среднее и процентили, средние фаз, fps, событий на кадр и
+        размер сцены на последнем кадре"""
+        if not len(self):
+            return None
+        totals = self._ordered(self._totals)
+        phases = self._ordered(self._phases)
+        counts = self._ordered(self._counts)
+        work = (totals - phases[:, WAIT]) * 1000
+        p50, p95, p99 = np.percentile(work, (50, 95, 99))
+        mean_total = totals.mean()
+        return {
+            'frames': len(work),
+            'mean': float(work.mean()),
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+            'max': float(work.max()),
+            'fps': float(1 / mean_total) if mean_total > 0 else 0.0,
+            'phases': {name: float(v) for name, v in zip(PHASES, phases.mean(axis=0) * 1000)},
+            'events': float(counts[:, 0].mean()),
+            'shapes': int(counts[-1, 1]),
+            'vertices': int(counts[-1, 2]),
+        }
+
+    def hud_lines(self):
+        """текст HUD: по строке на группу показателей"""
+        s = self.stats()
+        if s is None:
+            return ("нет кадров",)
+        phases = s['phases']
+        return (
+            f"кадр {s['p50']:.1f} / {s['p95']:.1f} / {s['p99']:.1f} мс (p50/p95/p99), {s['fps']:.0f} fps",
+            " ".join(f"{name} {phases[name]:.2f}" for name in PHASES if name != 'wait'),
+            f"фигур {s['shapes']}, вершин {s['vertices']}, событий/кадр {s['events']:.1f}",
+        )
+
+    def trace_events(self):
+        """события в формате Trace Event (chrome://tracing, Perfetto):
+        кадры и фазы - отрезки 'X', число событий и размер сцены - счётчики 'C'"""
+        if not len(self):
+            return []
+        starts = self._ordered(self._starts)
+        totals = self._ordered(self._totals)
+        counts = self._ordered(self._counts)
+        origin = starts[0]
+        events = []
+        first = self.frames - len(starts)
+        for k, (start, total, (count, shapes, vertices)) in enumerate(
+                zip(starts.tolist(), totals.tolist(), counts.tolist())):
+            ts = (start - origin) * 1e6
+            events.append({'name': 'frame', 'ph': 'X', 'pid': 1, 'tid': 1, 'ts': ts,
+                           'dur': total * 1e6, 'args': {'frame': first + k}})
+            events.append({'name': 'events', 'ph': 'C', 'pid': 1, 'ts': ts, 'args': {'count': count}})
+            events.append({'name': 'scene', 'ph': 'C', 'pid': 1, 'ts': ts,
+                           'args': {'shapes': shapes, 'vertices': vertices}})
+        for i, since, until in self._spans:
+            if since < origin:
+                continue  # отрезок кадра, уже вытесненного из буфера
+            events.append({'name': PHASES[i], 'ph': 'X', 'pid': 1, 'tid': 1,
+                           'ts': (since - origin) * 1e6, 'dur': (until - since) * 1e6})
+        return events
+
+    def dump_trace(self, filename):
+        """запись трассы в JSON, который открывают стандартные просмотрщики"""
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+        return filename
@@ -0,0 +1,490 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pygame
+
+EVENTS_MAGIC = b'DRWEVENT'
+EVENTS_VERSION = 1
+EVENTS_EXTENSION = '.drwe'
+RECORD_KEY = pygame.K_F5  # включает и выключает запись - в журнал не попадает
+# заголовок: сигнатура, версия, длина JSON с состоянием приложения, число записей
+HEADER = struct.Struct('<8sHIQ')
+
+# запись события фиксированной длины; смысл полей a..e зависит от типа:
+#   KEYDOWN/KEYUP           key, mod
+#   MOUSEBUTTONDOWN/UP      pos x, pos y, button
+#   MOUSEMOTION             pos x, pos y, rel x, rel y, маска кнопок
+#   MOUSEWHEEL              x, y, mod, pos x, pos y (модификаторы и курсор -
+#                           на момент записи, чтобы воспроизведение от них не зависело)
+RECORD = np.dtype([('frame', '<u4'), ('time', '<f4'), ('type', 'u1'),
+                   ('a', '<i4'), ('b', '<i4'), ('c', '<i4'), ('d', '<i4'), ('e', '<i4')])
+
+KEYDOWN, KEYUP, BUTTONDOWN, BUTTONUP, MOTION, WHEEL = range(1, 7)
+TYPE_CODES = {
+    pygame.KEYDOWN: KEYDOWN,
+    pygame.KEYUP: KEYUP,
+    pygame.MOUSEBUTTONDOWN: BUTTONDOWN,
+    pygame.MOUSEBUTTONUP: BUTTONUP,
+    pygame.MOUSEMOTION: MOTION,
+    pygame.MOUSEWHEEL: WHEEL,
+}
+PYGAME_TYPES = {code: event_type for event_type, code in TYPE_CODES.items()}
+TYPE_NAMES = {code: pygame.event.event_name(event_type) for code, event_type in PYGAME_TYPES.items()}
+
+
+class EventLogError(ValueError):
+    """файл журнала событий повреждён или имеет неизвестную версию"""
+
+
+def encode_event(event, mods=0, mouse_pos=(0, 0)):
+    """поля a..e записи для события ввода (None - событие не записывается);
+    mods и mouse_pos дописываются к событиям колеса, если в них этого нет"""
+    t = event.type
+    if t in (pygame.KEYDOWN, pygame.KEYUP):
+        return event.key, getattr(event, 'mod', 0), 0, 0, 0
+    if t in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+        return event.pos[0], event.pos[1], event.button, 0, 0
+    if t == pygame.MOUSEMOTION:
+        buttons = getattr(event, 'buttons', (0, 0, 0))
+        mask = sum(1 << i for i, pressed in enumerate(buttons) if pressed)
+        rel = getattr(event, 'rel', (0, 0))
+        return event.pos[0], event.pos[1], rel[0], rel[1], mask
+    if t == pygame.MOUSEWHEEL:
+        pos = getattr(event, 'pos', mouse_pos)
+        return event.x, event.y, getattr(event, 'mod', mods), pos[0], pos[1]
+    return None
+
+
+def decode_event(code, a, b, c, d, e):
+    """событие pygame из полей записи"""
+    if code in (KEYDOWN, KEYUP):
+        return pygame.event.Event(PYGAME_TYPES[code], key=a, mod=b, unicode='', scancode=0)
+    if code in (BUTTONDOWN, BUTTONUP):
+        return pygame.event.Event(PYGAME_TYPES[code], pos=(a, b), button=c)
+    if code == MOTION:
+        return pygame.event.Event(pygame.MOUSEMOTION, pos=(a, b), rel=(c, d),
+                                  buttons=(e & 1, (e >> 1) & 1, (e >> 2) & 1))
+    if code == WHEEL:
+        return pygame.event.Event(pygame.MOUSEWHEEL, x=a, y=b, mod=c, pos=(d, e))
+    raise EventLogError(f"неизвестный тип события: {code}")
+
+
+def app_state(app):
+    """состояние приложения, от которого зависит обработка событий"""
+    return {
+        'view': [list(map(float, row)) for row in app.view[:2]],
+        'tool': app.current_tool,
+        'color': list(app.current_color),
+        'thickness': app.thickness,
+    }
+
+
+def restore_state(app, state):
+    app.set_view([state['view'][0], state['view'][1], [0, 0, 1]])
+    app.current_tool = state['tool']
+    app.current_color = tuple(state['color'])
+    app.thickness = state['thickness']
+    app.update_ui_active_states()
+
+
+def write_events(path, records, state):
+    """запись журнала: заголовок, JSON с состоянием, массив записей"""
+    meta = json.dumps(state, ensure_ascii=False).encode('utf-8')
+    records = np.ascontiguousarray(records, dtype=RECORD)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(EVENTS_MAGIC, EVENTS_VERSION, len(meta), len(records)))
+        f.write(meta)
+        f.write(records.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_events(path):
+    """журнал событий: (записи, состояние приложения)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise EventLogError("файл слишком короткий")
+    magic, version, meta_size, count = HEADER.unpack_from(data, 0)
+    if magic != EVENTS_MAGIC:
+        raise EventLogError("это не журнал событий")
+    if version != EVENTS_VERSION:
+        raise EventLogError(f"неподдерживаемая версия журнала: {version}")
+    offset = HEADER.size + meta_size
+    if offset + count * RECORD.itemsize > len(data):
+        raise EventLogError("журнал обрезан")
+    state = json.loads(data[HEADER.size:offset].decode('utf-8'))
+    return np.frombuffer(data, dtype=RECORD, count=count, offset=offset), state
+
+
+def scene_path(path):
+    """снимок сцены, с которой начинается журнал"""
+    return os.path.splitext(path)[0] + '.drws'
+
+
+class EventRecorder:
+    """запись событий ввода, которые приложение получает по кадрам
+
+    одна пачка handle_events - один кадр; воспроизведение подаёт события
+    теми же пачками, поэтому склейка движений и колеса повторяется точно"""
+
+    def __init__(self, state, clock=time.perf_counter):
+        self.state = state
+        self.clock = clock
+        self.frame = 0
+        self._start = clock()
+        self._rows = []
+
+    def __len__(self):
+        return len(self._rows)
+
+    def record(self, events):
+        """запись пачки событий одного кадра"""
+        now = self.clock() - self._start
+        mods = mouse_pos = None
+        for event in events:
+            code = TYPE_CODES.get(event.type)
+            if code is None or (code in (KEYDOWN, KEYUP) and event.key == RECORD_KEY):
+                continue
+            if code == WHEEL and mods is None:
+                mods, mouse_pos = pygame.key.get_mods(), pygame.mouse.get_pos()
+            self._rows.append((self.frame, now, code) + encode_event(event, mods, mouse_pos))
+        self.frame += 1
+
+    def records(self):
+        return np.array(self._rows, dtype=RECORD)
+
+    def save(self, path):
+        write_events(path, self.records(), self.state)
+        return path
+
+
+def frame_batches(records):
+    """записи, разбитые на кадры: (номер кадра, [события])"""
+    if not len(records):
+        return
+    frames = records['frame']
+    breaks = np.flatnonzero(np.diff(frames)) + 1
+    starts = np.concatenate(([0], breaks)).tolist()
+    ends = np.concatenate((breaks, [len(records)])).tolist()
+    columns = [records[name].tolist() for name in ('type', 'a', 'b', 'c', 'd', 'e')]
+    rows = list(zip(*columns))
+    for frame, start, end in zip(frames[starts].tolist(), starts, ends):
+        yield frame, [decode_event(*row) for row in rows[start:end]]
+
+
+def latency_stats(ms):
+    ms = np.asarray(ms, dtype=np.float64)
+    if not len(ms):
+        return {'n': 0}
+    p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+    return {'n': len(ms), 'mean_ms': float(ms.mean()), 'p50_ms': float(p50),
+            'p95_ms': float(p95), 'p99_ms': float(p99), 'max_ms': float(ms.max()),
+            'total_ms': float(ms.sum())}
+
+
+def replay(app, records, render=False, slowest=10, progress=None):
+    """подача записей в app.handle_events по кадрам, как при записи
+
+    между кадрами фоновые задачи выполняются до конца (без бюджета времени),
+    поэтому результат не зависит от скорости машины; задержка меряется
+    на кадр, по типам - среди кадров, где событие такого типа есть"""
+    frame_count = len(np.unique(records['frame'])) if len(records) else 0
+    latency = np.zeros(frame_count)
+    render_ms = np.zeros(frame_count if render else 0)
+    frames = np.zeros(frame_count, dtype=np.int64)
+    types = []
+    start = time.perf_counter()
+    for k, (frame, events) in enumerate(frame_batches(records)):
+        t = time.perf_counter()
+        app.handle_events(events)
+        app.step_tasks(budget=float('inf'))
+        latency[k] = time.perf_counter() - t
+        if render:
+            t = time.perf_counter()
+            app.renderer.render()
+            render_ms[k] = time.perf_counter() - t
+        frames[k] = frame
+        types.append({event.type for event in events})
+        if progress and k % 100_000 == 0 and k:
+            progress(k, frame_count)
+    wall = time.perf_counter() - start
+
+    latency *= 1000
+    report = {
+        'events': len(records),
+        'frames': frame_count,
+        'wall_s': wall,
+        'events_per_s': len(records) / wall if wall > 0 else 0.0,
+        'latency': latency_stats(latency),
+        'by_type': {},
+        'slowest': [],
+        'shapes': len(app.shapes),
+        'scene_digest': scene_digest(app),
+    }
+    for code, event_type in PYGAME_TYPES.items():
+        mask = np.fromiter((event_type in present for present in types), dtype=bool, count=frame_count)
+        if mask.any():
+            report['by_type'][TYPE_NAMES[code]] = latency_stats(latency[mask])
+    if render:
+        report['render'] = latency_stats(render_ms * 1000)
+    for k in np.argsort(latency)[::-1][:slowest].tolist():
+        report['slowest'].append({
+            'frame': int(frames[k]), 'ms': float(latency[k]),
+            'types': sorted(TYPE_NAMES[TYPE_CODES[t]] for t in types[k]),
+        })
+    return report
+
+
+def scene_digest(app):
+    """отпечаток сцены и выделения - совпадает у двух одинаковых прогонов"""
+    app.bake_transform()
+    store = app.shapes
+    digest = hashlib.sha1()
+    for column in (store.vertices, store.offsets, store.types, store.colors, store.thickness,
+                   app.selected_shape_indices.indices()):
+        digest.update(np.ascontiguousarray(column).tobytes())
+    return digest.hexdigest()
+
+
+# --- генератор нагрузки ---
+
+MOTION_STEPS = 4  # движений мыши в одном перетаскивании
+WHEEL_STEPS = 3  # щелчков колеса в серии
+STRESS_FPS = 60  # время записей: по кадру на событие с этой частотой
+TOP = 60  # ниже панели инструментов
+
+# жест - фиксированная последовательность записей (тип, поля a..e);
+# поля задаются массивами параметров жестов, см. _gesture_blocks
+GESTURES = ('click', 'ctrl_click', 'draw', 'drag', 'marquee', 'wheel', 'pan', 'zoom', 'undo')
+WEIGHTS = (0.22, 0.08, 0.12, 0.18, 0.1, 0.14, 0.06, 0.06, 0.04)
+
+
+def _gesture_blocks(kind, n, rng, targets, width, height):
+    """записи n жестов одного вида: массив (n, длина жеста) без frame и time"""
+    def points(count):
+        if targets is not None and len(targets):
+            picked = targets[rng.integers(0, len(targets), count)]
+            return np.clip(np.rint(picked), (0, TOP), (width - 1, height - TOP)).astype(np.int64)
+        return np.stack((rng.integers(0, width, count), rng.integers(TOP, height - TOP, count)), axis=1)
+
+    ctrl = pygame.K_LCTRL
+    rows = []  # по записи жеста: (код, a, b, c, d, e), поля - скаляры или массивы (n,)
+
+    def path(p, q, button):
+        """нажатие в p, MOTION_STEPS движений к q, отпускание в q"""
+        mask = 1 << (button - 1)
+        rows.append((BUTTONDOWN, p[:, 0], p[:, 1], button, 0, 0))
+        prev = p
+        for step in range(1, MOTION_STEPS + 1):
+            cur = p + (q - p) * step // MOTION_STEPS
+            rel = cur - prev
+            rows.append((MOTION, cur[:, 0], cur[:, 1], rel[:, 0], rel[:, 1], mask))
+            prev = cur
+        rows.append((BUTTONUP, q[:, 0], q[:, 1], button, 0, 0))
+
+    if kind in ('click', 'ctrl_click'):
+        p = points(n)
+        if kind == 'ctrl_click':
+            rows.append((KEYDOWN, ctrl, 0, 0, 0, 0))
+        rows.append((BUTTONDOWN, p[:, 0], p[:, 1], 1, 0, 0))
+        rows.append((BUTTONUP, p[:, 0], p[:, 1], 1, 0, 0))
+        if kind == 'ctrl_click':
+            rows.append((KEYUP, ctrl, 0, 0, 0, 0))
+    elif kind == 'draw':
+        p = np.stack((rng.integers(0, width, n), rng.integers(TOP, height - TOP, n)), axis=1)
+        path(p, np.clip(p + rng.integers(-80, 80, (n, 2)), (0, TOP), (width - 1, height - TOP)), 1)
+    elif kind == 'drag':
+        # щелчок выбирает фигуру, повторное нажатие на ней начинает перетаскивание
+        p = points(n)
+        rows.append((BUTTONDOWN, p[:, 0], p[:, 1], 1, 0, 0))
+        rows.append((BUTTONUP, p[:, 0], p[:, 1], 1, 0, 0))
+        path(p, p + rng.integers(-40, 40, (n, 2)), 1)
+    elif kind == 'marquee':
+        p = np.stack((rng.integers(0, width, n), rng.integers(TOP, height - TOP, n)), axis=1)
+        rows.append((KEYDOWN, ctrl, 0, 0, 0, 0))
+        path(p, np.clip(p + rng.integers(-300, 300, (n, 2)), (0, TOP), (width - 1, height - TOP)), 1)
+        rows.append((KEYUP, ctrl, 0, 0, 0, 0))
+    elif kind == 'wheel':
+        # поворот или масштаб выделения серией щелчков колеса
+        p = points(n)
+        mods = np.where(rng.random(n) < 0.5, pygame.KMOD_LSHIFT, 0)
+        direction = np.where(rng.random(n) < 0.5, 1, -1)
+        for _ in range(WHEEL_STEPS):
+            rows.append((WHEEL, 0, direction, mods, p[:, 0], p[:, 1]))
+    elif kind == 'pan':
+        # сдвиг вида туда и обратно - вид возвращается на место
+        p = points(n)
+        q = p + rng.integers(-100, 100, (n, 2))
+        path(p, q, 3)
+        path(q, p, 3)
+    elif kind == 'zoom':
+        # приближение и отдаление вокруг одной точки
+        p = points(n)
+        rows.append((KEYDOWN, ctrl, 0, 0, 0, 0))
+        rows.append((WHEEL, 0, 1, pygame.KMOD_LCTRL, p[:, 0], p[:, 1]))
+        rows.append((WHEEL, 0, -1, pygame.KMOD_LCTRL, p[:, 0], p[:, 1]))
+        rows.append((KEYUP, ctrl, 0, 0, 0, 0))
+    elif kind == 'undo':
+        rows.append((KEYDOWN, ctrl, 0, 0, 0, 0))
+        rows.append((KEYDOWN, pygame.K_z, pygame.KMOD_LCTRL, 0, 0, 0))
+        rows.append((KEYUP, pygame.K_z, pygame.KMOD_LCTRL, 0, 0, 0))
+        rows.append((KEYUP, ctrl, 0, 0, 0, 0))
+    else:
+        raise ValueError(f"неизвестный жест: {kind}")
+
+    block = np.zeros((n, len(rows)), dtype=RECORD)
+    for slot, (code, *fields) in enumerate(rows):
+        block[:, slot]['type'] = code
+        for name, value in zip('abcde', fields):
+            block[:, slot][name] = value
+    return block
+
+
+def stress_events(gestures, seed=1, targets=None, size=(1000, 600), weights=WEIGHTS):
+    """журнал из gestures случайных жестов (щелчки, ctrl-щелчки, рисование,
+    перетаскивание, ctrl-рамка, колесо, сдвиг и зум вида, отмена);
+    targets - экранные точки, куда целятся щелчки (например, центры фигур);
+    записи строятся массивами, миллионы жестов - за секунды"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    weights = np.asarray(weights, dtype=np.float64)
+    kinds = rng.choice(len(GESTURES), size=gestures, p=weights / weights.sum())
+    blocks = {k: _gesture_blocks(GESTURES[k], int(np.count_nonzero(kinds == k)), rng, targets, width, height)
+              for k in range(len(GESTURES))}
+    lengths = np.array([blocks[k].shape[1] for k in range(len(GESTURES))])[kinds]
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    records = np.zeros(int(lengths.sum()), dtype=RECORD)
+    for k, block in blocks.items():
+        where = starts[kinds == k]
+        if len(where):
+            records[where[:, None] + np.arange(block.shape[1])] = block
+    # по кадру на событие - склейки нет, каждое событие обрабатывается отдельно
+    records['frame'] = np.arange(len(records))
+    records['time'] = records['frame'] / STRESS_FPS
+    return records
+
+
+# --- командная строка ---
+
+def _replay_app(scene=None, state=None):
+    """приложение без окна и автосохранения; файлы пишутся во временную папку"""
+    from benchmark import BenchmarkApp
+    from scenefile import read_scene
+
+    app = BenchmarkApp(tempfile.mkdtemp(prefix='drawapp-replay-'))
+    if scene is not None:
+        app.shapes.load_arrays(*read_scene(scene))
+        app.spatial_index.rebuild(app.shapes.bounds())
+    if state is not None:
+        restore_state(app, state)
+    return app
+
+
+def _write_report(report, output):
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+def _log(text):
+    print(text, file=sys.stderr)
+
+
+def _progress(done, total):
+    _log(f"  кадров: {done}/{total}")
+
+
+def _summary(report):
+    lat = report['latency']
+    _log(f"событий {report['events']}, кадров {report['frames']}, {report['wall_s']:.2f} с "
+         f"({report['events_per_s']:.0f} событий/с)")
+    if lat['n']:
+        _log(f"задержка кадра: p50 {lat['p50_ms']:.3f} мс, p95 {lat['p95_ms']:.3f} мс, "
+             f"p99 {lat['p99_ms']:.3f} мс, max {lat['max_ms']:.3f} мс")
+    for item in report['slowest'][:5]:
+        _log(f"  кадр {item['frame']}: {item['ms']:.3f} мс ({', '.join(item['types'])})")
+    _log(f"фигур {report['shapes']}, отпечаток сцены {report['scene_digest']}")
+
+
+def replay_cli(argv=None):
+    """воспроизведение журнала событий без окна: python drawapp.py replay журнал.drwe"""
+    parser = argparse.ArgumentParser(description="воспроизведение журнала событий DrawingApp без окна")
+    parser.add_argument('log', help=f"журнал событий ({EVENTS_EXTENSION})")
+    parser.add_argument('--scene', help="начальная сцена (по умолчанию - снимок рядом с журналом)")
+    parser.add_argument('--render', action='store_true', help="отрисовывать кадр после каждой пачки")
+    parser.add_argument('-o', '--output', help="файл для JSON-отчёта (по умолчанию - stdout)")
+    args = parser.parse_args(argv)
+
+    records, state = read_events(args.log)
+    scene = args.scene
+    if scene is None and os.path.exists(scene_path(args.log)):
+        scene = scene_path(args.log)
+    app = _replay_app(scene, state)
+    try:
+        # сообщения приложения - в stderr, stdout остаётся для отчёта
+        with contextlib.redirect_stdout(sys.stderr):
+            report = replay(app, records, args.render, progress=_progress)
+    finally:
+        app.image_saver.shutdown()
+    report['log'] = args.log
+    report['scene'] = scene
+    _summary(report)
+    _write_report(report, args.output)
+    return 0
+
+
+def stress_cli(argv=None):
+    """генерация нагрузки и её воспроизведение: python drawapp.py stress --shapes 100000"""
+    from benchmark import synthetic_scene
+    from geometry import transform_points
+    from scenefile import write_scene
+
+    parser = argparse.ArgumentParser(description="синтетическая нагрузка на DrawingApp без окна")
+    parser.add_argument('--shapes', type=int, default=100_000, help="фигур в синтетической сцене")
+    parser.add_argument('--gestures', type=int, default=100_000, help="число жестов")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', metavar='LOG', help=f"сохранить журнал ({EVENTS_EXTENSION}) и сцену")
+    parser.add_argument('--no-replay', action='store_true', help="только сгенерировать журнал")
+    parser.add_argument('--render', action='store_true', help="отрисовывать кадр после каждого события")
+    parser.add_argument('-o', '--output', help="файл для JSON-отчёта (по умолчанию - stdout)")
+    args = parser.parse_args(argv)
+
+    app = _replay_app()
+    try:
+        app.shapes.load_arrays(*synthetic_scene(args.shapes, args.seed))
+        app.spatial_index.rebuild(app.shapes.bounds())
+        # щелчки целятся в центры фигур, видимых в начальном кадре
+        visible = app.visible_shape_indices()
+        bounds = app.shapes.bounds(visible)
+        centers = (bounds[:, 0:2] + bounds[:, 2:4]) / 2
+        start = time.perf_counter()
+        records = stress_events(args.gestures, args.seed, transform_points(centers, app.view),
+                                app.screen.get_size())
+        _log(f"жестов {args.gestures}: {len(records)} событий за {time.perf_counter() - start:.2f} с")
+        if args.save:
+            write_scene(scene_path(args.save), app.shapes)
+            write_events(args.save, records, app_state(app))
+            _log(f"журнал сохранён: {args.save}")
+        if args.no_replay:
+            return 0
+        # сообщения приложения - в stderr, stdout остаётся для отчёта
+        with contextlib.redirect_stdout(sys.stderr):
+            report = replay(app, records, args.render, progress=_progress)
+    finally:
+        app.image_saver.shutdown()
+    report['config'] = {'shapes': args.shapes, 'gestures': args.gestures, 'seed': args.seed}
+    _summary(report)
+    _write_report(report, args.output)
+    return 0
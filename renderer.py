@@ -0,0 +1,267 @@
+from collections import OrderedDict
+
+import pygame
+
+TOOLBAR_HEIGHT = 52  # панель 50 пикселей + разделительная линия
+STATUS_HEIGHT = 50  # подсказка и число выбранных фигур внизу экрана
+MAX_DIRTY_RECTS = 8  # больше областей - объединяем в одну
+TILE_SIZE = 256  # сторона тайла статичного слоя в экранных пикселях
+MAX_TILES = 128  # сколько отрисованных тайлов держать в кэше
+
+
+def merge_rects(rects, limit=MAX_DIRTY_RECTS):
+    """объединение пересекающихся областей"""
+    merged = []
+    for rect in rects:
+        if not rect.width or not rect.height:
+            continue
+        rect = pygame.Rect(rect)
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    if len(merged) > limit:
+        merged = [merged[0].unionall(merged[1:])]
+    return merged
+
+
+class ScratchSurface:
+    """переиспользуемая прозрачная поверхность для временных наложений:
+    растёт по необходимости до max_size, очищается только занятая ранее область"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.surface = None
+        self.rect = None  # область экрана, которую сейчас представляет поверхность
+        self._used = None  # занятая область внутри поверхности
+
+    def begin(self, rect):
+        """подготовка поверхности под область экрана rect (рисовать в локальных координатах)"""
+        rect = pygame.Rect(rect)
+        width, height = rect.size
+        surface = self.surface
+        if surface is None or surface.get_width() < width or surface.get_height() < height:
+            cur_w, cur_h = surface.get_size() if surface is not None else (0, 0)
+            max_w, max_h = self.max_size
+            size = (max(width, min(max_w, 2 * cur_w)), max(height, min(max_h, 2 * cur_h)))
+            self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        elif self._used:
+            self.surface.fill((0, 0, 0, 0), self._used)
+        self._used = pygame.Rect(0, 0, width, height)
+        self.rect = rect
+        return self.surface
+
+    def clear(self):
+        if self._used:
+            self.surface.fill((0, 0, 0, 0), self._used)
+        self._used = None
+        self.rect = None
+
+    def blit_to(self, target):
+        if self.rect is not None:
+            target.blit(self.surface, self.rect.topleft, self._used)
+
+
+class LayeredRenderer:
+    """отрисовка слоями: статичный слой с фоном и невыбранными фигурами,
+    поверх него в грязных областях - выбранные фигуры и наложения,
+    панель инструментов кэшируется отдельно; на экран выводятся только
+    изменившиеся области
+
+    статичный слой собирается из тайлов, привязанных к мировым координатам
+    при текущем масштабе: при сдвиге вида растеризуются только открывшиеся
+    тайлы, и в каждый попадают только пересекающие его фигуры"""
+
+    def __init__(self, app, background):
+        self.app = app
+        self.background = background
+        screen = app.screen
+        width, height = screen.get_size()
+        self.screen_rect = screen.get_rect()
+        self.toolbar_rect = pygame.Rect(0, 0, width, TOOLBAR_HEIGHT)
+        self.status_rect = pygame.Rect(0, height - STATUS_HEIGHT, width, STATUS_HEIGHT)
+        self.static_layer = screen.copy()
+        self.toolbar_layer = pygame.Surface(self.toolbar_rect.size).convert(screen)
+
+        self._static_state = None  # содержимое тайлов и сдвиг вида статичного слоя
+        self._tile_state = None  # версия структуры, выделения и масштаб тайлов
+        self._tiles = OrderedDict()  # (tx, ty) -> поверхность тайла
+        self._store_version = -1
+        self._toolbar_state = None
+        self._status_state = None
+        self._overlay_state = None
+        self._overlay_rects = []  # где наложения были на прошлом кадре
+        self._needs_full = True
+
+    def invalidate(self):
+        """полная перерисовка на следующем кадре"""
+        self._static_state = None
+        self._tile_state = None
+        self._toolbar_state = None
+        self._needs_full = True
+
+    def render(self):
+        """вывод кадра; возвращает список обновлённых областей экрана"""
+        screen = self.app.screen
+        profiler = self.app.profiler
+        t = profiler.clock()
+        full = self._update_static_layer() or self._needs_full
+        t = profiler.lap('shapes', t)
+        toolbar_changed = self._update_toolbar()
+        profiler.lap('ui', t)
+        status_state = self._status_key()
+        status_changed = status_state != self._status_state
+        overlay_state = self._overlay_key()
+        if (not full and not toolbar_changed and not status_changed
+                and overlay_state == self._overlay_state):
+            return []
+
+        overlay_rects = self._collect_overlay_rects()
+        if full:
+            screen.set_clip(None)
+            t = profiler.clock()
+            screen.blit(self.static_layer, (0, 0))
+            profiler.lap('shapes', t)
+            self._draw_overlay_layer()
+            t = profiler.clock()
+            pygame.display.flip()
+            profiler.lap('flip', t)
+            dirty = [self.screen_rect]
+        else:
+            dirty = self._overlay_rects + overlay_rects
+            if toolbar_changed:
+                dirty.append(self.toolbar_rect)
+            if status_changed:
+                dirty.append(self.status_rect)
+            dirty = merge_rects([r.clip(self.screen_rect) for r in dirty])
+            for rect in dirty:
+                screen.set_clip(rect)
+                t = profiler.clock()
+                screen.blit(self.static_layer, rect, rect)
+                profiler.lap('shapes', t)
+                self._draw_overlay_layer()
+            screen.set_clip(None)
+            t = profiler.clock()
+            pygame.display.update(dirty)
+            profiler.lap('flip', t)
+
+        self._overlay_rects = overlay_rects
+        self._overlay_state = overlay_state
+        self._status_state = status_state
+        self._needs_full = False
+        return dirty
+
+    def _update_static_layer(self):
+        """пересборка статичного слоя, если изменились невыбранные фигуры или вид"""
+        app = self.app
+        store = app.shapes
+        selection = app.selected_shape_indices
+        tile_state = (store.structure_version, selection.version, app.zoom)
+        if tile_state != self._tile_state:
+            self._tiles.clear()
+            self._tile_state = tile_state
+            self._static_state = None
+        elif store.version != self._store_version:
+            changed = store.changed_since(self._store_version)
+            if not selection.contains(changed).all():
+                self._tiles.clear()
+                self._static_state = None
+        self._store_version = store.version
+
+        state = (tile_state, app.pan)
+        if state == self._static_state:
+            return False
+        self._static_state = state
+        self.static_layer.fill(self.background)
+        px, py = app.pan
+        width, height = self.static_layer.get_size()
+        visible = [(tx, ty)
+                   for tx in range((-px) // TILE_SIZE, (width - 1 - px) // TILE_SIZE + 1)
+                   for ty in range((-py) // TILE_SIZE, (height - 1 - py) // TILE_SIZE + 1)]
+        missing = [key for key in visible if key not in self._tiles]
+        candidates = None
+        if len(missing) > 1:
+            # один запрос к сетке на все недостающие тайлы, дальше - отбор по границам
+            rects = [self._tile_rect(*key) for key in missing]
+            idx = app.visible_shape_indices(rects[0].unionall(rects[1:]))
+            candidates = (idx, app.spatial_index.bounds[idx])
+        for tx, ty in visible:
+            self.static_layer.blit(self._tile(tx, ty, candidates),
+                                   (tx * TILE_SIZE + px, ty * TILE_SIZE + py))
+        return True
+
+    def _tile_rect(self, tx, ty):
+        px, py = self.app.pan
+        return pygame.Rect(tx * TILE_SIZE + px, ty * TILE_SIZE + py, TILE_SIZE, TILE_SIZE)
+
+    def _tile(self, tx, ty, candidates=None):
+        """тайл статичного слоя из кэша или растеризованный заново"""
+        tile = self._tiles.get((tx, ty))
+        if tile is not None:
+            self._tiles.move_to_end((tx, ty))
+            return tile
+        app = self.app
+        selection = app.selected_shape_indices
+        rect = self._tile_rect(tx, ty)
+        tile = pygame.Surface(rect.size).convert(self.static_layer)
+        tile.fill(self.background)
+        # мелкие фигуры рисуются упрощённо, выбранные - в слое наложений
+        indices = app.draw_lod(tile, rect, app.visible_shape_indices(rect, candidates), selection)
+        app.draw_shape_indices(tile, indices, rect.topleft)
+        self._tiles[(tx, ty)] = tile
+        if len(self._tiles) > MAX_TILES:
+            self._tiles.popitem(last=False)
+        return tile
+
+    def _update_toolbar(self):
+        """перерисовка кэша панели инструментов при смене её состояния"""
+        app = self.app
+        # кнопка "снять" подсвечивается, когда есть выделение
+        state = (app.ui_version, bool(app.selected_shape_indices))
+        if state == self._toolbar_state:
+            return False
+        self._toolbar_state = state
+        app.draw_toolbar(self.toolbar_layer)
+        return True
+
+    def _status_key(self):
+        app = self.app
+        return len(app.selected_shape_indices), app.task_status(), app.session_status()
+
+    def _overlay_key(self):
+        app = self.app
+        return (app.shapes.version, app.selected_shape_indices.version,
+                app.selected_shape_indices.pending_version, app.zoom, app.pan,
+                app.selecting, app.selection_rect, app.fixed_center, app.show_center,
+                app.drawing, app.start_pos, app.last_pos,
+                app.current_tool, app.current_color, app.thickness, app.toast,
+                app.profiler.hud_text)
+
+    def _collect_overlay_rects(self):
+        """области, которые наложения занимают на этом кадре"""
+        app = self.app
+        rects = [app.selection_overlay_rect(),
+                 app.center_overlay_rect(app.current_center()),
+                 app.preview_rect(),
+                 app.toast_rect(),
+                 app.hud_rect()]
+        if app.selecting and app.selection_rect:
+            rects.append(pygame.Rect(app.selection_rect).inflate(4, 4))
+        return [r for r in rects if r is not None]
+
+    def _draw_overlay_layer(self):
+        """выбранные фигуры, предпросмотр, наложения и интерфейс поверх статичного слоя"""
+        app = self.app
+        screen = app.screen
+        profiler = app.profiler
+        t = profiler.clock()
+        app.draw_selected_shapes()
+        if app.drawing and app.start_pos and app.last_pos:
+            app.preview_layer.blit_to(screen)
+        app.draw_overlays()
+        t = profiler.lap('shapes', t)
+        app.draw_status(screen)
+        screen.blit(self.toolbar_layer, (0, 0))
+        app.draw_hud(screen)
+        profiler.lap('ui', t)
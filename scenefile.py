@@ -0,0 +1,96 @@
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+SCENE_MAGIC = b'DRWSCENE'
+SCENE_VERSION = 1
+SCENE_EXTENSION = '.drws'
+
+# заголовок: сигнатура, версия, флаги, число фигур, число вершин
+HEADER = struct.Struct('<8sHHQQ')
+ALIGNMENT = 8  # каждый массив выравнивается, чтобы представления были без копий
+
+SceneArrays = namedtuple('SceneArrays',
+                         'vertices offsets types colors thickness legacy bounds sums')
+
+# порядок и типы массивов в файле
+COLUMNS = (
+    ('vertices', np.float64),
+    ('offsets', np.int64),
+    ('types', np.int8),
+    ('colors', np.uint8),
+    ('thickness', np.int32),
+    ('legacy', np.bool_),
+    # производные кэши хранилища - чтобы не пересчитывать их при загрузке
+    ('bounds', np.float64),
+    ('sums', np.float64),
+)
+
+
+class SceneFormatError(ValueError):
+    """файл сцены повреждён или имеет неизвестную версию"""
+
+
+def _aligned(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _column_shapes(shape_count, vertex_count):
+    return {
+        'vertices': (vertex_count, 2),
+        'offsets': (shape_count + 1,),
+        'types': (shape_count,),
+        'colors': (shape_count, 3),
+        'thickness': (shape_count,),
+        'legacy': (shape_count,),
+        'bounds': (shape_count, 4),
+        'sums': (shape_count, 2),
+    }
+
+
+def write_scene(path, store):
+    """запись хранилища фигур в бинарный файл сцены (атомарно через временный файл)"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        header = HEADER.pack(SCENE_MAGIC, SCENE_VERSION, 0, len(store), store.vertex_count)
+        f.write(header)
+        f.write(b'\0' * (_aligned(len(header)) - len(header)))
+        for name, dtype in COLUMNS:
+            column = store.bounds() if name == 'bounds' else getattr(store, name)
+            data = np.ascontiguousarray(column, dtype=dtype)
+            f.write(data.tobytes())
+            f.write(b'\0' * (_aligned(data.nbytes) - data.nbytes))
+    os.replace(tmp_path, path)
+
+
+def read_scene(path):
+    """открытие файла сцены через mmap; массивы - представления без копирования
+
+    отображение открывается в режиме копирования при записи, поэтому
+    массивы можно менять, файл на диске при этом не трогается"""
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    if len(mapped) < HEADER.size:
+        raise SceneFormatError("файл слишком короткий")
+    magic, version, _flags, shape_count, vertex_count = HEADER.unpack_from(mapped, 0)
+    if magic != SCENE_MAGIC:
+        raise SceneFormatError("это не файл сцены")
+    if version != SCENE_VERSION:
+        raise SceneFormatError(f"неподдерживаемая версия сцены: {version}")
+
+    shapes = _column_shapes(shape_count, vertex_count)
+    offset = _aligned(HEADER.size)
+    columns = {}
+    for name, dtype in COLUMNS:
+        shape = shapes[name]
+        count = int(np.prod(shape))
+        nbytes = count * np.dtype(dtype).itemsize
+        if offset + nbytes > len(mapped):
+            raise SceneFormatError("файл сцены обрезан")
+        columns[name] = np.frombuffer(mapped, dtype=dtype, count=count,
+                                      offset=offset).reshape(shape)
+        offset += _aligned(nbytes)
+    return SceneArrays(**columns)
@@ -0,0 +1,673 @@
+import argparse
+import asyncio
+import os
+import queue
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from scenefile import read_scene
+from shapestore import ShapeStore, index_array
+
+SESSION_HOST = os.environ.get('DRAWAPP_SESSION_HOST', '127.0.0.1')
+SESSION_PORT = int(os.environ.get('DRAWAPP_SESSION_PORT', '8765'))
+# участников на сервер; новые фигуры участника n получают идентификаторы n по модулю ID_STRIDE
+ID_STRIDE = 1024
+# столько байт может ждать отправки отстающему участнику; дальше его очередь
+# сбрасывается и он получает снимок сцены вместо накопившихся правок
+BACKLOG_BYTES = 8 * 1024 * 1024
+MAX_FRAME = 1 << 30  # больший кадр считается повреждённым
+CONNECT_TIMEOUT = 5.0  # секунд на подключение и получение сцены
+
+# кадр: длина содержимого, вид
+FRAME = struct.Struct('<IB')
+OPS, ACK, SNAPSHOT = range(1, 4)
+ACK_BODY = struct.Struct('<Q')  # сколько пачек участника сервер применил (нарастающим итогом)
+# перед правками снимка: номер участника, применённые пачки, граница идентификаторов сцены
+SNAPSHOT_HEADER = struct.Struct('<HQQ')
+OPS_HEADER = struct.Struct('<I')  # число правок в пачке
+
+# правка: код, число фигур, число вершин; затем идентификаторы и данные по коду:
+#   ADD        счётчики вершин, типы, цвета, толщины, флаги legacy, вершины
+#   DELETE     -
+#   TRANSFORM  две верхние строки матрицы 3x3
+#   CLEAR      - (идентификаторов нет)
+OP_HEADER = struct.Struct('<BIQ')
+ADD, DELETE, TRANSFORM, CLEAR = range(1, 5)
+# идентификаторы: ширина разностей соседних (0 - сами идентификаторы int64) и первый
+ID_HEADER = struct.Struct('<Bq')
+
+
+class SessionProtocolError(ValueError):
+    """кадр сессии повреждён или имеет неизвестный вид"""
+
+
+# --- кодирование правок ---
+
+def encode_ids(ids):
+    """идентификаторы по возрастанию - первый и разности в 2 или 4 байта"""
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) > 1:
+        deltas = np.diff(ids)
+        if deltas.min() >= 0:
+            for width in (2, 4):
+                if deltas.max() < 1 << (8 * width):
+                    return ID_HEADER.pack(width, int(ids[0])) + deltas.astype(f'<u{width}').tobytes()
+    return ID_HEADER.pack(0, 0) + ids.astype('<i8').tobytes()
+
+
+def decode_ids(data, offset, count):
+    """(идентификаторы, смещение после них)"""
+    width, first = ID_HEADER.unpack_from(data, offset)
+    offset += ID_HEADER.size
+    if width == 0:
+        return np.frombuffer(data, '<i8', count, offset), offset + 8 * count
+    if width not in (2, 4) or count < 2:
+        raise SessionProtocolError(f"неизвестная ширина идентификаторов: {width}")
+    ids = np.empty(count, dtype=np.int64)
+    ids[0] = first
+    np.cumsum(np.frombuffer(data, f'<u{width}', count - 1, offset), out=ids[1:])
+    ids[1:] += first
+    return ids, offset + width * (count - 1)
+
+
+def encode_op(op):
+    code = op[0]
+    if code == ADD:
+        batch = op[1]
+        counts = np.asarray(batch['counts'])
+        vertices = np.asarray(batch['vertices'], dtype='<f8').reshape(-1, 2)
+        return b''.join((
+            OP_HEADER.pack(ADD, len(counts), len(vertices)), encode_ids(batch['ids']),
+            counts.astype('<i4').tobytes(), np.asarray(batch['types'], dtype='i1').tobytes(),
+            np.asarray(batch['colors'], dtype='u1').tobytes(),
+            np.asarray(batch['thickness'], dtype='<i4').tobytes(),
+            np.asarray(batch['legacy'], dtype='?').tobytes(), vertices.tobytes()))
+    if code == DELETE:
+        return OP_HEADER.pack(DELETE, len(op[1]), 0) + encode_ids(op[1])
+    if code == TRANSFORM:
+        matrix = np.asarray(op[2], dtype='<f8')[:2]
+        return OP_HEADER.pack(TRANSFORM, len(op[1]), 0) + encode_ids(op[1]) + matrix.tobytes()
+    if code == CLEAR:
+        return OP_HEADER.pack(CLEAR, 0, 0)
+    raise ValueError(f"неизвестная правка: {code}")
+
+
+def encode_ops(ops):
+    """пачка правок одним блоком байт"""
+    return OPS_HEADER.pack(len(ops)) + b''.join(encode_op(op) for op in ops)
+
+
+def decode_ops(data, offset=0):
+    """правки пачки: (ADD, batch), (DELETE, ids), (TRANSFORM, ids, матрица), (CLEAR,);
+    массивы - представления data без копирования"""
+    try:
+        (count,) = OPS_HEADER.unpack_from(data, offset)
+        offset += OPS_HEADER.size
+        ops = []
+        for _ in range(count):
+            code, shapes, vertices = OP_HEADER.unpack_from(data, offset)
+            offset += OP_HEADER.size
+            if code == CLEAR:
+                ops.append((CLEAR,))
+                continue
+            ids, offset = decode_ids(data, offset, shapes)
+            if code == ADD:
+                batch = {'ids': ids}
+                for name, dtype, width in (('counts', '<i4', 1), ('types', 'i1', 1),
+                                           ('colors', 'u1', 3), ('thickness', '<i4', 1),
+                                           ('legacy', '?', 1)):
+                    column = np.frombuffer(data, dtype, shapes * width, offset)
+                    offset += column.nbytes
+                    batch[name] = column.reshape(-1, 3) if width == 3 else column
+                batch['counts'] = batch['counts'].astype(np.int64)
+                if int(batch['counts'].sum()) != vertices:
+                    raise SessionProtocolError("число вершин не сходится со счётчиками")
+                batch['vertices'] = np.frombuffer(data, '<f8', vertices * 2, offset).reshape(-1, 2)
+                offset += vertices * 16
+                ops.append((ADD, batch))
+            elif code == DELETE:
+                ops.append((DELETE, ids))
+            elif code == TRANSFORM:
+                matrix = np.eye(3)
+                matrix[:2] = np.frombuffer(data, '<f8', 6, offset).reshape(2, 3)
+                offset += 48
+                ops.append((TRANSFORM, ids, matrix))
+            else:
+                raise SessionProtocolError(f"неизвестная правка: {code}")
+    except (struct.error, ValueError) as e:
+        if isinstance(e, SessionProtocolError):
+            raise
+        raise SessionProtocolError(f"пачка правок обрезана: {e}") from None
+    if offset != len(data):
+        raise SessionProtocolError("лишние байты после правок")
+    return ops
+
+
+def concat_batches(first, second):
+    """две пачки фигур (формат ShapeStore.take) одной"""
+    return {name: np.concatenate((first[name], second[name])) for name in first}
+
+
+def members(ids, others):
+    """маска: какие из ids есть в others (оба по возрастанию, как идентификаторы
+    фигур в порядке хранилища); непересекающиеся диапазоны отсекаются сразу"""
+    if not len(ids) or not len(others) or ids[-1] < others[0] or ids[0] > others[-1]:
+        return np.zeros(len(ids), dtype=bool)
+    pos = np.minimum(np.searchsorted(others, ids), len(others) - 1)
+    return others[pos] == ids
+
+
+def make_frame(kind, payload):
+    return FRAME.pack(len(payload), kind) + payload
+
+
+async def read_frame(reader):
+    """(вид, содержимое) следующего кадра"""
+    length, kind = FRAME.unpack(await reader.readexactly(FRAME.size))
+    if length > MAX_FRAME:
+        raise SessionProtocolError(f"слишком длинный кадр: {length} байт")
+    return kind, await reader.readexactly(length)
+
+
+# --- применение правок ---
+
+def apply_op(scene, op):
+    """применение правки к сцене - приложению или SceneReplica
+    (методы merge_shapes, remove_ids, transform_ids со списком групп)"""
+    code = op[0]
+    if code == ADD:
+        scene.merge_shapes(op[1])
+    elif code == DELETE:
+        scene.remove_ids(op[1])
+    elif code == TRANSFORM:
+        scene.transform_ids([(op[1], op[2])])
+    elif code == CLEAR:
+        scene.remove_ids(scene.shapes.ids.copy())
+    else:
+        raise SessionProtocolError(f"неизвестная правка: {code}")
+
+
+class SceneReplica:
+    """сцена сервера: те же правки по идентификаторам, что и у участников,
+    без пространственного индекса, выделения и истории"""
+
+    def __init__(self, store=None):
+        self.shapes = ShapeStore() if store is None else store
+
+    def merge_shapes(self, batch):
+        return self.shapes.merge(batch)
+
+    def remove_ids(self, ids):
+        idx = self.shapes.index_of(ids)
+        idx = idx[idx >= 0]
+        if len(idx):
+            self.shapes.delete(idx)
+
+    def transform_ids(self, groups):
+        pairs = []
+        for ids, matrix in groups:
+            idx = self.shapes.index_of(ids)
+            idx = idx[idx >= 0]
+            if len(idx):
+                pairs.append((idx, matrix))
+        if pairs:
+            self.shapes.apply_matrices(pairs)
+
+    def snapshot(self):
+        return self.shapes.take(np.arange(len(self.shapes)))
+
+
+# --- сервер ---
+
+class Peer:
+    """участник на сервере: кадры, ждущие отправки ему"""
+
+    def __init__(self, number, writer, backlog):
+        self.number = number
+        self.writer = writer
+        self.backlog = backlog
+        self.frames = deque()
+        self.queued = 0  # байт в frames
+        self.received = 0  # применено пачек этого участника
+        self.resync = True  # первым участник получает снимок сцены
+        self.resyncs = 0  # сколько раз очередь заменялась снимком
+        self.ready = asyncio.Event()
+        self.ready.set()
+
+    def send(self, frame):
+        if self.resync:
+            return  # снимок и так покажет сцену со всеми правками
+        self.frames.append(frame)
+        self.queued += len(frame)
+        if self.queued > self.backlog:
+            # участник не успевает читать: вместо очереди - один снимок
+            self.frames.clear()
+            self.queued = 0
+            self.resync = True
+            self.resyncs += 1
+        self.ready.set()
+
+
+class SessionServer:
+    """сервер общей сессии на asyncio
+
+    сервер держит свою копию сцены и задаёт общий порядок правок: пачка
+    участника применяется к копии, как есть пересылается остальным и
+    подтверждается отправителю. у каждого участника своя очередь кадров,
+    которая уходит одной записью; отстающему вместо роста очереди
+    отправляется снимок сцены"""
+
+    def __init__(self, store=None, backlog=BACKLOG_BYTES):
+        self.scene = SceneReplica(store)
+        self.backlog = backlog
+        self.peers = {}  # номер участника -> Peer
+        self.batches = 0  # всего применено пачек
+        self._server = None
+
+    async def start(self, host=SESSION_HOST, port=SESSION_PORT):
+        """начало приёма подключений; возвращает (адрес, порт)"""
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        self._server.close()
+        for peer in list(self.peers.values()):
+            peer.writer.close()
+        await self._server.wait_closed()
+
+    def _free_number(self):
+        return next((n for n in range(1, ID_STRIDE) if n not in self.peers), None)
+
+    async def _serve(self, reader, writer):
+        number = self._free_number()
+        if number is None:
+            writer.close()
+            return
+        peer = self.peers[number] = Peer(number, writer, self.backlog)
+        sender = asyncio.create_task(self._send_loop(peer))
+        try:
+            while True:
+                kind, payload = await read_frame(reader)
+                if kind != OPS:
+                    raise SessionProtocolError(f"неожиданный кадр: {kind}")
+                self._apply(peer, payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except SessionProtocolError as e:
+            print(f"участник {number} отключён: {e}")
+        finally:
+            del self.peers[number]
+            sender.cancel()
+            writer.close()
+
+    def _apply(self, peer, payload):
+        ops = decode_ops(payload)  # целиком до применения: повреждённая пачка не применяется частично
+        for op in ops:
+            apply_op(self.scene, op)
+        peer.received += 1
+        self.batches += 1
+        frame = make_frame(OPS, payload)
+        for other in self.peers.values():
+            if other is not peer:
+                other.send(frame)
+        peer.send(make_frame(ACK, ACK_BODY.pack(peer.received)))
+
+    def snapshot_frame(self, peer):
+        store = self.scene.shapes
+        header = SNAPSHOT_HEADER.pack(peer.number, peer.received, store.next_id)
+        return make_frame(SNAPSHOT, header + encode_ops([(ADD, self.scene.snapshot())]))
+
+    async def _send_loop(self, peer):
+        writer = peer.writer
+        try:
+            while True:
+                await peer.ready.wait()
+                peer.ready.clear()
+                if peer.resync:
+                    peer.resync = False
+                    writer.write(self.snapshot_frame(peer))
+                if peer.frames:
+                    frames = list(peer.frames)
+                    peer.frames.clear()
+                    peer.queued = 0
+                    writer.writelines(frames)
+                # пока запись ждёт сокета, новые кадры копятся в очереди участника
+                await writer.drain()
+        except ConnectionError:
+            pass
+
+
+# --- участник ---
+
+class SessionClient:
+    """участие приложения в общей сессии
+
+    сеть работает в фоновом потоке со своим циклом asyncio, приложение
+    раз в кадр вызывает sync(): пришедшие кадры применяются, накопленные
+    свои правки уходят одной пачкой. свои правки применяются сразу, общий
+    порядок задаёт сервер: чужое преобразование, пришедшее раньше
+    подтверждения своей пачки, применяется так, будто выполнено до неё.
+    пока предыдущая пачка не записана в сокет, новые правки склеиваются"""
+
+    def __init__(self, app, host=SESSION_HOST, port=SESSION_PORT, notify=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.notify = notify  # вызывается из сетевого потока, когда есть что применить
+        self.number = None  # номер участника, выданный сервером
+        self.applying = False  # применяются чужие правки - публиковать их не нужно
+        self.closed = False
+        self.error = None
+        self.latency = None  # секунд от отправки последней пачки до подтверждения
+        self.received = 0  # применено чужих пачек
+        self._outbox = []  # свои правки, ещё не отправленные
+        self._pending = deque()  # (номер, правки, время отправки) отправленных без подтверждения
+        self._sent = 0
+        self._inflight = False  # пачка передана сетевому потоку и ещё не записана
+        self._incoming = queue.SimpleQueue()  # (вид, содержимое) или (None, ошибка)
+        self._groups = []  # чужие преобразования кадра (ids, матрица), ждущие применения
+        self._notified = False
+        self._loop = None
+        self._task = None
+        self._writer = None
+        self._thread = None
+
+    # --- подключение ---
+
+    def connect(self, timeout=CONNECT_TIMEOUT):
+        """подключение и загрузка сцены сессии (заменяет сцену приложения)"""
+        self._thread = threading.Thread(target=self._run, name='drawapp-session', daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while self.number is None:
+            try:
+                kind, payload = self._incoming.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                self.close()
+                raise TimeoutError(f"нет ответа от {self.host}:{self.port}") from None
+            self._receive(kind, payload)
+            if self.closed:
+                self.close()
+                raise ConnectionError(str(self.error))
+        return self
+
+    def close(self, timeout=1.0):
+        """отключение; неотправленные правки перед этим дописываются"""
+        deadline = time.monotonic() + timeout
+        while not self.closed and (self._outbox or self._inflight) and time.monotonic() < deadline:
+            self._flush()
+            time.sleep(0.001)
+        self.closed = True
+        if self._loop is not None and self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            asyncio.run(self._main())
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self._incoming.put((None, e))
+            self._wake()
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self._writer = writer
+        try:
+            while True:
+                self._incoming.put(await read_frame(reader))
+                self._wake()
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("сервер закрыл соединение") from None
+        finally:
+            writer.close()
+
+    def _wake(self):
+        if not self._notified and self.notify is not None:
+            self._notified = True
+            self.notify()
+
+    # --- кадр приложения ---
+
+    def sync(self):
+        """шаг сессии в кадре приложения; False - соединение потеряно"""
+        if self.closed:
+            return False
+        # живое преобразование выделения - тоже правка для остальных
+        self.app.bake_transform()
+        self._notified = False
+        while not self.closed:
+            try:
+                kind, payload = self._incoming.get_nowait()
+            except queue.Empty:
+                break
+            self._receive(kind, payload)
+        self._transform_groups()
+        if self.closed:
+            return False
+        self._flush()
+        return True
+
+    def idle(self):
+        """все свои правки отправлены и подтверждены, входящих нет"""
+        return not (self._outbox or self._pending or self._inflight) and self._incoming.empty()
+
+    def status(self):
+        """строка состояния сессии"""
+        if self.closed:
+            return None
+        text = f"сессия: участник {self.number}"
+        if self.latency is not None:
+            text += f", {self.latency * 1000:.0f} мс"
+        if self._pending:
+            text += f", в пути {len(self._pending)}"
+        return text
+
+    def _receive(self, kind, payload):
+        if kind is None:
+            self.closed = True
+            self.error = payload
+        elif kind == ACK:
+            self._acknowledge(ACK_BODY.unpack(payload)[0])
+        elif kind == OPS:
+            for op in decode_ops(payload):
+                self._apply_remote(op)
+            self.received += 1
+        elif kind == SNAPSHOT:
+            self._transform_groups()
+            number, acked, next_id = SNAPSHOT_HEADER.unpack_from(payload)
+            self._load_snapshot(number, acked, next_id, decode_ops(payload, SNAPSHOT_HEADER.size))
+        else:
+            raise SessionProtocolError(f"неизвестный кадр: {kind}")
+
+    def _acknowledge(self, acked):
+        now = time.perf_counter()
+        while self._pending and self._pending[0][0] <= acked:
+            _, _, sent = self._pending.popleft()
+            self.latency = now - sent
+
+    def _local_ops(self):
+        """свои правки, которых сервер ещё не применил, по порядку"""
+        for _, ops, _ in self._pending:
+            yield from ops
+        yield from self._outbox
+
+    def _apply_remote(self, op):
+        app = self.app
+        code = op[0]
+        if code == TRANSFORM:
+            # преобразования копятся и применяются группами (одно обновление сетки
+            # и выделения на кадр); группа с уже затронутыми фигурами - после них
+            for ids, matrix in self._rebased(op[1], op[2]):
+                if any(members(ids, group_ids).any() for group_ids, _ in self._groups):
+                    self._transform_groups()
+                self._groups.append((ids, matrix))
+            return
+        self._transform_groups()
+        self.applying = True
+        try:
+            if code == CLEAR:
+                # свои ещё не применённые сервером фигуры очистка не затрагивает
+                added = [local[1]['ids'] for local in self._local_ops() if local[0] == ADD]
+                ids = app.shapes.ids
+                if added:
+                    ids = ids[~np.isin(ids, np.concatenate(added))]
+                app.remove_ids(ids.copy())
+            else:
+                apply_op(app, op)
+        finally:
+            self.applying = False
+
+    def _transform_groups(self):
+        if not self._groups:
+            return
+        groups, self._groups = self._groups, []
+        self.applying = True
+        try:
+            self.app.transform_ids(groups)
+        finally:
+            self.applying = False
+
+    def _rebased(self, ids, matrix):
+        """чужое преобразование поверх своих неподтверждённых: для фигуры с
+        их произведением P вместо matrix применяется P * matrix * P^-1;
+        возвращает пары (идентификаторы, матрица)"""
+        local = [(op[1], op[2]) for op in self._local_ops() if op[0] == TRANSFORM]
+        if not local:
+            return [(ids, matrix)]
+        member = np.stack([members(ids, local_ids) for local_ids, _ in local], axis=1)
+        if not member.any():
+            return [(ids, matrix)]
+        rows, groups = np.unique(member, axis=0, return_inverse=True)
+        groups = groups.reshape(-1)
+        result = []
+        for g, row in enumerate(rows):
+            p = np.eye(3)
+            for (_, m), used in zip(local, row):
+                if used:
+                    p = m @ p
+            result.append((ids[groups == g], p @ matrix @ np.linalg.inv(p)))
+        return result
+
+    def _load_snapshot(self, number, acked, next_id, ops):
+        app = self.app
+        self.number = number
+        self._acknowledge(acked)
+        app.shapes.set_id_space(ID_STRIDE, number, next_id)
+        self.applying = True
+        try:
+            app.replace_shapes(ops[0][1])
+            # свои правки, которых сервер ещё не применил, - поверх снимка
+            for op in self._local_ops():
+                apply_op(app, op)
+        finally:
+            self.applying = False
+
+    # --- свои правки (вызываются приложением) ---
+
+    def added(self, indices):
+        """фигуры indices добавлены"""
+        if not self.applying:
+            self._queue((ADD, self.app.shapes.take(index_array(indices))))
+
+    def removed(self, ids):
+        """фигуры ids удаляются"""
+        if not self.applying:
+            self._queue((DELETE, np.array(ids, dtype=np.int64)))
+
+    def transformed(self, indices, matrix):
+        """к фигурам indices применена матрица"""
+        if not self.applying:
+            # по возрастанию: так идентификаторы сверяются поиском в отсортированном
+            ids = self.app.shapes.ids[np.unique(index_array(indices))]
+            self._queue((TRANSFORM, ids, np.array(matrix, dtype=np.float64)))
+
+    def cleared(self):
+        """удалены все фигуры"""
+        if not self.applying:
+            # неотправленные правки очистка всё равно отменяет
+            self._outbox = [(CLEAR,)]
+
+    def _queue(self, op):
+        outbox = self._outbox
+        last = outbox[-1] if outbox else None
+        if self._inflight and last is not None and last[0] == op[0]:
+            # сокет занят: правки склеиваются, очередь не растёт
+            if op[0] == TRANSFORM and np.array_equal(last[1], op[1]):
+                outbox[-1] = (TRANSFORM, op[1], op[2] @ last[2])
+                return
+            if op[0] == DELETE:
+                outbox[-1] = (DELETE, np.concatenate((last[1], op[1])))
+                return
+            if op[0] == ADD and len(op[1]['ids']) and op[1]['ids'][0] > last[1]['ids'][-1]:
+                outbox[-1] = (ADD, concat_batches(last[1], op[1]))
+                return
+        outbox.append(op)
+
+    def _flush(self):
+        if not self._outbox or self._inflight or self._writer is None or self.closed:
+            return
+        ops, self._outbox = self._outbox, []
+        self._sent += 1
+        self._pending.append((self._sent, ops, time.perf_counter()))
+        self._inflight = True
+        self._loop.call_soon_threadsafe(self._write, encode_ops(ops))
+
+    def _write(self, payload):
+        self._writer.write(FRAME.pack(len(payload), OPS))
+        self._writer.write(payload)
+        asyncio.ensure_future(self._drain())
+
+    async def _drain(self):
+        try:
+            await self._writer.drain()
+        except ConnectionError:
+            return  # об обрыве сообщит чтение
+        self._inflight = False
+        if self._outbox:
+            self._wake()  # склеенные правки ждут следующего кадра
+
+
+# --- командная строка ---
+
+def serve_cli(argv=None):
+    """сервер общей сессии: python drawapp.py serve [--scene сцена.drws]"""
+    parser = argparse.ArgumentParser(description="сервер общей сессии рисования")
+    parser.add_argument('--host', default=SESSION_HOST)
+    parser.add_argument('--port', type=int, default=SESSION_PORT)
+    parser.add_argument('--scene', help="начальная сцена (.drws)")
+    parser.add_argument('--backlog', type=float, default=BACKLOG_BYTES / 1024 / 1024,
+                        help="МБ очереди отстающего участника до замены снимком")
+    args = parser.parse_args(argv)
+
+    store = ShapeStore()
+    if args.scene:
+        store.load_arrays(*read_scene(args.scene))
+
+    async def main():
+        server = SessionServer(store, int(args.backlog * 1024 * 1024))
+        host, port = await server.start(args.host, args.port)
+        print(f"сессия: {host}:{port}, фигур: {len(store)}")
+        await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(serve_cli())
@@ -0,0 +1,873 @@
+import numpy as np
+
+from geometry import polygon_bounds, transform_points, triangle_outlines
+from parallel import ENGINE
+
+SHAPE_TYPES = ('rectangle', 'triangle', 'freehand')
+TYPE_CODES = {name: code for code, name in enumerate(SHAPE_TYPES)}
+# незамкнутые контуры (ломаные от руки) по коду типа
+OPEN_TYPES = np.array([name == 'freehand' for name in SHAPE_TYPES])
+
+INITIAL_CAPACITY = 64
+
+
+def index_array(indices):
+    """индексы фигур массивом int64 (без копии для массивов и выделения)"""
+    if isinstance(indices, range):
+        return np.arange(indices.start, indices.stop, indices.step, dtype=np.int64)
+    if isinstance(indices, (np.ndarray, list, Selection)):
+        return np.asarray(indices, dtype=np.int64)
+    return np.fromiter(indices, dtype=np.int64)
+
+
+class ShapeView:
+    """словарь-подобное представление одной фигуры из хранилища"""
+
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def id(self):
+        """постоянный идентификатор фигуры (не меняется при сдвиге индексов)"""
+        return int(self._store.ids[self._index])
+
+    def keys(self):
+        if self._store.is_legacy(self._index):
+            return ('type', 'start', 'end', 'color', 'thickness')
+        return ('type', 'points', 'color', 'thickness')
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __getitem__(self, key):
+        store = self._store
+        i = self._index
+        if key == 'type':
+            return SHAPE_TYPES[store.types[i]]
+        if key == 'color':
+            return tuple(int(c) for c in store.colors[i])
+        if key == 'thickness':
+            return int(store.thickness[i])
+        if key in self.keys():
+            pts = [(float(x), float(y)) for x, y in store.points(i)]
+            if key == 'points':
+                return pts
+            return pts[0] if key == 'start' else pts[1]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        store = self._store
+        i = self._index
+        if key == 'type':
+            store.types[i] = TYPE_CODES[value]
+            store.touch([i])
+        elif key == 'color':
+            store.colors[i] = value[:3]
+            store.touch([i])
+        elif key == 'thickness':
+            store.thickness[i] = value
+            store.touch([i])
+        elif key == 'points' and not store.is_legacy(i):
+            store.set_points(i, value)
+        elif key in ('start', 'end') and store.is_legacy(i):
+            store.points(i)[0 if key == 'start' else 1] = value
+            store.refresh([i])
+        else:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self):
+        """копия фигуры в виде обычного словаря"""
+        return dict(self.items())
+
+    def apply_matrix(self, matrix):
+        self._store.apply_matrix([self._index], matrix)
+
+    def __eq__(self, other):
+        if isinstance(other, (ShapeView, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return f"ShapeView({self.to_dict()!r})"
+
+
+class ShapeStore:
+    """колоночное хранилище фигур: один массив вершин + массивы смещений,
+    типов, цветов и толщин
+
+    индекс фигуры - её позиция и сдвигается при удалениях; постоянный
+    идентификатор (колонка ids) выдаётся при добавлении и сохраняется
+    при удалении, отмене и повторе; идентификаторы возрастают в порядке фигур"""
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self._count = 0
+        self._vertex_count = 0
+        self._vertices = np.empty((capacity * 4, 2), dtype=np.float64)
+        self._offsets = np.zeros(capacity + 1, dtype=np.int64)
+        self._types = np.empty(capacity, dtype=np.int8)
+        self._colors = np.empty((capacity, 3), dtype=np.uint8)
+        self._thickness = np.empty(capacity, dtype=np.int32)
+        self._legacy = np.empty(capacity, dtype=bool)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._next_id = 0
+        # новые идентификаторы: id % id_stride == id_offset (у участников
+        # общей сессии - свои остатки, чтобы идентификаторы не совпадали)
+        self.id_stride = 1
+        self.id_offset = 0
+        # кэши, поддерживаемые при каждом изменении вершин
+        self._bounds = np.empty((capacity, 4), dtype=np.float64)  # min_x, min_y, max_x, max_y
+        self._sums = np.empty((capacity, 2), dtype=np.float64)  # сумма вершин фигуры
+        self._stamps = np.empty(capacity, dtype=np.int64)  # версия последнего изменения фигуры
+        self._owner = None  # кэш: индекс фигуры для каждой вершины
+        # счётчики изменений для кэшей отрисовки:
+        # version растёт при любом изменении, structure_version - при сдвиге индексов
+        self.version = 0
+        self.structure_version = 0
+        self.engine = ENGINE  # крупные преобразования и пересчёты идут кусками в потоках
+
+    # --- колонки (представления без копирования) ---
+
+    @property
+    def vertices(self):
+        return self._vertices[:self._vertex_count]
+
+    @property
+    def offsets(self):
+        return self._offsets[:self._count + 1]
+
+    @property
+    def types(self):
+        return self._types[:self._count]
+
+    @property
+    def colors(self):
+        return self._colors[:self._count]
+
+    @property
+    def thickness(self):
+        return self._thickness[:self._count]
+
+    @property
+    def legacy(self):
+        return self._legacy[:self._count]
+
+    @property
+    def ids(self):
+        return self._ids[:self._count]
+
+    @property
+    def sums(self):
+        return self._sums[:self._count]
+
+    @property
+    def vertex_counts(self):
+        return np.diff(self.offsets)
+
+    @property
+    def vertex_count(self):
+        return self._vertex_count
+
+    def vertex_owner(self):
+        """индекс фигуры для каждой вершины (кэшируется до изменения структуры)"""
+        if self._owner is None:
+            counts = np.diff(self.offsets)
+            self._owner = np.repeat(np.arange(self._count), counts)
+        return self._owner
+
+    # --- совместимость со списком словарей ---
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def _normalize_index(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("индекс фигуры вне диапазона")
+        return index
+
+    def __getitem__(self, index):
+        return ShapeView(self, self._normalize_index(index))
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield ShapeView(self, i)
+
+    def __delitem__(self, index):
+        i = self._normalize_index(index)
+        start, end = self._offsets[i], self._offsets[i + 1]
+        n = end - start
+        nv = self._vertex_count
+        self._vertices[start:nv - n] = self._vertices[end:nv]
+        self._vertex_count -= n
+        count = self._count
+        self._offsets[i + 1:count] = self._offsets[i + 2:count + 1] - n
+        for column in self._columns():
+            column[i:count - 1] = column[i + 1:count]
+        self._count -= 1
+        self._owner = None
+        self._bump_structure()
+
+    def _columns(self):
+        return (self._types, self._colors, self._thickness, self._legacy, self._ids,
+                self._bounds, self._sums, self._stamps)
+
+    def is_legacy(self, index):
+        return bool(self._legacy[index])
+
+    def points(self, index):
+        """вершины фигуры как представление массива (n, 2)"""
+        return self._vertices[self._offsets[index]:self._offsets[index + 1]]
+
+    def append(self, shape):
+        """добавление фигуры из словаря (структура points или start/end)"""
+        if 'points' in shape:
+            points, legacy = shape['points'], False
+        else:
+            points, legacy = [shape['start'], shape['end']], True
+        return self.add(shape['type'], points, shape['color'], shape['thickness'], legacy)
+
+    def add(self, shape_type, points, color, thickness, legacy=False):
+        """добавление фигуры, возвращает её индекс"""
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self._reserve(self._count + 1, self._vertex_count + len(pts))
+        i = self._count
+        start = self._vertex_count
+        self._vertices[start:start + len(pts)] = pts
+        self._vertex_count += len(pts)
+        self._offsets[i + 1] = self._vertex_count
+        self._types[i] = TYPE_CODES[shape_type]
+        self._colors[i] = color[:3]
+        self._thickness[i] = thickness
+        self._legacy[i] = legacy
+        self._ids[i] = self._new_ids(1)[0]
+        self._bounds[i, 0:2] = pts.min(axis=0)
+        self._bounds[i, 2:4] = pts.max(axis=0)
+        self._sums[i] = pts.sum(axis=0)
+        self._count += 1
+        self._owner = None
+        self.touch([i])
+        return i
+
+    def extend(self, shapes):
+        """добавление пачки фигур из словарей одним расширением массивов;
+        возвращает индексы новых фигур"""
+        points, types, colors, thickness, legacy = [], [], [], [], []
+        for shape in shapes:
+            if 'points' in shape:
+                points.append(shape['points'])
+                legacy.append(False)
+            else:
+                points.append([shape['start'], shape['end']])
+                legacy.append(True)
+            types.append(TYPE_CODES[shape['type']])
+            colors.append(tuple(shape['color'])[:3])
+            thickness.append(shape['thickness'])
+        count = len(types)
+        first = self._count
+        if not count:
+            return np.arange(first, first)
+        counts = np.fromiter((len(p) for p in points), dtype=np.int64, count=count)
+        verts = np.asarray([xy for pts in points for xy in pts], dtype=np.float64).reshape(-1, 2)
+        self._reserve(first + count, self._vertex_count + len(verts))
+        start = self._vertex_count
+        self._vertices[start:start + len(verts)] = verts
+        self._vertex_count += len(verts)
+        self._offsets[first + 1:first + count + 1] = start + np.cumsum(counts)
+        self._types[first:first + count] = types
+        self._colors[first:first + count] = colors
+        self._thickness[first:first + count] = thickness
+        self._legacy[first:first + count] = legacy
+        self._ids[first:first + count] = self._new_ids(count)
+        self._count += count
+        self._owner = None
+        indices = np.arange(first, first + count)
+        self.refresh(indices)
+        self.touch(indices)
+        return indices
+
+    def copy(self):
+        """независимая копия хранилища (снимок колонок)"""
+        clone = ShapeStore()
+        clone.load_arrays(self.vertices.copy(), self.offsets.copy(), self.types.copy(),
+                          self.colors.copy(), self.thickness.copy(), self.legacy.copy(),
+                          self.bounds().copy(), self.sums.copy(), self.ids.copy())
+        clone._next_id = self._next_id
+        return clone
+
+    def take(self, indices):
+        """копия колонок фигур indices (для отмены удаления и т.п.)"""
+        idx = np.asarray(indices, dtype=np.int64)
+        vertex_idx, _ = self.gather(idx)
+        return {
+            'vertices': self.vertices[vertex_idx],
+            'counts': self.vertex_counts[idx],
+            'types': self.types[idx],
+            'colors': self.colors[idx],
+            'thickness': self.thickness[idx],
+            'legacy': self.legacy[idx],
+            'ids': self.ids[idx],
+        }
+
+    def delete(self, indices):
+        """удаление фигур indices одним сжатием массивов;
+        возвращает маску оставшихся фигур (по старым индексам)"""
+        keep = np.ones(self._count, dtype=bool)
+        keep[index_array(indices)] = False
+        vertex_keep = keep[self.vertex_owner()]
+        offsets = np.zeros(int(keep.sum()) + 1, dtype=np.int64)
+        np.cumsum(self.vertex_counts[keep], out=offsets[1:])
+        self.load_arrays(self.vertices[vertex_keep], offsets, self.types[keep],
+                         self.colors[keep], self.thickness[keep], self.legacy[keep],
+                         self.bounds()[keep], self.sums[keep], self.ids[keep])
+        return keep
+
+    def insert(self, indices, batch):
+        """вставка фигур из batch (результат take) так, чтобы после вставки
+        они оказались на позициях indices (по возрастанию)"""
+        idx = index_array(indices)
+        if len(idx) and idx[0] == self._count and idx[-1] == self._count + len(idx) - 1:
+            self._append_batch(batch)
+            return
+        total = self._count + len(idx)
+        new = np.zeros(total, dtype=bool)
+        new[idx] = True
+
+        def merged(old, added):
+            out = np.empty((total,) + old.shape[1:], dtype=old.dtype)
+            out[new] = added
+            out[~new] = old
+            return out
+
+        counts = merged(self.vertex_counts, batch['counts'])
+        offsets = np.zeros(total + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        new_vertex = np.repeat(new, counts)
+        vertices = np.empty((int(offsets[-1]), 2), dtype=np.float64)
+        vertices[new_vertex] = batch['vertices']
+        vertices[~new_vertex] = self.vertices
+        ids = batch.get('ids')
+        if ids is None:
+            ids = self._new_ids(len(idx))
+        self.load_arrays(vertices, offsets, merged(self.types, batch['types']),
+                         merged(self.colors, batch['colors']),
+                         merged(self.thickness, batch['thickness']),
+                         merged(self.legacy, batch['legacy']), ids=merged(self.ids, ids))
+
+    def _append_batch(self, batch):
+        """вставка в конец - дописывание колонок без пересборки массивов"""
+        counts = np.asarray(batch['counts'], dtype=np.int64)
+        count = len(counts)
+        first, start = self._count, self._vertex_count
+        verts = np.asarray(batch['vertices'], dtype=np.float64).reshape(-1, 2)
+        self._reserve(first + count, start + len(verts))
+        self._vertices[start:start + len(verts)] = verts
+        self._vertex_count += len(verts)
+        self._offsets[first + 1:first + count + 1] = start + np.cumsum(counts)
+        self._types[first:first + count] = batch['types']
+        self._colors[first:first + count] = batch['colors']
+        self._thickness[first:first + count] = batch['thickness']
+        self._legacy[first:first + count] = batch['legacy']
+        ids = batch.get('ids')
+        if ids is None:
+            ids = self._new_ids(count)
+        elif count:
+            self._next_id = max(self._next_id, int(np.max(ids)) + 1)
+        self._ids[first:first + count] = ids
+        self._count += count
+        self._owner = None
+        self.refresh(np.arange(first, first + count))
+
+    def merge(self, batch):
+        """вставка фигур batch (результат take) на места по возрастанию
+        идентификаторов; уже имеющиеся идентификаторы пропускаются;
+        возвращает индексы вставленных фигур"""
+        ids = np.asarray(batch['ids'], dtype=np.int64)
+        fresh = self.index_of(ids) < 0
+        order = np.argsort(ids[fresh], kind='stable')
+        if not fresh.all() or (order[1:] < order[:-1]).any():
+            batch = take_batch(batch, np.flatnonzero(fresh)[order])
+            ids = batch['ids']
+        if not len(ids):
+            return np.zeros(0, dtype=np.int64)
+        indices = np.searchsorted(self.ids, ids) + np.arange(len(ids))
+        self.insert(indices, batch)
+        return indices
+
+    def set_points(self, index, points):
+        """замена вершин фигуры (при другом числе вершин массив сдвигается)"""
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        start, end = self._offsets[index], self._offsets[index + 1]
+        delta = len(pts) - (end - start)
+        if delta:
+            self._reserve(self._count, self._vertex_count + delta)
+            nv = self._vertex_count
+            self._vertices[end + delta:nv + delta] = self._vertices[end:nv].copy()
+            self._offsets[index + 1:self._count + 1] += delta
+            self._vertex_count += delta
+            self._owner = None
+        self._vertices[start:start + len(pts)] = pts
+        self.refresh([index])
+
+    def load_arrays(self, vertices, offsets, types, colors, thickness, legacy,
+                    bounds=None, sums=None, ids=None):
+        """замена содержимого готовыми колонками (без копирования, если типы совпадают);
+        кэши границ и сумм пересчитываются, если не переданы, без ids фигуры
+        получают новые идентификаторы"""
+        count = len(types)
+        self._vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        self._types = np.asarray(types, dtype=np.int8)
+        self._colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+        self._thickness = np.asarray(thickness, dtype=np.int32)
+        self._legacy = np.asarray(legacy, dtype=bool)
+        if ids is None:
+            self._ids = self._new_ids(count)
+        else:
+            self._ids = np.asarray(ids, dtype=np.int64)
+            if count:
+                self._next_id = max(self._next_id, int(self._ids.max()) + 1)
+        self._stamps = np.zeros(count, dtype=np.int64)
+        self._count = count
+        self._vertex_count = len(self._vertices)
+        self._owner = None
+        self._bump_structure()
+        if bounds is not None and sums is not None:
+            self._bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+            self._sums = np.asarray(sums, dtype=np.float64).reshape(-1, 2)
+        else:
+            self._bounds = np.empty((count, 4), dtype=np.float64)
+            self._sums = np.empty((count, 2), dtype=np.float64)
+            self.refresh()
+
+    def clear(self):
+        self._count = 0
+        self._vertex_count = 0
+        self._owner = None
+        self._bump_structure()
+
+    # --- идентификаторы ---
+
+    @property
+    def next_id(self):
+        """все выданные и загруженные идентификаторы меньше этого"""
+        return self._next_id
+
+    def set_id_space(self, stride, offset, floor=0):
+        """новые идентификаторы - с остатком offset по модулю stride
+        и не меньше floor"""
+        self.id_stride = stride
+        self.id_offset = offset
+        self._next_id = max(self._next_id, floor)
+
+    def _new_ids(self, count):
+        step = self.id_stride
+        first = self._next_id + (self.id_offset - self._next_id) % step
+        ids = np.arange(first, first + count * step, step, dtype=np.int64)
+        if count:
+            self._next_id = int(ids[-1]) + 1
+        return ids
+
+    def index_of(self, ids):
+        """индексы фигур по идентификаторам (-1 для отсутствующих), бинарным поиском"""
+        wanted = np.asarray(ids, dtype=np.int64)
+        pos = np.searchsorted(self.ids, wanted)
+        found = pos < self._count
+        found[found] = self.ids[pos[found]] == wanted[found]
+        return np.where(found, pos, -1)
+
+    # --- отслеживание изменений ---
+
+    def touch(self, indices):
+        """отметка фигур indices как изменённых"""
+        self.version += 1
+        self._stamps[indices] = self.version
+
+    def _bump_structure(self):
+        self.version += 1
+        self.structure_version += 1
+
+    def changed_since(self, version):
+        """индексы фигур, изменённых после версии version"""
+        return np.flatnonzero(self._stamps[:self._count] > version)
+
+    def _reserve(self, shape_capacity, vertex_capacity):
+        """увеличение ёмкости массивов (удвоением)"""
+        if shape_capacity > len(self._types):
+            cap = max(shape_capacity, 2 * len(self._types))
+            self._offsets = _grow(self._offsets, cap + 1)
+            self._types = _grow(self._types, cap)
+            self._colors = _grow(self._colors, cap)
+            self._thickness = _grow(self._thickness, cap)
+            self._legacy = _grow(self._legacy, cap)
+            self._ids = _grow(self._ids, cap)
+            self._bounds = _grow(self._bounds, cap)
+            self._sums = _grow(self._sums, cap)
+            self._stamps = _grow(self._stamps, cap)
+        if vertex_capacity > len(self._vertices):
+            cap = max(vertex_capacity, 2 * len(self._vertices))
+            self._vertices = _grow(self._vertices, cap)
+
+    # --- границы ---
+
+    def gather(self, indices):
+        """индексы вершин фигур indices подряд и начала их отрезков"""
+        idx = np.asarray(indices, dtype=np.int64)
+        starts = self._offsets[idx]
+        counts = self._offsets[idx + 1] - starts
+        segments = np.cumsum(counts) - counts
+        vertex_idx = np.arange(counts.sum()) + np.repeat(starts - segments, counts)
+        return vertex_idx, segments
+
+    def bounds(self, indices=None):
+        """границы фигур массивом (k, 4): min_x, min_y, max_x, max_y (из кэша)"""
+        if indices is None:
+            return self._bounds[:self._count]
+        return self._bounds[np.asarray(indices, dtype=np.int64)]
+
+    def refresh(self, indices=None):
+        """пересчёт кэша границ и сумм вершин для фигур indices"""
+        if indices is None:
+            idx = np.arange(self._count)
+            if self.engine.parallel(len(idx)):
+                self._chunked(idx)
+                return
+            verts = self.vertices
+            segments = self.offsets[:-1]
+        else:
+            idx = np.asarray(indices, dtype=np.int64)
+            if self.engine.parallel(len(idx)):
+                self._chunked(idx)
+                return
+            vertex_idx, segments = self.gather(idx)
+            verts = self.vertices[vertex_idx]
+        if not len(idx):
+            return
+        self._bounds[idx] = polygon_bounds(verts, segments)
+        self._sums[idx] = np.add.reduceat(verts, segments, axis=0)
+        self.touch(idx)
+
+    def _refresh_chunk(self, idx, matrix=None):
+        """границы и суммы вершин фигур idx (с переносом матрицы в их вершины)"""
+        vertex_idx, segments = self.gather(idx)
+        verts = self._vertices[vertex_idx]
+        if matrix is not None:
+            verts = transform_points(verts, matrix)
+            self._vertices[vertex_idx] = verts
+        self._bounds[idx] = polygon_bounds(verts, segments)
+        self._sums[idx] = np.add.reduceat(verts, segments, axis=0)
+
+    def _chunked(self, idx, matrix=None):
+        """_refresh_chunk по кускам idx в пуле engine; фигуры кусков
+        не пересекаются, поэтому и их вершины, и строки кэшей тоже"""
+        self.engine.map(lambda start, stop: self._refresh_chunk(idx[start:stop], matrix), len(idx))
+        self.touch(idx)
+
+    # --- трансформации ---
+
+    def vertex_mask(self, indices):
+        """булева маска вершин, принадлежащих фигурам из indices"""
+        shape_mask = np.zeros(self._count, dtype=bool)
+        shape_mask[index_array(indices)] = True
+        return shape_mask[self.vertex_owner()]
+
+    def apply_matrix(self, indices, matrix):
+        """применение матрицы 3x3 ко всем вершинам фигур indices одной операцией"""
+        m = np.asarray(matrix, dtype=np.float64)
+        if len(indices) == 1:
+            i = next(iter(indices))
+            sel = slice(self._offsets[i], self._offsets[i + 1])
+            idx = [i]
+        else:
+            idx = index_array(indices)
+            if self.engine.parallel(len(idx)):
+                # крупное выделение - куски по фигурам без общей маски вершин
+                self._chunked(idx, m)
+                return
+            if len(idx) * 4 < self._count:
+                # небольшое - вершины по индексам, без маски по всей сцене
+                sel, _ = self.gather(idx)
+            else:
+                sel = self.vertex_mask(idx)
+        verts = self.vertices
+        verts[sel] = transform_points(verts[sel], m)
+        self.refresh(idx)
+
+    def apply_matrices(self, groups):
+        """применение своей матрицы к каждой группе фигур [(indices, matrix), ...];
+        группы не пересекаются, кэши границ пересчитываются одним проходом"""
+        if len(groups) == 1:
+            self.apply_matrix(*groups[0])
+            return
+        verts = self.vertices
+        for indices, matrix in groups:
+            vertex_idx, _ = self.gather(index_array(indices))
+            verts[vertex_idx] = transform_points(verts[vertex_idx], matrix)
+        self.refresh(np.concatenate([index_array(indices) for indices, _ in groups]))
+
+    def triangles(self, indices):
+        """первые три вершины контура фигур indices массивом (k, 3, 2);
+        у старых фигур start/end треугольник строится по их углам"""
+        idx = index_array(indices)
+        first = self._offsets[idx]
+        counts = self._offsets[idx + 1] - first
+        tri = self._vertices[first[:, None] + np.minimum(np.arange(3), counts[:, None] - 1)]
+        legacy = self._legacy[idx]
+        if legacy.any():
+            start = first[legacy]
+            tri[legacy] = triangle_outlines(self._vertices[start], self._vertices[start + 1])
+        return tri
+
+
+def take_batch(batch, rows):
+    """фигуры rows из batch (результата ShapeStore.take) в том же формате"""
+    rows = np.asarray(rows, dtype=np.int64)
+    counts = np.asarray(batch['counts'], dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    picked = counts[rows]
+    vertex_idx = np.arange(picked.sum()) + np.repeat(starts[rows] - (np.cumsum(picked) - picked), picked)
+    part = {name: np.asarray(column)[rows] for name, column in batch.items() if name != 'vertices'}
+    part['vertices'] = np.asarray(batch['vertices']).reshape(-1, 2)[vertex_idx]
+    return part
+
+
+def _grow(array, size):
+    grown = np.empty((size,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class Selection:
+    """выделение фигур: булева маска по индексам хранилища и накопленная
+    сумма вершин выбранных фигур, чтобы центр выделения считался за O(1);
+    выбрать всё, инвертировать и сжать после удаления - один проход по маске
+
+    преобразования выделения можно откладывать: матрица pending копится
+    и переносится в вершины хранилища одним вызовом flush (автоматически
+    перед любым изменением состава выделения)"""
+
+    def __init__(self, store):
+        self._store = store
+        self._mask = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self._count = 0
+        self._indices = None  # кэш отсортированных индексов (только для чтения)
+        self._sum = np.zeros(2, dtype=np.float64)
+        self._vertex_count = 0
+        self.version = 0  # растёт при каждом изменении состава выделения
+        self.pending = None  # отложенная матрица 3x3 (numpy) или None
+        self.pending_version = 0  # растёт при каждом отложенном преобразовании
+        self.on_flush = None  # вызывается с выделением и матрицей после её переноса в вершины
+
+    def _view(self):
+        """маска по текущим фигурам хранилища (растёт вместе с ним)"""
+        count = len(self._store)
+        if count > len(self._mask):
+            grown = np.zeros(max(count, 2 * len(self._mask)), dtype=bool)
+            grown[:len(self._mask)] = self._mask
+            self._mask = grown
+        return self._mask[:count]
+
+    def _changed(self):
+        self.version += 1
+        self._indices = None
+
+    @property
+    def mask(self):
+        """булева маска выбранных фигур (только для чтения)"""
+        view = self._view()
+        view.flags.writeable = False
+        return view
+
+    def indices(self):
+        """индексы выбранных фигур по возрастанию (массив только для чтения)"""
+        if self._indices is None:
+            self._indices = np.flatnonzero(self._view())
+            self._indices.flags.writeable = False
+        return self._indices
+
+    def contains(self, indices):
+        """маска: какие из фигур indices выбраны"""
+        return self._view()[index_array(indices)]
+
+    def __contains__(self, index):
+        # маска растёт лениво: фигуры за её концом не выбраны
+        return 0 <= index < min(len(self._store), len(self._mask)) and bool(self._mask[index])
+
+    def __iter__(self):
+        return iter(self.indices().tolist())
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def __array__(self, dtype=None, copy=None):
+        idx = self.indices()
+        return idx if dtype is None else idx.astype(dtype, copy=False)
+
+    def __eq__(self, other):
+        if isinstance(other, Selection):
+            return np.array_equal(self.indices(), other.indices())
+        return set(self.indices().tolist()) == other
+
+    def __repr__(self):
+        return f"Selection({self.indices().tolist()!r})"
+
+    def add(self, index):
+        self.flush()
+        view = self._view()
+        if not view[index]:
+            view[index] = True
+            self._count += 1
+            self._changed()
+            self._sum += self._store.sums[index]
+            self._vertex_count += int(self._store.offsets[index + 1] - self._store.offsets[index])
+
+    def discard(self, index):
+        self.flush()
+        if index in self:
+            self._mask[index] = False
+            self._count -= 1
+            self._changed()
+            self._sum -= self._store.sums[index]
+            self._vertex_count -= int(self._store.offsets[index + 1] - self._store.offsets[index])
+
+    def remove(self, index):
+        if index not in self:
+            raise KeyError(index)
+        self.discard(index)
+
+    def update(self, indices):
+        self.flush()
+        idx = index_array(indices)
+        if not len(idx):
+            return
+        view = self._view()
+        new = idx[~view[idx]]
+        if len(new) > 1 and not (new[1:] > new[:-1]).all():
+            new = np.unique(new)
+        if len(new):
+            view[new] = True
+            self._count += len(new)
+            self._changed()
+            offsets = self._store.offsets
+            self._sum += self._store.sums[new].sum(axis=0)
+            self._vertex_count += int((offsets[new + 1] - offsets[new]).sum())
+
+    def replace(self, indices):
+        """замена выделения новым набором фигур"""
+        self.clear()
+        self.update(indices)
+
+    def select_all(self):
+        """выбор всех фигур"""
+        self.flush()
+        view = self._view()
+        if self._count == len(view):
+            return
+        view[:] = True
+        self._count = len(view)
+        self._changed()
+        self.refresh()
+
+    def invert(self):
+        """инверсия выделения"""
+        self.flush()
+        view = self._view()
+        if not len(view):
+            return
+        np.logical_not(view, out=view)
+        self._count = len(view) - self._count
+        self._changed()
+        self.refresh()
+
+    def clear(self):
+        self.flush()
+        if self._count:
+            self._mask[:] = False
+            self._count = 0
+            self._changed()
+        self._sum[:] = 0
+        self._vertex_count = 0
+
+    def compact(self, keep):
+        """учёт удаления фигур из хранилища: keep - маска оставшихся
+        фигур по старым индексам (результат ShapeStore.delete)"""
+        self.flush()
+        mask = np.zeros(len(keep), dtype=bool)
+        size = min(len(keep), len(self._mask))
+        mask[:size] = self._mask[:size]
+        self._mask = mask[keep]
+        self._count = int(np.count_nonzero(self._mask))
+        self._changed()
+        self.refresh()
+
+    def inserted(self, new):
+        """учёт вставки фигур в хранилище: new - маска вставленных фигур
+        по новым индексам; выбранные фигуры остаются выбранными"""
+        self.flush()
+        mask = np.zeros(len(new), dtype=bool)
+        old = self._view()[:len(new) - int(np.count_nonzero(new))]
+        mask[~new] = old
+        self._mask = mask
+        self._changed()
+        self.refresh()
+
+    def refresh(self):
+        """точный пересчёт суммы (сбрасывает накопленную погрешность)"""
+        view = self._view()
+        self._sum = self._store.sums[view].sum(axis=0)
+        self._vertex_count = int(self._store.vertex_counts[view].sum())
+
+    def transformed(self, matrix):
+        """учёт аффинного преобразования, применённого ко всем выбранным фигурам"""
+        m = np.asarray(matrix, dtype=np.float64)
+        self._sum = m[:2, :2] @ self._sum + self._vertex_count * m[:2, 2]
+
+    def vertex_sum(self):
+        """сумма координат и количество вершин выбранных фигур"""
+        return self._sum, self._vertex_count
+
+    def defer(self, matrix):
+        """откладывание преобразования: O(1), вершины не трогаются"""
+        m = np.asarray(matrix, dtype=np.float64)
+        self.pending = m if self.pending is None else m @ self.pending
+        self.pending_version += 1
+        self.transformed(m)
+
+    def flush(self):
+        """перенос отложенной матрицы в вершины выбранных фигур"""
+        if self.pending is None:
+            return
+        matrix, self.pending = self.pending, None
+        self.pending_version += 1
+        if self._count:
+            self._store.apply_matrix(self, matrix)
+            if self.on_flush is not None:
+                self.on_flush(self, matrix)
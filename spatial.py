@@ -0,0 +1,251 @@
+from collections import defaultdict
+
+import numpy as np
+
+from parallel import ENGINE
+
+CELL_SIZE = 64
+MAX_CELLS_PER_SHAPE = 64  # фигуры крупнее хранятся в отдельном списке
+SCAN_RATIO = 64  # ячейка сетки в запросе стоит примерно столько проверок границ массивом
+REBUILD_FRACTION = 0.25  # если сместилась такая доля фигур, сетка перестраивается целиком
+KEY_BIAS = 2 ** 31  # сдвиг номеров ячеек, чтобы ключи были неотрицательными
+
+
+def cell_keys(cx, cy):
+    """ключи ячеек: упорядочены по cx, внутри столбца - по cy"""
+    return (np.asarray(cx, dtype=np.int64) + KEY_BIAS) * 2 ** 32 + (np.asarray(cy, dtype=np.int64) + KEY_BIAS)
+
+
+class SpatialGrid:
+    """равномерная сетка по ограничивающим прямоугольникам фигур
+
+    после перестройки пары (ячейка, фигура) хранятся упакованными массивами,
+    отсортированными по ключу ячейки (строятся и читаются векторно);
+    фигуры, добавленные или сместившиеся позже, хранятся в словаре ячеек,
+    а их устаревшие упакованные записи отбрасываются маской _packed"""
+
+    def __init__(self, cell_size=CELL_SIZE, max_cells=MAX_CELLS_PER_SHAPE):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self._cells = defaultdict(set)  # (cx, cy) -> индексы фигур
+        self._large = set()  # фигуры, покрывающие слишком много ячеек
+        self._ranges = np.zeros((0, 4), dtype=np.int64)  # cx0, cy0, cx1, cy1
+        self._bounds = np.zeros((0, 4), dtype=np.float64)
+        self._packed = np.zeros(0, dtype=bool)  # упакованные записи фигуры актуальны
+        self._keys = np.zeros(0, dtype=np.int64)  # занятые ячейки по возрастанию ключа
+        self._starts = np.zeros(1, dtype=np.int64)  # начала отрезков _owners для ячеек
+        self._owners = np.zeros(0, dtype=np.int64)
+        self._count = 0
+        self.engine = ENGINE  # полный перебор границ крупной сцены - кусками в потоках
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def bounds(self):
+        """границы проиндексированных фигур (min_x, min_y, max_x, max_y)"""
+        return self._bounds[:self._count]
+
+    @property
+    def occupied(self):
+        """число занятых ячеек (оценка, для выбора способа запроса)"""
+        return len(self._keys) + len(self._cells)
+
+    def cell_ranges(self, bounds):
+        """диапазоны ячеек для массива границ"""
+        return np.floor_divide(bounds, self.cell_size).astype(np.int64)
+
+    def _reserve(self, count):
+        if count > len(self._ranges):
+            cap = max(count, 2 * len(self._ranges), 64)
+            for name in ('_ranges', '_bounds', '_packed'):
+                old = getattr(self, name)
+                grown = np.zeros((cap,) + old.shape[1:], dtype=old.dtype)
+                grown[:len(old)] = old
+                setattr(self, name, grown)
+
+    def _link(self, index, cell_range):
+        cx0, cy0, cx1, cy1 = (int(c) for c in cell_range)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > self.max_cells:
+            self._large.add(index)
+            return
+        cells = self._cells
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cells[(cx, cy)].add(index)
+
+    def _unlink(self, index, cell_range):
+        if index in self._large:
+            self._large.discard(index)
+            return
+        if self._packed[index]:
+            # упакованные записи не трогаем - они просто перестают учитываться
+            self._packed[index] = False
+            return
+        cx0, cy0, cx1, cy1 = (int(c) for c in cell_range)
+        cells = self._cells
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = cells.get((cx, cy))
+                if bucket is not None:
+                    bucket.discard(index)
+                    if not bucket:
+                        del cells[(cx, cy)]
+
+    def insert(self, index, bounds):
+        """добавление фигуры с индексом index (индексы идут подряд)"""
+        self._reserve(index + 1)
+        self._count = max(self._count, index + 1)
+        self._bounds[index] = bounds
+        cell_range = self.cell_ranges(np.asarray(bounds, dtype=np.float64))
+        self._ranges[index] = cell_range
+        self._packed[index] = False
+        self._link(index, cell_range)
+
+    def extend(self, first, bounds):
+        """добавление пачки фигур с индексами first, first + 1, ..."""
+        count = len(bounds)
+        if not count:
+            return
+        self._reserve(first + count)
+        self._count = max(self._count, first + count)
+        self._bounds[first:first + count] = bounds
+        if count > self._count * REBUILD_FRACTION:
+            # крупная пачка - векторная перестройка вместо поштучной вставки
+            self.rebuild(self._bounds[:self._count].copy())
+            return
+        ranges = self.cell_ranges(np.asarray(bounds, dtype=np.float64))
+        self._ranges[first:first + count] = ranges
+        self._packed[first:first + count] = False
+        for index, cell_range in enumerate(ranges, first):
+            self._link(index, cell_range)
+
+    def update(self, indices, bounds):
+        """обновление границ фигур; ячейки трогаются только у сместившихся"""
+        idx = np.asarray(indices, dtype=np.int64)
+        if not len(idx):
+            return
+        new_ranges = self.cell_ranges(bounds)
+        self._bounds[idx] = bounds
+        changed = np.any(new_ranges != self._ranges[idx], axis=1)
+        if np.count_nonzero(changed) > self._count * REBUILD_FRACTION:
+            # векторная перестройка дешевле поштучного переноса по ячейкам
+            self.rebuild(self._bounds[:self._count].copy())
+            return
+        for index, cell_range in zip(idx[changed].tolist(), new_ranges[changed]):
+            self._unlink(index, self._ranges[index])
+            self._ranges[index] = cell_range
+            self._link(index, cell_range)
+
+    def clear(self):
+        self._cells.clear()
+        self._large.clear()
+        self._packed[:] = False
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._starts = np.zeros(1, dtype=np.int64)
+        self._owners = np.zeros(0, dtype=np.int64)
+        self._count = 0
+
+    def rebuild(self, bounds):
+        """полная перестройка сетки по массиву границ всех фигур"""
+        self.clear()
+        count = len(bounds)
+        self._reserve(count)
+        self._count = count
+        if not count:
+            return
+        self._bounds[:count] = bounds
+        ranges = self.cell_ranges(np.asarray(bounds, dtype=np.float64))
+        self._ranges[:count] = ranges
+        widths = ranges[:, 2] - ranges[:, 0] + 1
+        heights = ranges[:, 3] - ranges[:, 1] + 1
+        sizes = widths * heights
+        large = sizes > self.max_cells
+        self._large.update(np.flatnonzero(large).tolist())
+        self._packed[:count] = ~large
+
+        # пары (ячейка, фигура) строятся векторно и группируются сортировкой
+        small = np.flatnonzero(~large)
+        sizes = sizes[small]
+        owners = np.repeat(small, sizes)
+        local = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        w = np.repeat(widths[small], sizes)
+        cx = np.repeat(ranges[small, 0], sizes) + local % w
+        cy = np.repeat(ranges[small, 1], sizes) + local // w
+        keys = cell_keys(cx, cy)
+        order = np.argsort(keys, kind='stable')  # внутри ячейки - по возрастанию индекса
+        keys, self._owners = keys[order], owners[order]
+        if not len(keys):
+            return  # все фигуры крупные - упакованных ячеек нет
+        breaks = np.flatnonzero(np.diff(keys)) + 1
+        self._keys = keys[np.concatenate(([0], breaks))]
+        self._starts = np.concatenate(([0], breaks, [len(keys)]))
+
+    def _packed_candidates(self, cx0, cy0, cx1, cy1):
+        """фигуры из упакованных массивов с ячейками в диапазоне (с повторами)"""
+        keys = self._keys
+        if not len(keys):
+            return self._owners[:0]
+        if cx1 - cx0 + 1 > len(keys):
+            # столбцов больше, чем занятых ячеек - проверяем все ячейки разом
+            cx = (keys >> 32) - KEY_BIAS
+            cy = (keys & 0xFFFFFFFF) - KEY_BIAS
+            hit = np.flatnonzero((cx >= cx0) & (cx <= cx1) & (cy >= cy0) & (cy <= cy1))
+            lo, hi = self._starts[hit], self._starts[hit + 1]
+        else:
+            # в каждом столбце нужные ячейки идут подряд
+            columns = np.arange(cx0, cx1 + 1)
+            lo = self._starts[np.searchsorted(keys, cell_keys(columns, cy0))]
+            hi = self._starts[np.searchsorted(keys, cell_keys(columns, cy1), side='right')]
+        counts = hi - lo
+        total = int(counts.sum())
+        if not total:
+            return self._owners[:0]
+        owners = self._owners[np.arange(total) + np.repeat(lo - (np.cumsum(counts) - counts), counts)]
+        return owners[self._packed[owners]]
+
+    def query_point(self, x, y, tolerance=0):
+        """кандидаты, чьи ячейки покрывают окрестность точки"""
+        return self.query_rect(x - tolerance, y - tolerance, x + tolerance, y + tolerance)
+
+    def query_rect(self, x0, y0, x1, y1):
+        """кандидаты (индексы по возрастанию), чьи ячейки пересекают
+        прямоугольник [x0, x1] x [y0, y1]"""
+        cs = self.cell_size
+        cx0, cy0 = int(x0 // cs), int(y0 // cs)
+        cx1, cy1 = int(x1 // cs), int(y1 // cs)
+        found = set(self._large)
+        cells = self._cells
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(cells):
+            # запрос больше занятой части сетки - обходим только занятые ячейки
+            for (cx, cy), bucket in cells.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    found |= bucket
+        else:
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    bucket = cells.get((cx, cy))
+                    if bucket:
+                        found |= bucket
+        packed = self._packed_candidates(cx0, cy0, cx1, cy1)
+        if found:
+            packed = np.concatenate((packed, np.fromiter(found, dtype=np.int64, count=len(found))))
+        return np.unique(packed)
+
+    def intersecting(self, x0, y0, x1, y1):
+        """индексы фигур по возрастанию, чьи границы пересекают [x0, x1] x [y0, y1]"""
+        cs = self.cell_size
+        cell_count = (int(x1 // cs) - int(x0 // cs) + 1) * (int(y1 // cs) - int(y0 // cs) + 1)
+        if cell_count > self.occupied or cell_count * SCAN_RATIO > self._count:
+            # обход ячеек дороже, чем проверить все границы разом
+            bounds = self.bounds
+
+            def scan(start, stop):
+                b = bounds[start:stop]
+                return start + np.flatnonzero((b[:, 0] <= x1) & (b[:, 2] >= x0) &
+                                              (b[:, 1] <= y1) & (b[:, 3] >= y0))
+
+            return self.engine.concatenate(scan, len(bounds))
+        idx = self.query_rect(x0, y0, x1, y1)
+        b = self._bounds[idx]
+        return idx[(b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)]
@@ -0,0 +1,76 @@
+import numpy as np
+
+from geometry import simplify_rdp
+
+STROKE_TOLERANCE = 1.0  # допуск упрощения росчерка в экранных пикселях
+STROKE_CHUNK = 64  # точек в хвосте, после которых он упрощается и фиксируется
+
+
+class Stroke:
+    """росчерк свободной ломаной, упрощаемый прямо во время рисования
+
+    каждый отсчёт мыши сначала проходит радиальный фильтр: точка ближе
+    tolerance к последней принятой отбрасывается за O(1); принятые копятся
+    в хвосте, и как только их STROKE_CHUNK, хвост упрощается
+    Рамером-Дугласом-Пекером и переносится в готовую часть - ни память,
+    ни работа на отсчёт не растут с длиной росчерка
+
+    координаты мировые, tolerance - в мировых единицах"""
+
+    def __init__(self, start, tolerance, chunk=STROKE_CHUNK):
+        self.tolerance = tolerance
+        self.chunk = chunk
+        self.samples = 1  # сколько отсчётов пришло всего
+        start = (float(start[0]), float(start[1]))
+        self._fixed = [start]  # упрощённая часть; последняя точка - начало хвоста
+        self._tail = [start]  # принятые фильтром точки, ещё не упрощённые
+        self._last = None  # последний отброшенный отсчёт - им росчерк закончится
+
+    def __len__(self):
+        return len(self._fixed) + len(self._tail) - 1 + (self._last is not None)
+
+    def add(self, point):
+        """очередной отсчёт; True, если точка принята"""
+        self.samples += 1
+        x, y = float(point[0]), float(point[1])
+        lx, ly = self._tail[-1]
+        if (x - lx) ** 2 + (y - ly) ** 2 <= self.tolerance ** 2:
+            self._last = (x, y)
+            return False
+        self._last = None
+        self._tail.append((x, y))
+        if len(self._tail) >= self.chunk:
+            self._settle()
+        return True
+
+    def extend(self, points):
+        """пачка отсчётов по порядку"""
+        for point in points:
+            self.add(point)
+
+    def _settle(self):
+        tail = np.asarray(self._tail)
+        kept = tail[simplify_rdp(tail, self.tolerance)].tolist()
+        self._fixed.extend(map(tuple, kept[1:]))
+        self._tail = [self._fixed[-1]]
+
+    def points(self):
+        """текущие вершины росчерка массивом (n, 2), включая неупрощённый хвост"""
+        pts = self._fixed + self._tail[1:]
+        if self._last is not None:
+            pts = pts + [self._last]
+        return np.asarray(pts, dtype=np.float64)
+
+    def finish(self):
+        """вершины готовой ломаной (n, 2) или None, если росчерк вырожден
+        (все отсчёты в пределах допуска от первого)"""
+        moved = len(self._fixed) > 1 or len(self._tail) > 1
+        if self._last is not None and moved:
+            # конец росчерка - там, где отпустили кнопку, даже если он близко
+            self._tail.append(self._last)
+            self._last = None
+        if len(self._tail) > 1:
+            self._settle()
+        if len(self._fixed) < 2:
+            return None
+        return np.asarray(self._fixed, dtype=np.float64)
@@ -0,0 +1,44 @@
+"""общие для тестов сцены и сравнения"""
+import numpy as np
+
+from shapestore import TYPE_CODES
+
+
+def random_scene(count, seed=7):
+    """массивы load_arrays: случайные прямоугольники и треугольники"""
+    rng = np.random.default_rng(seed)
+    rect = rng.random(count) < 0.5
+    counts = np.where(rect, 4, 3)
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    vertices = rng.uniform(-2000, 2000, (int(offsets[-1]), 2))
+    types = np.where(rect, TYPE_CODES['rectangle'], TYPE_CODES['triangle'])
+    colors = rng.integers(0, 256, (count, 3))
+    thickness = rng.integers(1, 5, count)
+    return vertices, offsets, types, colors, thickness, np.zeros(count, dtype=bool)
+
+
+def rotation(angle, cx=0.0, cy=0.0):
+    """матрица поворота на angle вокруг (cx, cy)"""
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array([[c, -s, cx - c * cx + s * cy], [s, c, cy - s * cx - c * cy], [0, 0, 1]])
+
+
+def shapes(count, x=0.0):
+    """словари прямоугольников для add_shapes"""
+    return [{'type': 'rectangle', 'points': [(x + i, 0), (x + i + 5, 0), (x + i + 5, 5), (x + i, 5)],
+             'color': (i % 256, 0, 0), 'thickness': 1 + i % 3} for i in range(count)]
+
+
+def scene(store):
+    """снимок сцены для сравнения: идентификаторы, вершины, смещения, цвета"""
+    return store.ids.copy(), store.vertices.copy(), store.offsets.copy(), store.colors.copy()
+
+
+def same(a, b, exact):
+    """совпадение снимков scene; вершины - точно или с точностью до округления"""
+    if not all(np.array_equal(x, y) for x, y in zip(a[:1] + a[2:], b[:1] + b[2:])):
+        return False
+    if exact:
+        return np.array_equal(a[1], b[1])
+    return a[1].shape == b[1].shape and np.allclose(a[1], b[1], rtol=0, atol=1e-9)
@@ -0,0 +1,42 @@
+"""серии контуров одного цвета растеризуются массивами в те же пиксели, что pygame"""
+import numpy as np
+import pygame
+import pytest
+
+from drawlist import DrawList
+from shapestore import ShapeStore, TYPE_CODES
+
+
+def reference(surface, store, indices, zoom, offset):
+    """контуры по одному вызову pygame на фигуру"""
+    for i in indices:
+        points = (store.points(i) * zoom + offset).tolist()
+        width = max(1, int(np.rint(store.thickness[i] * zoom)))
+        color = tuple(store.colors[i].tolist())
+        if store.types[i] == TYPE_CODES['freehand']:
+            pygame.draw.lines(surface, color, False, points, width)
+        else:
+            pygame.draw.polygon(surface, color, points, width)
+
+
+@pytest.mark.parametrize('clip', [None, (37, 21, 250, 170)])
+def test_runs_match_pygame(clip):
+    rng = np.random.default_rng(11)
+    store = ShapeStore()
+    colors = rng.integers(0, 256, (15, 3)).tolist()
+    widths = rng.integers(1, 6, 15).tolist()
+    for k in range(600):
+        # серии по 40 фигур одного цвета и толщины, у части - вершины за краем
+        shape_type, count = (('rectangle', 4), ('triangle', 3), ('freehand', 6))[k % 3]
+        points = rng.uniform(-20, 330, 2) + rng.uniform(-30, 30, (count, 2))
+        store.add(shape_type, points.round(2).tolist(), tuple(colors[k // 40]), widths[k // 40])
+    indices = np.arange(len(store))
+    expected = pygame.Surface((320, 240))
+    actual = pygame.Surface((320, 240))
+    for surface in (expected, actual):
+        surface.fill((255, 255, 255))
+        surface.set_clip(clip)
+    for zoom, offset in ((1.0, (0, 0)), (0.73, (12.5, -3.25))):
+        reference(expected, store, indices, zoom, offset)
+        DrawList(store).draw(actual, indices, zoom, offset)
+        assert pygame.image.tostring(actual, 'RGB') == pygame.image.tostring(expected, 'RGB')
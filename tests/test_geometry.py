@@ -0,0 +1,273 @@
+"""сверка векторных ядер geometry со скалярными реализациями DrawingApp,
+которые они заменили (скопированы сюда как эталон)"""
+import math
+
+import numpy as np
+import pygame
+import pytest
+
+from geometry import (as_points, hit_test, points_in_boxes, points_in_triangles, polygon_bounds,
+                      rectangle_outlines, transform_boxes, transform_points, triangle_outlines)
+from shapestore import ShapeStore, TYPE_CODES
+
+
+# --- эталон: прежние скалярные методы ---
+
+def scalar_multiply_matrix_vector(matrix, point):
+    x, y = point
+    new_x = matrix[0][0]*x + matrix[0][1]*y + matrix[0][2]
+    new_y = matrix[1][0]*x + matrix[1][1]*y + matrix[1][2]
+    return (new_x, new_y)
+
+
+def scalar_point_in_rect(point, rect_start, rect_end):
+    x, y = point
+    x1, y1 = rect_start
+    x2, y2 = rect_end
+    min_x = min(x1, x2)
+    max_x = max(x1, x2)
+    min_y = min(y1, y2)
+    max_y = max(y1, y2)
+    tolerance = 5
+    return (min_x - tolerance <= x <= max_x + tolerance and
+            min_y - tolerance <= y <= max_y + tolerance)
+
+
+def scalar_point_in_triangle(point, p1, p2, p3):
+    def sign(p1, p2, p3):
+        return (p1[0] - p3[0]) * (p2[1] - p3[1]) - (p2[0] - p3[0]) * (p1[1] - p3[1])
+
+    d1 = sign(point, p1, p2)
+    d2 = sign(point, p2, p3)
+    d3 = sign(point, p3, p1)
+    has_neg = (d1 < 0) or (d2 < 0) or (d3 < 0)
+    has_pos = (d1 > 0) or (d2 > 0) or (d3 > 0)
+    return not (has_neg and has_pos)
+
+
+def scalar_create_rectangle_points(start, end):
+    x1, y1 = start
+    x2, y2 = end
+    return [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+
+
+def scalar_create_triangle_points(start, end):
+    x1, y1 = start
+    x2, y2 = end
+    base_y = max(y1, y2)
+    top_y = min(y1, y2)
+    mid_x = (x1 + x2) // 2
+    return [(x1, base_y), (x2, base_y), (mid_x, top_y)]
+
+
+def scalar_outline_points(shape):
+    if 'points' in shape:
+        return shape['points']
+    if shape['type'] == 'triangle':
+        return scalar_create_triangle_points(shape['start'], shape['end'])
+    return scalar_create_rectangle_points(shape['start'], shape['end'])
+
+
+def scalar_get_shape_bounds(shape):
+    xs = [p[0] for p in scalar_outline_points(shape)]
+    ys = [p[1] for p in scalar_outline_points(shape)]
+    return (min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+
+
+def scalar_point_in_shape(point, shape):
+    if shape['type'] == 'rectangle':
+        min_x, min_y, width, height = scalar_get_shape_bounds(shape)
+        max_x = min_x + width
+        max_y = min_y + height
+        tolerance = 5
+        return (min_x - tolerance <= point[0] <= max_x + tolerance and
+                min_y - tolerance <= point[1] <= max_y + tolerance)
+    points = scalar_outline_points(shape)
+    return scalar_point_in_triangle(point, points[0], points[1], points[2])
+
+
+# --- данные ---
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(2024)
+
+
+def random_matrix(rng):
+    angle = rng.uniform(-math.pi, math.pi)
+    scale = rng.uniform(0.2, 3.0)
+    c, s = math.cos(angle) * scale, math.sin(angle) * scale
+    return [[c, -s, rng.uniform(-500, 500)], [s, c, rng.uniform(-500, 500)], [0, 0, 1]]
+
+
+def random_shapes(rng, count):
+    """фигуры-словари обеих структур с целыми координатами (стороны попадают в сетку точек)"""
+    shapes = []
+    for _ in range(count):
+        kind = rng.choice(['rectangle', 'triangle'])
+        start = tuple(int(v) for v in rng.integers(-60, 60, 2))
+        end = tuple(int(v) for v in rng.integers(-60, 60, 2))
+        color = tuple(int(v) for v in rng.integers(0, 256, 3))
+        thickness = int(rng.integers(1, 6))
+        if rng.random() < 0.3:
+            shapes.append({'type': kind, 'start': start, 'end': end,
+                           'color': color, 'thickness': thickness})
+        elif kind == 'rectangle':
+            shapes.append({'type': kind, 'points': scalar_create_rectangle_points(start, end),
+                           'color': color, 'thickness': thickness})
+        else:
+            # произвольный треугольник, в том числе вырожденный
+            pts = [tuple(int(v) for v in rng.integers(-60, 60, 2)) for _ in range(3)]
+            if rng.random() < 0.1:
+                pts[2] = pts[1]
+            shapes.append({'type': kind, 'points': pts, 'color': color, 'thickness': thickness})
+    return shapes
+
+
+def grid_points(step=7, extent=70):
+    return [(x, y) for x in range(-extent, extent + 1, step) for y in range(-extent, extent + 1, step)]
+
+
+@pytest.fixture(scope='module')
+def app():
+    from headless import HeadlessApp
+    pygame.init()
+    return HeadlessApp()
+
+
+# --- ядра против эталона ---
+
+def test_transform_points_matches_scalar(rng):
+    for _ in range(20):
+        matrix = random_matrix(rng)
+        points = rng.uniform(-1000, 1000, (50, 2))
+        expected = [scalar_multiply_matrix_vector(matrix, p) for p in points.tolist()]
+        np.testing.assert_allclose(transform_points(points, matrix), expected, rtol=1e-12, atol=1e-9)
+
+
+def test_transform_points_single_point_and_lists():
+    matrix = [[1, 0, 10], [0, 1, -5], [0, 0, 1]]
+    assert transform_points((3, 4), matrix).tolist() == [[13.0, -1.0]]
+    assert transform_points([(0, 0), (1, 1)], matrix).tolist() == [[10.0, -5.0], [11.0, -4.0]]
+    assert transform_points(np.zeros((0, 2)), matrix).shape == (0, 2)
+
+
+def test_transform_boxes_contains_transformed_corners(rng):
+    bounds = np.sort(rng.uniform(-100, 100, (30, 2, 2)), axis=1).reshape(30, 4)[:, [0, 2, 1, 3]]
+    matrix = random_matrix(rng)
+    boxes = transform_boxes(bounds, matrix)
+    for box, (x0, y0, x1, y1) in zip(boxes, bounds.tolist()):
+        corners = [scalar_multiply_matrix_vector(matrix, c) for c in ((x0, y0), (x1, y0), (x1, y1), (x0, y1))]
+        xs, ys = zip(*corners)
+        np.testing.assert_allclose(box, (min(xs), min(ys), max(xs), max(ys)), atol=1e-9)
+
+
+def test_polygon_bounds_matches_scalar(rng):
+    shapes = random_shapes(rng, 200)
+    outlines = [scalar_outline_points(s) for s in shapes]
+    counts = [len(o) for o in outlines]
+    starts = np.cumsum([0] + counts[:-1])
+    vertices = as_points([p for o in outlines for p in o])
+    bounds = polygon_bounds(vertices, starts)
+    for shape, (x0, y0, x1, y1) in zip(shapes, bounds.tolist()):
+        min_x, min_y, width, height = scalar_get_shape_bounds(shape)
+        assert (x0, y0, x1 - x0, y1 - y0) == (min_x, min_y, width, height)
+    assert polygon_bounds(np.zeros((0, 2)), []).shape == (0, 4)
+
+
+def test_points_in_boxes_matches_scalar_point_in_rect(rng):
+    points = grid_points(step=3)
+    for _ in range(40):
+        a = tuple(int(v) for v in rng.integers(-60, 60, 2))
+        b = tuple(int(v) for v in rng.integers(-60, 60, 2))
+        box = (min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1]))
+        got = points_in_boxes(points, box, 5)
+        assert got.tolist() == [scalar_point_in_rect(p, a, b) for p in points]
+
+
+def test_points_in_triangles_matches_scalar(rng):
+    points = grid_points(step=3)
+    for _ in range(60):
+        tri = [tuple(int(v) for v in rng.integers(-60, 60, 2)) for _ in range(3)]
+        if rng.random() < 0.2:
+            tri[1] = tri[0]  # вырожденный треугольник
+        got = points_in_triangles(points, *tri)
+        assert got.tolist() == [scalar_point_in_triangle(p, *tri) for p in points]
+
+
+def test_points_in_triangles_broadcasts_points_by_triangles(rng):
+    points = as_points(grid_points(step=10))
+    triangles = rng.integers(-60, 60, (25, 3, 2)).astype(np.float64)
+    matrix = points_in_triangles(points[:, None], triangles[None, :, 0], triangles[None, :, 1],
+                                 triangles[None, :, 2])
+    assert matrix.shape == (len(points), len(triangles))
+    for k, tri in enumerate(triangles.tolist()):
+        assert matrix[:, k].tolist() == [scalar_point_in_triangle(p, *tri) for p in points.tolist()]
+
+
+def test_outlines_match_create_points(rng):
+    starts = rng.integers(-99, 99, (100, 2))
+    ends = rng.integers(-99, 99, (100, 2))
+    triangles = triangle_outlines(starts, ends)
+    rectangles = rectangle_outlines(starts, ends)
+    for s, e, tri, rect in zip(starts.tolist(), ends.tolist(), triangles.tolist(), rectangles.tolist()):
+        assert [tuple(p) for p in tri] == scalar_create_triangle_points(s, e)
+        assert [tuple(p) for p in rect] == scalar_create_rectangle_points(s, e)
+
+
+def test_hit_test_matches_point_in_shape(rng):
+    shapes = random_shapes(rng, 150)
+    store = ShapeStore()
+    store.extend(shapes)
+    idx = np.arange(len(store))
+    points = grid_points(step=6)
+    hits = hit_test(points, store.bounds(idx), store.triangles(idx),
+                    store.types == TYPE_CODES['rectangle'])
+    assert hits.shape == (len(points), len(shapes))
+    for k, shape in enumerate(shapes):
+        assert hits[:, k].tolist() == [scalar_point_in_shape(p, shape) for p in points]
+
+
+# --- методы приложения - обёртки над ядрами ---
+
+def test_app_wrappers_match_scalar(app, rng):
+    for _ in range(10):
+        matrix = random_matrix(rng)
+        point = tuple(rng.uniform(-100, 100, 2).tolist())
+        np.testing.assert_allclose(app.multiply_matrix_vector(matrix, point),
+                                   scalar_multiply_matrix_vector(matrix, point), atol=1e-9)
+    for shape in random_shapes(rng, 60):
+        min_x, min_y, width, height = app.get_shape_bounds(shape)
+        assert (min_x, min_y, width, height) == scalar_get_shape_bounds(shape)
+        for point in grid_points(step=9):
+            assert app.point_in_shape(point, shape) == scalar_point_in_shape(point, shape)
+    for point in grid_points(step=9):
+        assert app.point_in_rect(point, (-20, 30), (10, -5)) == scalar_point_in_rect(point, (-20, 30), (10, -5))
+        tri = ((-30, 20), (25, 20), (0, -40))
+        assert app.point_in_triangle(point, *tri) == scalar_point_in_triangle(point, *tri)
+
+
+def test_apply_matrix_to_dict_shape_matches_scalar(app, rng):
+    matrix = random_matrix(rng)
+    new = {'type': 'triangle', 'points': [(0, 0), (10, 0), (5, -8)], 'color': (0, 0, 0), 'thickness': 1}
+    old = {'type': 'rectangle', 'start': (1, 2), 'end': (30, 40), 'color': (0, 0, 0), 'thickness': 1}
+    expected_points = [scalar_multiply_matrix_vector(matrix, p) for p in new['points']]
+    expected_start = scalar_multiply_matrix_vector(matrix, old['start'])
+    app.apply_matrix_to_shape(new, matrix)
+    app.apply_matrix_to_shape(old, matrix)
+    np.testing.assert_allclose(new['points'], expected_points, atol=1e-9)
+    np.testing.assert_allclose(old['start'], expected_start, atol=1e-9)
+
+
+def test_find_shape_at_point_matches_scalar_scan(app, rng):
+    shapes = random_shapes(rng, 120)
+    app.shapes.clear()
+    app.spatial_index.clear()
+    app.add_shapes(shapes)
+    for point in grid_points(step=5):
+        expected = -1
+        for i in range(len(shapes) - 1, -1, -1):  # сверху вниз
+            if scalar_point_in_shape(point, shapes[i]):
+                expected = i
+                break
+        assert app.find_shape_at_point(point) == expected
@@ -0,0 +1,77 @@
+"""отмена и повтор команд возвращают сцену к прежним идентификаторам и вершинам"""
+import numpy as np
+import pygame
+import pytest
+
+from history import AddCommand, DeleteCommand, History
+
+from helpers import random_scene, rotation, same, scene, shapes
+
+
+@pytest.fixture
+def app():
+    from headless import HeadlessApp
+
+    pygame.init()
+    app = HeadlessApp()
+    app.shapes.load_arrays(*random_scene(300))
+    app.spatial_index.rebuild(app.shapes.bounds())
+    return app
+
+
+def edit(app, rng):
+    """удаление, добавление и преобразование жестом; снимки после каждого шага"""
+    snapshots = [scene(app.shapes)]
+    app.selected_shape_indices.replace(np.flatnonzero(rng.random(len(app.shapes)) < 0.3))
+    app.delete_selected_shapes()
+    snapshots.append(scene(app.shapes))
+    app.add_shapes(shapes(25, x=100.0))
+    snapshots.append(scene(app.shapes))
+    app.selected_shape_indices.replace(np.flatnonzero(rng.random(len(app.shapes)) < 0.5))
+    app.gesture = app.history.new_gesture()
+    for _ in range(3):
+        app.apply_matrix_to_selection(rotation(0.3, 40.0, -15.0))
+    app.bake_transform()
+    snapshots.append(scene(app.shapes))
+    return snapshots
+
+
+def test_undo_redo_restore_ids_and_vertices(app):
+    snapshots = edit(app, np.random.default_rng(3))
+    assert len(app.history) == 3  # три поворота одного жеста - одна команда
+
+    for expected in reversed(snapshots[:-1]):
+        assert app.undo() is not None
+        assert same(scene(app.shapes), expected, exact=False)
+    assert app.undo() is None
+
+    for expected in snapshots[1:]:
+        assert app.redo() is not None
+        assert same(scene(app.shapes), expected, exact=False)
+    assert app.redo() is None
+
+
+def test_singular_transform_clears_history(app):
+    app.add_shapes(shapes(5))
+    app.selected_shape_indices.replace(range(5))
+    app.apply_matrix_to_selection([[0, 0, 0], [0, 0, 0], [0, 0, 1]])
+    assert not app.history.can_undo()
+    assert app.undo() is None  # отменять нечего, а не LinAlgError
+
+
+def test_eviction_respects_budget(app):
+    commands = [DeleteCommand(range(10 * i, 10 * i + 10), app.shapes.take(range(10 * i, 10 * i + 10)))
+                for i in range(5)]
+    history = History(app.multiply_matrices, budget=sum(c.nbytes for c in commands[-3:]))
+    for command in commands:
+        history.record(command)
+        assert history.nbytes <= history.budget
+        assert history.nbytes == sum(c.nbytes for c in history._undo)
+    assert list(history._undo) == commands[-3:]  # вытеснены самые старые
+
+    # команда больше бюджета не удерживается вовсе
+    history.record(DeleteCommand(range(300), app.shapes.take(range(300))))
+    assert history.nbytes == 0 and not history.can_undo()
+
+    history.record(AddCommand(range(5)))
+    assert history.nbytes == 0  # диапазон индексов ничего не стоит
@@ -0,0 +1,158 @@
+"""журнал правок: сцена после сбоя восстанавливается из контрольной точки и правок после неё"""
+import os
+
+import numpy as np
+import pygame
+import pytest
+
+from journal import SEGMENT_EXTENSION, JournalLockedError, SceneJournal
+
+from helpers import random_scene, rotation, same, scene, shapes
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    from drawapp import DrawingApp
+
+    pygame.init()
+    apps = []
+
+    def make_app(**options):
+        app = DrawingApp(loop_mode='event', autosave_interval=0)
+        assert app.open_journal(str(tmp_path), sync_interval=0, **options)
+        apps.append(app)
+        return app
+    yield make_app
+    for app in apps:
+        if app.journal is not None and app.journal._thread is not None:
+            crash(app)
+
+
+def crash(app):
+    """остановка потока записи без штатного закрытия: всё переданное ему
+    записано, контрольной точки при выходе нет; блокировку папки, как при
+    завершении процесса, снимает закрытие файла"""
+    journal = app.journal
+    journal._queue.put(None)
+    journal._thread.join()
+    journal._thread = None
+    journal._lock.close()
+    journal._lock = None
+    assert journal.error is None
+
+
+def edit(app):
+    """правки всех видов, каждая - отдельный кадр"""
+    app.add_shapes(shapes(30))
+    app.sync_journal()
+    app.add_stroke(np.array([[0.0, 0.0], [40.0, 25.0], [80.0, -3.0]]))
+    app.sync_journal()
+    app.selected_shape_indices.replace([1, 4, 9, 30])
+    app.apply_matrix_to_selection(rotation(0.4, 10, 10))
+    app.apply_matrix_to_selection(app.translation_matrix(5, -7))
+    app.sync_journal()  # интервал 0 - незаконченный жест тоже записывается
+    app.apply_matrix_to_selection(app.scale_matrix(1.5))
+    app.bake_transform()
+    app.sync_journal()
+    app.selected_shape_indices.replace([2, 3, 20])
+    app.delete_selected_shapes()
+    app.sync_journal()
+    app.undo()  # фигуры возвращаются на прежние места с прежними идентификаторами
+    app.sync_journal()
+    app.selected_shape_indices.replace([0, 5])
+    app.delete_selected_shapes()
+    app.sync_journal()
+
+
+def test_recovery_after_crash_replays_journal(make_app):
+    app = make_app()
+    edit(app)
+    expected = scene(app.shapes)
+    crash(app)
+
+    recovered = make_app()
+    assert recovered.journal.replayed == 7
+    assert same(scene(recovered.shapes), expected, exact=True)
+    # новые фигуры получают идентификаторы после восстановленных
+    recovered.add_shapes(shapes(2, x=500))
+    assert recovered.shapes.ids[-1] > expected[0].max()
+
+    # очистка и загрузка сцены - тоже правки журнала
+    recovered.clear_shapes()
+    recovered.sync_journal()
+    recovered.shapes.load_arrays(*random_scene(15))
+    recovered.publish('added', range(15))
+    recovered.sync_journal()
+    expected = scene(recovered.shapes)
+    crash(recovered)
+    assert same(scene(make_app().shapes), expected, exact=True)
+
+
+def test_checkpoints_bound_replay(make_app, tmp_path):
+    app = make_app(checkpoint_bytes=4096)
+    app.add_shapes(shapes(200))
+    app.sync_journal()
+    for step in range(60):
+        app.transform_shapes(range(step, step + 50), rotation(0.01 * step, 3, 4))
+        app.sync_journal()
+    journal = app.journal
+    expected = scene(app.shapes)
+    crash(app)
+    assert journal.checkpoints >= 2
+    # старые поколения удаляются после записи контрольной точки
+    segments = [name for name in os.listdir(tmp_path) if name.endswith(SEGMENT_EXTENSION)]
+    assert len(segments) <= 2
+
+    recovered = make_app()
+    assert recovered.journal.replayed < 60 / journal.checkpoints + 2
+    assert same(scene(recovered.shapes), expected, exact=True)
+
+    # штатный выход сворачивает журнал в контрольную точку
+    recovered.transform_shapes([7], rotation(1.0))
+    expected = scene(recovered.shapes)
+    recovered.journal.close()
+    reader = SceneJournal(str(tmp_path))
+    replica = reader.recover()
+    assert reader.replayed == 1
+    assert same(scene(replica.shapes), expected, exact=True)
+    reader.close()
+
+
+def test_torn_tail_is_ignored(make_app, tmp_path):
+    app = make_app()
+    app.add_shapes(shapes(10))
+    app.sync_journal()
+    expected = scene(app.shapes)
+    app.transform_shapes([1, 2], rotation(0.5))
+    app.sync_journal()
+    crash(app)
+    # последняя запись дописана не до конца
+    (segment,) = [name for name in os.listdir(tmp_path) if name.endswith(SEGMENT_EXTENSION)]
+    path = os.path.join(tmp_path, segment)
+    os.truncate(path, os.path.getsize(path) - 5)
+
+    recovered = make_app()
+    assert recovered.journal.replayed == 1
+    assert same(scene(recovered.shapes), expected, exact=True)
+
+
+def test_second_window_does_not_share_journal(make_app, tmp_path):
+    from drawapp import DrawingApp
+
+    app = make_app()
+    app.add_shapes(shapes(5))
+    app.sync_journal()
+    with pytest.raises(JournalLockedError):
+        SceneJournal(str(tmp_path)).recover()
+    # второе окно работает без журнала и ничего не пишет в папку первого
+    other = DrawingApp(loop_mode='event', autosave_interval=0)
+    assert not other.open_journal(str(tmp_path), sync_interval=0)
+    assert other.journal is None and len(other.shapes) == 0
+    other.add_shapes(shapes(3, x=100))
+    expected = scene(app.shapes)
+    app.journal.close()
+
+    # после закрытия папка снова свободна
+    reader = SceneJournal(str(tmp_path))
+    assert same(scene(reader.recover().shapes), expected, exact=True)
+    reader.close()
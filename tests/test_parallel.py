@@ -0,0 +1,78 @@
+"""кусочное выполнение в потоках даёт те же результаты, что и в одном потоке"""
+import numpy as np
+import pytest
+
+from parallel import ParallelEngine
+from shapestore import ShapeStore
+from spatial import SpatialGrid
+
+from helpers import random_scene
+
+
+@pytest.fixture
+def engine():
+    engine = ParallelEngine(workers=4, threshold=10, min_chunk=7)
+    yield engine
+    engine.shutdown()
+
+
+def test_chunks_cover_range_in_order(engine):
+    assert engine.chunks(5) == [(0, 5)]  # ниже порога - один кусок
+    chunks = engine.chunks(1000)
+    assert len(chunks) == 4
+    assert chunks[0][0] == 0 and chunks[-1][1] == 1000
+    assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+    assert engine.concatenate(lambda a, b: np.arange(a, b), 1000).tolist() == list(range(1000))
+    assert ParallelEngine(workers=1, threshold=0).chunks(1000) == [(0, 1000)]
+
+
+def test_apply_matrix_and_refresh_match_single_thread(engine):
+    serial, chunked = ShapeStore(), ShapeStore()
+    chunked.engine = engine
+    for store in (serial, chunked):
+        store.load_arrays(*random_scene(500))
+    idx = np.flatnonzero(np.random.default_rng(1).random(500) < 0.6)
+    matrix = [[0.8, -0.6, 13.5], [0.6, 0.8, -7.25], [0, 0, 1]]
+    version = chunked.version
+    serial.apply_matrix(idx, matrix)
+    chunked.apply_matrix(idx, matrix)
+    np.testing.assert_array_equal(chunked.vertices, serial.vertices)
+    np.testing.assert_array_equal(chunked.bounds(), serial.bounds())
+    np.testing.assert_array_equal(chunked.sums, serial.sums)
+    np.testing.assert_array_equal(chunked.changed_since(version), idx)
+
+    chunked.vertices[:] += 1
+    serial.vertices[:] += 1
+    chunked.refresh()
+    serial.refresh()
+    np.testing.assert_array_equal(chunked.bounds(), serial.bounds())
+    np.testing.assert_array_equal(chunked.sums, serial.sums)
+
+
+def test_intersecting_scan_matches_single_thread(engine):
+    store = ShapeStore()
+    store.load_arrays(*random_scene(800))
+    serial, chunked = SpatialGrid(), SpatialGrid()
+    chunked.engine = engine
+    for grid in (serial, chunked):
+        grid.rebuild(store.bounds())
+    for rect in ((-2500, -2500, 2500, 2500), (-100, -300, 900, 50), (0, 0, 0, 0)):
+        np.testing.assert_array_equal(chunked.intersecting(*rect), serial.intersecting(*rect))
+
+
+def test_app_queries_match_single_thread(engine):
+    import pygame
+    from headless import HeadlessApp
+
+    pygame.init()
+    serial, chunked = HeadlessApp(), HeadlessApp()
+    chunked.shapes.engine = engine
+    chunked.spatial_index.engine = engine
+    for app in (serial, chunked):
+        app.shapes.load_arrays(*random_scene(600))
+        app.spatial_index.rebuild(app.shapes.bounds())
+    for rect in ((-2000, -2000, 4000, 4000), (-300, -200, 700, 400), (10, 10, 1, 1)):
+        np.testing.assert_array_equal(chunked.find_shapes_in_rect(rect), serial.find_shapes_in_rect(rect))
+    rng = np.random.default_rng(3)
+    for point in rng.uniform(-2000, 2000, (50, 2)).tolist():
+        assert chunked.find_shape_at_point(point) == serial.find_shape_at_point(point)
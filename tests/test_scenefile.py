@@ -0,0 +1,62 @@
+"""бинарный файл сцены: запись и чтение через mmap возвращают те же колонки"""
+import numpy as np
+import pytest
+
+from scenefile import HEADER, SceneFormatError, read_scene, write_scene
+from shapestore import ShapeStore
+
+from helpers import random_scene
+
+
+@pytest.fixture
+def store():
+    store = ShapeStore()
+    store.load_arrays(*random_scene(500))
+    store.legacy[::7] = True
+    return store
+
+
+def test_write_read_round_trip(store, tmp_path):
+    path = str(tmp_path / 'scene.drws')
+    write_scene(path, store)
+    arrays = read_scene(path)
+    for name in ('vertices', 'offsets', 'types', 'colors', 'thickness', 'legacy', 'sums'):
+        np.testing.assert_array_equal(getattr(arrays, name), getattr(store, name))
+    np.testing.assert_array_equal(arrays.bounds, store.bounds())
+
+    loaded = ShapeStore()
+    loaded.load_arrays(*arrays)
+    assert len(loaded) == len(store) and loaded.vertex_count == store.vertex_count
+    np.testing.assert_array_equal(loaded.ids, store.ids)
+    for i in (0, 7, 499):
+        np.testing.assert_array_equal(loaded.points(i), store.points(i))
+
+    # массивы отображены с копированием при записи: файл на диске не меняется
+    arrays.vertices[:] = 0
+    np.testing.assert_array_equal(read_scene(path).vertices, store.vertices)
+
+
+def test_empty_scene_round_trip(tmp_path):
+    path = str(tmp_path / 'empty.drws')
+    write_scene(path, ShapeStore())
+    arrays = read_scene(path)
+    assert arrays.vertices.shape == (0, 2) and arrays.offsets.tolist() == [0]
+
+
+@pytest.mark.parametrize('damage', ['magic', 'version', 'truncated', 'short'])
+def test_damaged_file_raises(store, tmp_path, damage):
+    path = str(tmp_path / 'scene.drws')
+    write_scene(path, store)
+    data = bytearray(open(path, 'rb').read())
+    if damage == 'magic':
+        data[:8] = b'NOTSCENE'
+    elif damage == 'version':
+        data[8:10] = (99).to_bytes(2, 'little')
+    elif damage == 'truncated':
+        del data[len(data) // 2:]
+    else:
+        del data[HEADER.size - 1:]
+    with open(path, 'wb') as f:
+        f.write(data)
+    with pytest.raises(SceneFormatError):
+        read_scene(path)
@@ -0,0 +1,61 @@
+"""выделение после удаления фигур указывает на те же фигуры, сумма вершин точна"""
+import numpy as np
+import pytest
+
+from shapestore import Selection, ShapeStore
+
+from helpers import random_scene
+
+
+@pytest.fixture
+def store():
+    store = ShapeStore()
+    store.load_arrays(*random_scene(400))
+    return store
+
+
+def expected_sum(store, indices):
+    return store.sums[indices].sum(axis=0), int(store.vertex_counts[indices].sum())
+
+
+def test_selection_follows_shapes_after_delete(store):
+    rng = np.random.default_rng(5)
+    selection = Selection(store)
+    selection.update(np.flatnonzero(rng.random(len(store)) < 0.4))
+    for _ in range(4):
+        selected = store.ids[selection.indices()].copy()
+        doomed = np.flatnonzero(rng.random(len(store)) < 0.25)
+        keep = store.delete(doomed)
+        selection.compact(keep)
+
+        survivors = store.index_of(selected)
+        survivors = np.sort(survivors[survivors >= 0])
+        np.testing.assert_array_equal(selection.indices(), survivors)
+        assert len(selection) == len(survivors)
+        total, count = selection.vertex_sum()
+        want_total, want_count = expected_sum(store, survivors)
+        assert count == want_count
+        np.testing.assert_allclose(total, want_total, rtol=0, atol=1e-6)
+
+
+def test_app_delete_keeps_remaining_selection():
+    import pygame
+
+    from headless import HeadlessApp
+
+    pygame.init()
+    app = HeadlessApp()
+    app.shapes.load_arrays(*random_scene(200))
+    app.spatial_index.rebuild(app.shapes.bounds())
+    app.selected_shape_indices.replace(range(50, 150))
+    marked = app.shapes.ids[100:150].copy()
+
+    # удаление части фигур (как при правке другого участника сессии)
+    app.remove_ids(app.shapes.ids[40:100].copy())
+    np.testing.assert_array_equal(app.shapes.ids[app.selected_shape_indices.indices()], marked)
+
+    app.delete_selected_shapes()
+    assert not app.selected_shape_indices and len(app.shapes) == 90
+    assert not np.isin(marked, app.shapes.ids).any()
+    app.undo()
+    np.testing.assert_array_equal(app.shapes.ids[app.selected_shape_indices.indices()], marked)
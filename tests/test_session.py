@@ -0,0 +1,190 @@
+"""общая сессия на локальном сервере: правки всех участников сходятся"""
+import asyncio
+import socket
+import threading
+import time
+
+import numpy as np
+import pygame
+import pytest
+
+from session import (ADD, CLEAR, DELETE, FRAME, OPS, SNAPSHOT, SNAPSHOT_HEADER, TRANSFORM,
+                     SceneReplica, SessionServer, apply_op, decode_ops, encode_ops)
+from shapestore import ShapeStore
+
+from helpers import random_scene, rotation, same, scene, shapes
+
+
+@pytest.fixture
+def server(request):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    store = ShapeStore()
+    store.load_arrays(*random_scene(40))
+    server = SessionServer(store, backlog=getattr(request, 'param', 1 << 20))
+    server.loop = loop
+    server.address = asyncio.run_coroutine_threadsafe(server.start('127.0.0.1', 0), loop).result(5)
+    yield server
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+
+def on_server(server, func):
+    """func() в потоке сервера - сцена не меняется во время чтения"""
+    async def call():
+        return func()
+    return asyncio.run_coroutine_threadsafe(call(), server.loop).result(5)
+
+
+@pytest.fixture
+def join(server):
+    from headless import HeadlessApp
+
+    pygame.init()
+    apps = []
+
+    def join():
+        app = HeadlessApp()
+        assert app.join_session(*server.address)
+        apps.append(app)
+        return app
+    yield join
+    for app in apps:
+        app.session.close()
+
+
+def settle(server, apps, exact=True, timeout=10):
+    """синхронизация участников, пока их сцены и сцена сервера не совпадут"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for app in apps:
+            app.sync_session()
+        if all(app.session.idle() for app in apps):
+            expected = on_server(server, lambda: scene(server.scene.shapes))
+            if all(same(scene(app.shapes), expected, exact) for app in apps):
+                return expected
+        time.sleep(0.002)
+    raise AssertionError("сцены участников не сошлись")
+
+
+def test_ops_round_trip():
+    store = ShapeStore()
+    store.load_arrays(*random_scene(30))
+    batch = store.take(np.arange(5, 25))
+    sparse = np.array([3, 4, 70000, 70001, 2 ** 40])  # разности в 2 байта не влезают
+    matrix = rotation(0.3, 10, -4)
+    ops = [(ADD, batch), (DELETE, np.arange(0, 3000, 7)), (DELETE, sparse),
+           (DELETE, np.array([9, 2, 5])), (TRANSFORM, np.array([11]), matrix), (CLEAR,)]
+    data = encode_ops(ops)
+    decoded = decode_ops(data)
+    assert [op[0] for op in decoded] == [op[0] for op in ops]
+    for name, column in batch.items():
+        np.testing.assert_array_equal(decoded[0][1][name], column)
+    for got, sent in zip(decoded[1:4], ops[1:4]):
+        np.testing.assert_array_equal(got[1], sent[1])
+    np.testing.assert_array_equal(decoded[4][2], matrix)
+    # преобразование любого числа фигур - идентификаторы и 48 байт матрицы
+    assert len(encode_ops([(TRANSFORM, np.arange(100000), matrix)])) < 100000 * 2 + 100
+
+
+def test_participants_converge(server, join):
+    a, b, c = join(), join(), join()
+    assert len({a.session.number, b.session.number, c.session.number}) == 3
+    initial = settle(server, [a, b, c])
+    assert len(initial[0]) == 40
+
+    # одновременные добавления: идентификаторы разных участников не совпадают
+    a.add_shapes(shapes(3))
+    b.add_shapes(shapes(2, x=100))
+    c.add_shapes(shapes(4, x=200))
+    ids = settle(server, [a, b, c])[0]
+    assert len(ids) == 49 and len(np.unique(ids)) == 49
+
+    # перетаскивание выделения (отложенная матрица уходит при синхронизации) и удаление
+    a.selected_shape_indices.replace([0, 5, 41])
+    moved = set(a.shapes.ids[[0, 5, 41]].tolist())
+    a.apply_matrix_to_selection(rotation(0.2, 3, 3))
+    a.sync_session()
+    a.apply_matrix_to_selection(a.translation_matrix(7, -2))
+    b.selected_shape_indices.replace([1, 2, 45])
+    b.delete_selected_shapes()
+    settle(server, [a, b, c])
+    assert set(a.shapes.ids[a.selected_shape_indices.indices()].tolist()) == moved
+
+    # отмена удаления возвращает фигуры с прежними идентификаторами в середину сцены
+    deleted = b.history._undo[-1].batch['ids']
+    b.undo()
+    ids = settle(server, [a, b, c])[0]
+    assert np.isin(deleted, ids).all()
+    assert set(a.shapes.ids[a.selected_shape_indices.indices()].tolist()) == moved
+
+    # очистка, которую сервер применил раньше, не удаляет фигуры, добавленные
+    # одновременно с ней: они для сервера идут после очистки
+    b.add_shapes(shapes(2, x=300))
+    added = b.shapes.ids[-2:].copy()
+    c.clear_shapes()
+    while not c.session.idle():
+        c.sync_session()
+    ids = settle(server, [a, b, c])[0]
+    np.testing.assert_array_equal(ids, added)
+
+
+def test_concurrent_transforms_of_same_shapes(server, join):
+    a, b = join(), join()
+    settle(server, [a, b])
+    for app in (a, b):
+        app.selected_shape_indices.replace(range(0, 40, 2))
+    # оба участника вращают одни и те же фигуры, не видя правок друг друга
+    for step in range(5):
+        a.apply_matrix_to_selection(rotation(0.1 * step, 50, 50))
+        b.apply_matrix_to_selection(rotation(-0.07, -20, 10))
+        b.transform_shapes([1, 2, 3], a.scale_matrix(1.5))
+        for app in (a, b):
+            app.bake_transform()
+            app.session._flush()
+    settle(server, [a, b], exact=False)
+
+
+@pytest.mark.parametrize('server', [4096], indirect=True)
+def test_slow_reader_gets_snapshot_instead_of_backlog(server, join):
+    slow = socket.create_connection(server.address)
+    slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 16)
+    fast = join()
+    settle(server, [fast])
+    # правок больше, чем вмещают буферы сокетов: остаток копился бы в очереди сервера
+    for i in range(40):
+        fast.add_shapes(shapes(2000, x=i * 3000))
+        settle(server, [fast])
+    peer = on_server(server, lambda: next(p for p in server.peers.values() if p.writer is not None
+                                          and p.number != fast.session.number))
+    assert peer.resyncs >= 1 and peer.queued <= 4096
+
+    # медленный участник дочитывает поток: последний снимок и правки после него дают сцену сервера
+    replica = SceneReplica()
+    slow.settimeout(0.5)
+    stream = bytearray()
+    try:
+        while True:
+            chunk = slow.recv(1 << 20)
+            if not chunk:
+                break
+            stream += chunk
+    except socket.timeout:
+        pass
+    slow.close()
+    offset = 0
+    while offset < len(stream):
+        length, kind = FRAME.unpack_from(stream, offset)
+        payload = bytes(stream[offset + FRAME.size:offset + FRAME.size + length])
+        offset += FRAME.size + length
+        if kind == SNAPSHOT:
+            replica = SceneReplica()
+            replica.merge_shapes(decode_ops(payload, SNAPSHOT_HEADER.size)[0][1])
+        elif kind == OPS:
+            for op in decode_ops(payload):
+                apply_op(replica, op)
+    assert offset == len(stream)
+    expected = on_server(server, lambda: scene(server.scene.shapes))
+    assert same(scene(replica.shapes), expected, exact=True)
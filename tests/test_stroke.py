@@ -0,0 +1,99 @@
+"""ломаная от руки: упрощение во время рисования, попадание и отрисовка"""
+import numpy as np
+import pygame
+
+from geometry import points_near_polylines, segment_distances_sq, simplify_rdp
+from shapestore import TYPE_CODES
+from stroke import Stroke
+
+
+def wobbly_circle(count, radius=200.0, noise=0.3, seed=5):
+    rng = np.random.default_rng(seed)
+    angle = np.linspace(0, 2 * np.pi, count)
+    pts = np.stack((np.cos(angle), np.sin(angle)), axis=1) * radius + 300
+    return pts + rng.normal(0, noise, pts.shape)
+
+
+def deviation(points, polyline):
+    """наибольшее расстояние от точек до ломаной"""
+    d = segment_distances_sq(points[:, None], polyline[None, :-1], polyline[None, 1:])
+    return float(np.sqrt(d.min(axis=1).max()))
+
+
+def test_rdp_keeps_points_within_tolerance():
+    pts = wobbly_circle(2000)
+    keep = simplify_rdp(pts, 1.0)
+    assert keep[0] == 0 and keep[-1] == len(pts) - 1
+    assert np.all(np.diff(keep) > 0)
+    assert len(keep) < len(pts) // 10
+    assert deviation(pts, pts[keep]) <= 1.0
+    # прямая сводится к концам, замкнутый контур не схлопывается в точку
+    line = np.stack((np.arange(50.0), 2 * np.arange(50.0)), axis=1)
+    assert simplify_rdp(line, 0.1).tolist() == [0, 49]
+    square = np.array([[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]], dtype=float)
+    assert simplify_rdp(square, 0.5).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_stroke_simplifies_while_drawing():
+    pts = wobbly_circle(5000)
+    stroke = Stroke(pts[0], 1.0, chunk=32)
+    longest = 0
+    for point in pts[1:]:
+        stroke.add(point)
+        longest = max(longest, len(stroke._tail))
+    result = stroke.finish()
+    assert longest <= 32
+    assert stroke.samples == 5000
+    np.testing.assert_array_equal(result[[0, -1]], pts[[0, -1]])
+    assert len(result) < 200
+    # отброшенные радиальным фильтром точки - в пределах допуска от принятых
+    assert deviation(pts, result) <= 2.0
+
+    jitter = Stroke((5, 5), 1.0)
+    jitter.extend([(5.5, 5), (5, 5.5), (5.2, 4.9)])
+    assert jitter.finish() is None
+
+
+def test_polyline_hits_skip_gaps_between_shapes():
+    vertices = np.array([[0, 0], [10, 0], [10, 10], [100, 100], [110, 100]], dtype=float)
+    starts = [0, 3]
+    assert points_near_polylines((10, 5), vertices, starts).tolist() == [True, False]
+    assert points_near_polylines((105, 102), vertices, starts).tolist() == [False, True]
+    # точка на отрезке между концом первой и началом второй ломаной
+    assert points_near_polylines((55, 55), vertices, starts).tolist() == [False, False]
+    assert points_near_polylines((5, 5), vertices, starts, tolerance=2).tolist() == [False, False]
+
+
+def test_freehand_tool_records_coalesced_motion():
+    from drawapp import DrawingApp
+
+    pygame.init()
+    app = DrawingApp(loop_mode='event', autosave_interval=0)
+    app.handle_events([pygame.event.Event(pygame.KEYDOWN, key=pygame.K_f, mod=0)])
+    assert app.current_tool == 'freehand'
+    # U-образный росчерк; все движения приходят за один кадр и склеиваются
+    path = [(100 + i, 100 + i * i // 40) for i in range(0, 200)] + \
+           [(300 + i, 1095 - i * 5) for i in range(1, 200)]
+    path = [(x, y) for x, y in path if y < 580]
+    events = [pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=path[0])]
+    events += [pygame.event.Event(pygame.MOUSEMOTION, pos=p, rel=(0, 0), buttons=(1, 0, 0))
+               for p in path[1:]]
+    events.append(pygame.event.Event(pygame.MOUSEBUTTONUP, button=1, pos=path[-1]))
+    app.handle_events(events)
+
+    assert len(app.shapes) == 1 and app.shapes.types[0] == TYPE_CODES['freehand']
+    assert 2 < app.shapes.vertex_count < len(path) // 4
+    assert deviation(np.array(path, dtype=float), app.shapes.points(0)) <= 2.0
+    assert list(app.selected_shape_indices) == [0]
+    # попадание - у линии, а не внутри её границ
+    assert app.find_shape_at_point(path[len(path) // 2]) == 0
+    assert app.find_shape_at_point((300, 300)) == -1
+
+    app.undo()
+    assert len(app.shapes) == 0
+    app.redo()
+    app.selected_shape_indices.clear()
+    app.screen.fill((255, 255, 255))
+    app.draw_shapes()
+    assert app.screen.get_at(path[len(path) // 2])[:3] == (0, 0, 0)
+    assert app.screen.get_at((300, 300))[:3] == (255, 255, 255)
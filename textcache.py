@@ -0,0 +1,35 @@
+from collections import OrderedDict
+
+MAX_CACHED_TEXTS = 256
+
+
+class TextCache:
+    """кэш отрисованных строк (шрифт, текст, цвет) с вытеснением
+    давно не использованных"""
+
+    def __init__(self, max_size=MAX_CACHED_TEXTS):
+        self.max_size = max_size
+        self._surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._surfaces)
+
+    def render(self, font, text, color, antialias=True):
+        """поверхность с текстом; растеризация только при первом запросе"""
+        key = (font, text, tuple(color), antialias)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.max_size:
+            self._surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self._surfaces.clear()